@@ -0,0 +1,63 @@
+"""integer_tournament_stages
+
+Revision ID: a7d5e6f8b9c0
+Revises: f6c4d5e7a8b9
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d5e6f8b9c0'
+down_revision: Union[str, None] = 'f6c4d5e7a8b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Строковые стадии -> номер стадии (раундов до конца турнира), см. src/tournaments/stages.py
+# Старый код создавал только эти стадии (от 1/64 до финала)
+STAGE_TO_NUMBER = """
+    CASE {column}
+        WHEN 'completed' THEN 0
+        WHEN 'final' THEN 1
+        WHEN 'semifinal' THEN 2
+        WHEN 'quarterfinal' THEN 3
+        WHEN '1/8' THEN 4
+        WHEN '1/16' THEN 5
+        WHEN '1/32' THEN 6
+        WHEN '1/64' THEN 7
+    END
+"""
+
+NUMBER_TO_STAGE = """
+    CASE {column}
+        WHEN 0 THEN 'completed'
+        WHEN 1 THEN 'final'
+        WHEN 2 THEN 'semifinal'
+        WHEN 3 THEN 'quarterfinal'
+        ELSE '1/' || (2 ^ ({column} - 1))::bigint
+    END
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('tournaments', 'current_stage', type_=sa.Integer(),
+                    postgresql_using=STAGE_TO_NUMBER.format(column='current_stage'))
+    op.alter_column('tournament_pairs', 'stage', type_=sa.Integer(),
+                    postgresql_using=STAGE_TO_NUMBER.format(column='stage'))
+    op.create_index('ix_tournament_pairs_tournament_stage', 'tournament_pairs',
+                    ['tournament_id', 'stage', 'pair_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tournament_pairs_tournament_stage', table_name='tournament_pairs')
+    op.alter_column('tournament_pairs', 'stage', type_=sa.String(),
+                    postgresql_using=NUMBER_TO_STAGE.format(column='stage'))
+    op.alter_column('tournaments', 'current_stage', type_=sa.String(),
+                    postgresql_using=NUMBER_TO_STAGE.format(column='current_stage'))
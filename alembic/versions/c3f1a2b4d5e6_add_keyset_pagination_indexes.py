@@ -0,0 +1,49 @@
+"""add_keyset_pagination_indexes
+
+Revision ID: c3f1a2b4d5e6
+Revises: b1234567890a
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f1a2b4d5e6'
+down_revision: Union[str, None] = 'b1234567890a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Составные индексы (sort_key, id) для сортировки и курсорной пагинации
+    op.create_index('ix_sets_name_set_id', 'sets', ['name', 'set_id'])
+    op.create_index('ix_sets_price_set_id', 'sets', ['price', 'set_id'])
+    op.create_index('ix_sets_piece_count_set_id', 'sets', ['piece_count', 'set_id'])
+    op.create_index('ix_sets_release_year_set_id', 'sets', ['release_year', 'set_id'])
+    op.create_index('ix_minifigures_name_minifigure_id', 'minifigures', ['name', 'minifigure_id'])
+    op.create_index(
+        'ix_minifigures_price_minifigure_id',
+        'minifigures',
+        [sa.text('coalesce(price, 0)'), 'minifigure_id']
+    )
+
+    # Индексы для фильтрации по тегам (поиск объектов по tag_id)
+    op.create_index('ix_set_tags_tag_id_set_id', 'set_tags', ['tag_id', 'set_id'])
+    op.create_index('ix_minifigure_tags_tag_id_minifigure_id', 'minifigure_tags', ['tag_id', 'minifigure_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_minifigure_tags_tag_id_minifigure_id', table_name='minifigure_tags')
+    op.drop_index('ix_set_tags_tag_id_set_id', table_name='set_tags')
+    op.drop_index('ix_minifigures_price_minifigure_id', table_name='minifigures')
+    op.drop_index('ix_minifigures_name_minifigure_id', table_name='minifigures')
+    op.drop_index('ix_sets_release_year_set_id', table_name='sets')
+    op.drop_index('ix_sets_piece_count_set_id', table_name='sets')
+    op.drop_index('ix_sets_price_set_id', table_name='sets')
+    op.drop_index('ix_sets_name_set_id', table_name='sets')
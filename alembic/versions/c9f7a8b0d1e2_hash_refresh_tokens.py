@@ -0,0 +1,45 @@
+"""hash_refresh_tokens
+
+Revision ID: c9f7a8b0d1e2
+Revises: b8e6f7a9c0d1
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9f7a8b0d1e2'
+down_revision: Union[str, None] = 'b8e6f7a9c0d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Истёкшие и аннулированные токены больше не нужны
+    op.execute("DELETE FROM refresh_tokens WHERE revoked OR expires_at < now()")
+
+    op.add_column('refresh_tokens', sa.Column('token_hash', sa.String(64), nullable=True))
+    # Тот же SHA-256 (hex), что и hash_refresh_token: действующие сессии сохраняются
+    op.execute("UPDATE refresh_tokens SET token_hash = encode(sha256(convert_to(token, 'UTF8')), 'hex')")
+    op.alter_column('refresh_tokens', 'token_hash', nullable=False)
+    op.create_index('ix_refresh_tokens_token_hash', 'refresh_tokens', ['token_hash'], unique=True)
+
+    op.drop_index('ix_refresh_tokens_token', table_name='refresh_tokens')
+    op.drop_column('refresh_tokens', 'token')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Исходные токены из хешей не восстановить: все сессии станут недействительными
+    op.add_column('refresh_tokens', sa.Column('token', sa.String(), nullable=True))
+    op.execute("UPDATE refresh_tokens SET token = token_hash, revoked = true")
+    op.alter_column('refresh_tokens', 'token', nullable=False)
+    op.create_index('ix_refresh_tokens_token', 'refresh_tokens', ['token'], unique=True)
+
+    op.drop_index('ix_refresh_tokens_token_hash', table_name='refresh_tokens')
+    op.drop_column('refresh_tokens', 'token_hash')
@@ -0,0 +1,32 @@
+"""add_photo_variants
+
+Revision ID: d0a8b9c1e2f3
+Revises: c9f7a8b0d1e2
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd0a8b9c1e2f3'
+down_revision: Union[str, None] = 'c9f7a8b0d1e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('photos', sa.Column('thumbnail_url', sa.String(), nullable=True))
+    op.add_column('photos', sa.Column('medium_url', sa.String(), nullable=True))
+    op.add_column('photos', sa.Column('webp_url', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('photos', 'webp_url')
+    op.drop_column('photos', 'medium_url')
+    op.drop_column('photos', 'thumbnail_url')
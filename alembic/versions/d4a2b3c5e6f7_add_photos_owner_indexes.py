@@ -0,0 +1,31 @@
+"""add_photos_owner_indexes
+
+Revision ID: d4a2b3c5e6f7
+Revises: c3f1a2b4d5e6
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a2b3c5e6f7'
+down_revision: Union[str, None] = 'c3f1a2b4d5e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Пакетная загрузка фотографий страницы идёт по IN (set_id) / IN (minifigure_id)
+    op.create_index(op.f('ix_photos_set_id'), 'photos', ['set_id'])
+    op.create_index(op.f('ix_photos_minifigure_id'), 'photos', ['minifigure_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_photos_minifigure_id'), table_name='photos')
+    op.drop_index(op.f('ix_photos_set_id'), table_name='photos')
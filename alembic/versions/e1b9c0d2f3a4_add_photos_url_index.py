@@ -0,0 +1,29 @@
+"""add_photos_url_index
+
+Revision ID: e1b9c0d2f3a4
+Revises: d0a8b9c1e2f3
+Create Date: 2026-10-18 00:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1b9c0d2f3a4'
+down_revision: Union[str, None] = 'd0a8b9c1e2f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Файл в хранилище по содержимому удаляется, когда на его путь не осталось ссылок
+    op.create_index(op.f('ix_photos_photo_url'), 'photos', ['photo_url'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_photos_photo_url'), table_name='photos')
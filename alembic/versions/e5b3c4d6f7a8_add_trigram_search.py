@@ -0,0 +1,57 @@
+"""add_trigram_search
+
+Revision ID: e5b3c4d6f7a8
+Revises: d4a2b3c5e6f7
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b3c4d6f7a8'
+down_revision: Union[str, None] = 'd4a2b3c5e6f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Вычисляемые колонки с текстом для поиска
+    op.add_column('sets', sa.Column(
+        'search_text', sa.String(),
+        sa.Computed("name || ' ' || theme || ' ' || coalesce(sub_theme, '')", persisted=True)
+    ))
+    op.add_column('minifigures', sa.Column(
+        'search_text', sa.String(),
+        sa.Computed("name || ' ' || character_name", persisted=True)
+    ))
+
+    # GIN-индексы gin_trgm_ops обслуживают ILIKE '%x%' и нечёткое сравнение слов (<%)
+    op.create_index(
+        'ix_sets_search_text_trgm', 'sets', ['search_text'],
+        postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_minifigures_search_text_trgm', 'minifigures', ['search_text'],
+        postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_tags_name_trgm', 'tags', ['name'],
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tags_name_trgm', table_name='tags')
+    op.drop_index('ix_minifigures_search_text_trgm', table_name='minifigures')
+    op.drop_index('ix_sets_search_text_trgm', table_name='sets')
+    op.drop_column('minifigures', 'search_text')
+    op.drop_column('sets', 'search_text')
+    # Расширение pg_trgm не удаляем: им могут пользоваться другие объекты базы
@@ -0,0 +1,46 @@
+"""add_pair_vote_counters
+
+Revision ID: f6c4d5e7a8b9
+Revises: e5b3c4d6f7a8
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6c4d5e7a8b9'
+down_revision: Union[str, None] = 'e5b3c4d6f7a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tournament_pairs', sa.Column('votes_participant1', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('tournament_pairs', sa.Column('votes_participant2', sa.Integer(), server_default='0', nullable=False))
+
+    # Заполняем счётчики по уже поданным голосам
+    op.execute("""
+        UPDATE tournament_pairs AS p
+        SET votes_participant1 = v.votes1,
+            votes_participant2 = v.votes2
+        FROM (
+            SELECT tp.pair_id,
+                   count(*) FILTER (WHERE tv.voted_for = tp.participant1_id) AS votes1,
+                   count(*) FILTER (WHERE tv.voted_for = tp.participant2_id) AS votes2
+            FROM tournament_pairs tp
+            JOIN tournament_votes tv ON tv.pair_id = tp.pair_id
+            GROUP BY tp.pair_id
+        ) AS v
+        WHERE p.pair_id = v.pair_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tournament_pairs', 'votes_participant2')
+    op.drop_column('tournament_pairs', 'votes_participant1')
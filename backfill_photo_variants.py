@@ -0,0 +1,30 @@
+"""
+Постановка в очередь построения вариантов (thumbnail, medium, webp) для
+фотографий, у которых их ещё нет, например загруженных до появления вариантов.
+
+    python backfill_photo_variants.py
+    python backfill_photo_variants.py --limit 500
+"""
+import argparse
+
+import src.main  # noqa: F401 — регистрирует все модели
+from src.database import SessionLocal
+from src.photos.models import Photo
+from src.photos.tasks import generate_photo_variants
+
+parser = argparse.ArgumentParser(description="Построение вариантов фотографий без миниатюр")
+parser.add_argument("--limit", type=int, default=None, help="Не больше указанного числа фотографий")
+args = parser.parse_args()
+
+db = SessionLocal()
+try:
+    query = db.query(Photo.photo_id).filter(Photo.thumbnail_url.is_(None)).order_by(Photo.photo_id)
+    if args.limit is not None:
+        query = query.limit(args.limit)
+    photo_ids = [photo_id for (photo_id,) in query]
+finally:
+    db.close()
+
+for photo_id in photo_ids:
+    generate_photo_variants.delay(photo_id)
+print(f"Поставлено в очередь фотографий: {len(photo_ids)}")
@@ -0,0 +1,90 @@
+"""
+Нагрузочный тест входа: пропускная способность POST /users/login и задержка
+GET /sets/ при параллельных входах (bcrypt в пуле PASSWORD_HASH_WORKERS).
+
+Запускается против работающего API (один воркер uvicorn) с существующим пользователем:
+
+    uvicorn src.main:app --workers 1 --port 8000
+    python benchmarks/login_load.py --email bench@example.com --password secret123
+
+Сначала замеряется задержка каталога без входов, затем — под нагрузкой входов.
+Ответы 503 — отказ пула bcrypt при перегрузке (PASSWORD_HASH_MAX_PENDING),
+клиенты входа после него ждут Retry-After.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from sets_concurrency import percentile
+
+
+async def login_loop(client: httpx.AsyncClient, form: dict, stop: asyncio.Event, results: dict):
+    while not stop.is_set():
+        response = await client.post("/users/login", data=form)
+        results[response.status_code] = results.get(response.status_code, 0) + 1
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+
+
+async def catalog_loop(client: httpx.AsyncClient, token: str, requests_per_client: int, latencies: list[float], errors: list[int]):
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(requests_per_client):
+        start = time.perf_counter()
+        response = await client.get("/sets/", params={"limit": 20}, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+
+async def measure_catalog(client: httpx.AsyncClient, args, token: str) -> tuple:
+    latencies: list[float] = []
+    errors: list[int] = []
+    await asyncio.gather(*[
+        catalog_loop(client, token, args.requests, latencies, errors)
+        for _ in range(args.catalog_clients)
+    ])
+    return latencies, errors
+
+
+def report(title: str, latencies: list[float], errors: list[int]):
+    print(f"{title}: запросов {len(latencies)}, ошибок {len(errors)}, "
+          f"p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms, "
+          f"p99 {percentile(latencies, 99):.1f} ms, max {max(latencies):.1f} ms")
+
+
+async def run(args):
+    form = {"username": args.email, "password": args.password}
+    limits = httpx.Limits(max_connections=args.login_clients + args.catalog_clients + 1)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120) as client:
+        response = await client.post("/users/login", data=form)
+        response.raise_for_status()
+        token = response.json()["access_token"]
+
+        report("Каталог без входов", *await measure_catalog(client, args, token))
+
+        stop = asyncio.Event()
+        results: dict = {}
+        start = time.perf_counter()
+        logins = [asyncio.create_task(login_loop(client, form, stop, results)) for _ in range(args.login_clients)]
+        report("Каталог под входами", *await measure_catalog(client, args, token))
+        await asyncio.sleep(max(0.0, args.duration - (time.perf_counter() - start)))
+        stop.set()
+        await asyncio.gather(*logins)
+        elapsed = time.perf_counter() - start
+
+    succeeded = results.get(200, 0)
+    print(f"Входов: {args.login_clients} клиентов, {succeeded / elapsed:.1f} успешных входов/с, ответы: {dict(sorted(results.items()))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пропускная способность входа и задержка каталога под входами")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Базовый URL API (без root_path /api)")
+    parser.add_argument("--email", required=True, help="Email существующего пользователя")
+    parser.add_argument("--password", required=True, help="Пароль пользователя")
+    parser.add_argument("--login-clients", dest="login_clients", type=int, default=50, help="Параллельных клиентов входа")
+    parser.add_argument("--catalog-clients", dest="catalog_clients", type=int, default=20, help="Параллельных клиентов каталога")
+    parser.add_argument("--requests", type=int, default=20, help="Запросов каталога на клиента")
+    parser.add_argument("--duration", type=float, default=10.0, help="Минимальная длительность нагрузки входами, с")
+    asyncio.run(run(parser.parse_args()))
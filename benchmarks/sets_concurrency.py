@@ -0,0 +1,76 @@
+"""
+Нагрузочный тест: задержка GET /sets/ под 200 параллельными клиентами.
+
+Запускается против работающего API (один воркер uvicorn), например:
+
+    uvicorn src.main:app --workers 1 --port 8000
+    python benchmarks/sets_concurrency.py --url http://127.0.0.1:8000 --token <access_token>
+
+Чтобы сравнить "до" и "после", прогоните скрипт на коммите с синхронными
+обработчиками и на текущем коде с одинаковыми параметрами и данными в БД.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def client_loop(client: httpx.AsyncClient, path: str, params: dict, requests_per_client: int, latencies: list[float], errors: list[int]):
+    for _ in range(requests_per_client):
+        start = time.perf_counter()
+        response = await client.get(path, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+
+async def run(args):
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    params = {"limit": args.limit}
+    if args.search:
+        params["search"] = args.search
+    if args.tag_names:
+        params["tag_names"] = args.tag_names
+
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=60) as client:
+        # Прогрев: соединения с API и пул соединений с БД
+        await client.get(args.path, params=params)
+
+        latencies: list[float] = []
+        errors: list[int] = []
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client_loop(client, args.path, params, args.requests, latencies, errors)
+            for _ in range(args.clients)
+        ])
+        elapsed = time.perf_counter() - start
+
+    print(f"Клиентов: {args.clients}, запросов: {len(latencies)}, ошибок: {len(errors)}")
+    print(f"Пропускная способность: {len(latencies) / elapsed:.1f} req/s")
+    print(f"p50: {percentile(latencies, 50):.1f} ms")
+    print(f"p95: {percentile(latencies, 95):.1f} ms")
+    print(f"p99: {percentile(latencies, 99):.1f} ms")
+    print(f"mean: {statistics.mean(latencies):.1f} ms, max: {max(latencies):.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Параллельная нагрузка на GET /sets/")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Базовый URL API (без root_path /api)")
+    parser.add_argument("--path", default="/sets/", help="Путь эндпоинта")
+    parser.add_argument("--token", default="", help="Access токен пользователя")
+    parser.add_argument("--clients", type=int, default=200, help="Количество параллельных клиентов")
+    parser.add_argument("--requests", type=int, default=20, help="Запросов на одного клиента")
+    parser.add_argument("--limit", type=int, default=20, help="Параметр limit запроса")
+    parser.add_argument("--search", default="", help="Параметр search запроса")
+    parser.add_argument("--tag-names", dest="tag_names", default="", help="Параметр tag_names запроса")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,23 @@
+"""
+Пересчёт счётчиков голосов пар (votes_participant1 / votes_participant2)
+из таблицы tournament_votes.
+
+    python reconcile_votes.py
+    python reconcile_votes.py --tournament-id 5
+"""
+import argparse
+
+import src.main  # noqa: F401 — регистрирует все модели
+from src.database import SessionLocal
+from src.tournaments.db import reconcile_db_pair_vote_counters
+
+parser = argparse.ArgumentParser(description="Пересчёт счётчиков голосов пар турниров")
+parser.add_argument("--tournament-id", type=int, default=None, help="Только пары указанного турнира")
+args = parser.parse_args()
+
+db = SessionLocal()
+try:
+    fixed = reconcile_db_pair_vote_counters(db, args.tournament_id)
+    print(f"Исправлено пар: {fixed}")
+finally:
+    db.close()
@@ -0,0 +1,286 @@
+# src/cache.py
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set
+
+import redis
+import redis.asyncio as aioredis
+
+from src.config import settings
+from src.logger import app_logger
+
+# Кэш ответов эндпоинтов чтения каталога.
+#
+# Ключ строится из пространства имён ("sets:list", "sets:one", ...) и нормализованных
+# параметров запроса. Каждая запись помечается тегами сущностей, данные которых в ней
+# есть ("set:5", "photo:12", "tag:3"), и тегами коллекций ("sets", "tags", "winners").
+# Функции записи в db.py вызывают invalidate(...) с тегами изменённых сущностей,
+# и удаляются ровно те записи, которые эти сущности содержат.
+#
+# Если REDIS_URL не задан, используется LRU в памяти процесса (для локальной
+# разработки): инвалидация в этом случае не видна другим процессам (Celery, воркеры).
+
+# Поля сериализованных ответов, по которым запись помечается тегами сущностей
+ENTITY_ID_FIELDS = {
+    "set_id": "set",
+    "minifigure_id": "minifigure",
+    "photo_id": "photo",
+    "tag_id": "tag",
+}
+
+
+def set_tag(set_id: int) -> str:
+    return f"set:{set_id}"
+
+
+def minifigure_tag(minifigure_id: str) -> str:
+    return f"minifigure:{minifigure_id}"
+
+
+def photo_tag(photo_id: int) -> str:
+    return f"photo:{photo_id}"
+
+
+def tag_tag(tag_id: int) -> str:
+    return f"tag:{tag_id}"
+
+
+def tag_name_tag(tag_name: str) -> str:
+    """Тег списков, отфильтрованных по имени тега (меняются при изменении связей тега)"""
+    return f"tagname:{tag_name}"
+
+
+def collect_entity_tags(payload: Any, tags: Optional[Set[str]] = None) -> Set[str]:
+    """Собирает теги сущностей из сериализованного ответа (вложенные dict/list)"""
+    if tags is None:
+        tags = set()
+    if isinstance(payload, dict):
+        for field, value in payload.items():
+            if field in ENTITY_ID_FIELDS and value is not None and not isinstance(value, (dict, list)):
+                tags.add(f"{ENTITY_ID_FIELDS[field]}:{value}")
+            else:
+                collect_entity_tags(value, tags)
+    elif isinstance(payload, list):
+        for item in payload:
+            collect_entity_tags(item, tags)
+    return tags
+
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Приводит параметры фильтра к каноническому виду для ключа кэша"""
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, str):
+            value = value.strip()
+            if name == "tag_names":
+                # Порядок и дубликаты тегов на результат не влияют
+                value = ",".join(sorted({tag.strip() for tag in value.split(",") if tag.strip()}))
+        normalized[name] = value
+    return normalized
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадение If-None-Match (список ETag или *) с ETag ответа; сравнение слабое, как требует RFC 9110"""
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+class LRUBackend:
+    """Ограниченный LRU-кэш в памяти процесса с TTL и индексом тегов"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, str, Set[str]]]" = OrderedDict()
+        self._tag_index: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _drop(self, key: str) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl: int, tags: Iterable[str]) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            tags = set(tags)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tag_index.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tag_index.get(tag, set())
+            for key in keys:
+                if key in self._entries:
+                    self._drop(key)
+            return len(keys)
+
+    async def aget(self, key: str) -> Optional[str]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: str, ttl: int, tags: Iterable[str]) -> None:
+        self.set(key, value, ttl, tags)
+
+
+class RedisBackend:
+    """Redis: запись хранится строкой, для каждого тега ведётся множество ключей"""
+
+    KEY_PREFIX = "cache:"
+    TAG_PREFIX = "cache-tag:"
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url)
+        self.async_client = aioredis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.KEY_PREFIX + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl: int, tags: Iterable[str]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        self._queue_set(pipe, key, value, ttl, tags)
+        pipe.execute()
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        tag_keys = [self.TAG_PREFIX + tag for tag in tags]
+        if not tag_keys:
+            return 0
+        keys = self.client.sunion(tag_keys)
+        self.client.delete(*keys, *tag_keys)
+        return len(keys)
+
+    async def aget(self, key: str) -> Optional[str]:
+        value = await self.async_client.get(self.KEY_PREFIX + key)
+        return value.decode("utf-8") if value is not None else None
+
+    async def aset(self, key: str, value: str, ttl: int, tags: Iterable[str]) -> None:
+        pipe = self.async_client.pipeline(transaction=False)
+        self._queue_set(pipe, key, value, ttl, tags)
+        await pipe.execute()
+
+    def _queue_set(self, pipe, key: str, value: str, ttl: int, tags: Iterable[str]) -> None:
+        pipe.set(self.KEY_PREFIX + key, value, ex=ttl)
+        for tag in tags:
+            # Множество тега живёт не дольше самой поздней записи в нём
+            pipe.sadd(self.TAG_PREFIX + tag, self.KEY_PREFIX + key)
+            pipe.expire(self.TAG_PREFIX + tag, ttl)
+
+
+class ResponseCache:
+    """Кэш ответов с тегами сущностей и счётчиками попаданий/промахов"""
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(namespace: str, params: Optional[Dict[str, Any]] = None) -> str:
+        payload = json.dumps(normalize_params(params or {}), sort_keys=True, default=str, ensure_ascii=False)
+        return f"{namespace}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+    def _count(self, key: str, counter: str) -> None:
+        namespace = key.rsplit(":", 1)[0]
+        with self._stats_lock:
+            namespace_stats = self._stats.setdefault(namespace, {"hits": 0, "misses": 0, "errors": 0})
+            namespace_stats[counter] += 1
+
+    def _decode(self, key: str, raw: Optional[str]) -> Optional[Any]:
+        self._count(key, "hits" if raw is not None else "misses")
+        return json.loads(raw) if raw is not None else None
+
+    def _encode(self, value: Any, tags: Iterable[str]) -> tuple[str, Set[str]]:
+        return json.dumps(value, ensure_ascii=False), set(tags) | collect_entity_tags(value)
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = self.backend.get(key)
+        except redis.RedisError as exc:
+            # Недоступность кэша не должна ломать чтение: идём в базу
+            self._count(key, "errors")
+            app_logger.warning(f"Ошибка чтения кэша {key}: {exc}")
+            return None
+        return self._decode(key, raw)
+
+    def set(self, key: str, value: Any, tags: Iterable[str] = ()) -> None:
+        raw, all_tags = self._encode(value, tags)
+        try:
+            self.backend.set(key, raw, self.ttl, all_tags)
+        except redis.RedisError as exc:
+            self._count(key, "errors")
+            app_logger.warning(f"Ошибка записи кэша {key}: {exc}")
+
+    async def aget(self, key: str) -> Optional[Any]:
+        try:
+            raw = await self.backend.aget(key)
+        except redis.RedisError as exc:
+            self._count(key, "errors")
+            app_logger.warning(f"Ошибка чтения кэша {key}: {exc}")
+            return None
+        return self._decode(key, raw)
+
+    async def aset(self, key: str, value: Any, tags: Iterable[str] = ()) -> None:
+        raw, all_tags = self._encode(value, tags)
+        try:
+            await self.backend.aset(key, raw, self.ttl, all_tags)
+        except redis.RedisError as exc:
+            self._count(key, "errors")
+            app_logger.warning(f"Ошибка записи кэша {key}: {exc}")
+
+    def invalidate(self, *tags: str) -> None:
+        """Удаляет все записи, помеченные любым из тегов (вызывается после commit)"""
+        try:
+            removed = self.backend.invalidate(tags)
+            app_logger.debug(f"Инвалидация кэша по тегам {', '.join(tags)}: удалено {removed} записей")
+        except redis.RedisError as exc:
+            # Записи доживут до истечения TTL
+            app_logger.error(f"Ошибка инвалидации кэша по тегам {', '.join(tags)}: {exc}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            namespaces = {namespace: dict(values) for namespace, values in self._stats.items()}
+        hits = sum(values["hits"] for values in namespaces.values())
+        misses = sum(values["misses"] for values in namespaces.values())
+        return {
+            "backend": "redis" if isinstance(self.backend, RedisBackend) else "memory",
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "namespaces": namespaces,
+        }
+
+
+def _create_backend():
+    if settings.REDIS_URL:
+        return RedisBackend(settings.REDIS_URL)
+    app_logger.info("REDIS_URL не задан, кэш ответов работает в памяти процесса")
+    return LRUBackend(settings.CACHE_LRU_MAX_ENTRIES)
+
+
+response_cache = ResponseCache(_create_backend(), settings.CACHE_TTL_SECONDS)
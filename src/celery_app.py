@@ -11,6 +11,8 @@ celery_app = Celery(
     include=[
         'src.tournaments.tasks',
         'src.email.tasks',
+        'src.users.tasks',
+        'src.photos.tasks',
     ]
 )
 
@@ -18,9 +20,18 @@ celery_app.conf.update(
     enable_utc=True,
     timezone='UTC',
     beat_schedule={
+        # Страховочный опрос: стадии закрываются задачами с eta (см. src/tournaments/scheduler.py)
         'check-tournaments-every-10-minutes': {
             'task': 'src.tournaments.tasks.check_and_advance_tournaments',
-            'schedule': crontab(), # Это означает 1 минута, можно просто написать 60.0
+            'schedule': crontab(minute='*/10'),
+        },
+        'reconcile-vote-counters-nightly': {
+            'task': 'src.tournaments.tasks.reconcile_vote_counters',
+            'schedule': crontab(hour=3, minute=0),
+        },
+        'prune-refresh-tokens-hourly': {
+            'task': 'src.users.tasks.prune_refresh_tokens',
+            'schedule': crontab(minute=30),
         },
     }
 ) 
\ No newline at end of file
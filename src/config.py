@@ -1,5 +1,6 @@
 # src/config.py
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -8,9 +9,39 @@ class Settings(BaseSettings):
     DB_NAME: str
     DB_USER: str
     DB_PASS: str
+    DB_ASYNC_POOL_SIZE: int = 20
+    DB_ASYNC_MAX_OVERFLOW: int = 10
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Проверка access токена по его claims (sub, role, ver) без запроса пользователя из базы
+    AUTH_TRUST_TOKEN_CLAIMS: bool = True
+    # Кэш состояния токенов (token_version, is_active): Redis при REDIS_URL, иначе LRU процесса
+    AUTH_STATE_TTL_SECONDS: int = 30
+    AUTH_STATE_MAX_ENTRIES: int = 10000
+    # Кэш пользователей для get_current_user (LRU процесса); с AUTH_TRUST_TOKEN_CLAIMS=False не используется
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
+    # Пул bcrypt: потоков и операций в работе и очереди (сверх — 503)
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 16
+    # Очистка истёкших и аннулированных refresh токенов: строк за один DELETE
+    REFRESH_TOKEN_PRUNE_BATCH_SIZE: int = 5000
+    # Загрузка фотографий: максимальный размер и размер блока потокового копирования
+    PHOTO_UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    PHOTO_UPLOAD_CHUNK_SIZE: int = 64 * 1024
+    # Хранилище фотографий: "local" (каталог static, файлы раздаёт API) или "s3" (S3-совместимый бакет)
+    PHOTO_STORAGE: str = "local"
+    PHOTO_S3_BUCKET: Optional[str] = None
+    # Адрес S3-совместимого сервера (MinIO и т.п.); не задан — AWS S3
+    PHOTO_S3_ENDPOINT_URL: Optional[str] = None
+    PHOTO_S3_REGION: Optional[str] = None
+    PHOTO_S3_ACCESS_KEY: Optional[str] = None
+    PHOTO_S3_SECRET_KEY: Optional[str] = None
+    # Публичный адрес файлов (CDN или бакет); по умолчанию {PHOTO_S3_ENDPOINT_URL}/{PHOTO_S3_BUCKET}
+    PHOTO_S3_PUBLIC_URL: Optional[str] = None
+    # Срок действия presigned URL прямой загрузки, с
+    PHOTO_UPLOAD_URL_EXPIRES_SECONDS: int = 600
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     EMAIL_VERIFICATION_EXPIRE_MINUTES: int = 5
     EMAIL_VERIFICATION_RESEND_INTERVAL_MINUTES: int = 2
@@ -24,6 +55,18 @@ class Settings(BaseSettings):
     RABBITMQ_PORT: int
     RABBITMQ_USER: str
     RABBITMQ_PASSWORD: str
+    # Кэш ответов: без REDIS_URL используется LRU в памяти процесса
+    REDIS_URL: Optional[str] = None
+    CACHE_TTL_SECONDS: int = 60
+    CACHE_LRU_MAX_ENTRIES: int = 1024
+    # Буферизация голосов: голоса копятся в Redis и пишутся пачками (без REDIS_URL буфер отключается)
+    VOTE_BUFFER_ENABLED: bool = False
+    VOTE_BUFFER_FLUSH_INTERVAL_MS: int = 200
+    VOTE_BUFFER_MAX_BATCH: int = 1000
+    # Снимки сетки турниров (GET /tournaments/{id}), хранятся там же, где кэш ответов
+    TOURNAMENT_SNAPSHOT_TTL_SECONDS: int = 600
+    # Живые обновления турниров (SSE): интервал рассылки суммированных голосов
+    TOURNAMENT_EVENTS_INTERVAL_MS: int = 1000
 
     class Config:
         # Определяем путь к .env файлу в зависимости от текущей директории
@@ -4,6 +4,7 @@ import os
 from pathlib import Path
 from logging.handlers import RotatingFileHandler
 import time
+import inspect
 
 # Создаём директорию для логов
 logs_dir = Path("logs")
@@ -40,8 +41,20 @@ def log_db_operation(func):
     """
     Декоратор для логирования операций с базой данных:
     - Логирует имя функции, время выполнения и ошибки.
-    Используется для функций, работающих с БД.
+    Используется для функций, работающих с БД (как синхронных, так и асинхронных).
     """
+    if inspect.iscoroutinefunction(func):
+        async def async_wrapper(*args, **kwargs):
+            start_time = time.time()
+            try:
+                result = await func(*args, **kwargs)
+                db_logger.info(f"DB operation {func.__name__} completed in {round((time.time() - start_time) * 1000, 2)} ms")
+                return result
+            except Exception as exc:
+                db_logger.error(f"DB operation {func.__name__} failed: {str(exc)}")
+                raise
+        return async_wrapper
+
     def wrapper(*args, **kwargs):
         start_time = time.time()
         try:
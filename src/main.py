@@ -2,7 +2,6 @@
 import os
 from datetime import datetime
 from fastapi import FastAPI, Depends, Request
-from fastapi.staticfiles import StaticFiles
 from fastapi.openapi.utils import get_openapi
 from src.database import engine, get_db, Base
 from src.sets.models import Set, SetMinifigure
@@ -16,15 +15,21 @@ from sqlalchemy.orm import Session
 from src.sets.routes import router as sets_router
 from src.minifigures.routes import router as minifigures_router
 from src.tags.routes import router as tags_router
-from src.photos.routes import router as photos_router
+from src.photos.routes import router as photos_router, static_router
 from src.users.routes import router as users_router
 from src.tournaments.routes import router as tournaments_router
 from src.winners.routes import router as winners_router
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
-from src.middleware import LoggingMiddleware
+from src.middleware import LoggingMiddleware, UploadSizeLimitMiddleware
 from src.logger import app_logger
+from src.config import settings
+from src.cache import response_cache
+from src.tournaments.vote_buffer import vote_buffer
+from src.tournaments.events import tournament_events
+from src.users.utils import get_admin_user
+from src.users.cache import principal_cache
 
 
 # Middleware для обработки X-Forwarded заголовков от reverse proxy
@@ -69,6 +74,15 @@ app = FastAPI(
 # Логгирование запуска приложения
 app_logger.info("Запуск приложения LEGO Collection API")
 
+# Лимит тела загрузки фотографий до разбора multipart (запас 64 КБ на поля формы и границы).
+# Добавляется первым (самый внутренний): BaseHTTPMiddleware между ним и приложением
+# обернул бы исключение из receive в ExceptionGroup и ответ 413 превратился бы в 400
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=("/photos/upload/",),
+    max_body_bytes=settings.PHOTO_UPLOAD_MAX_BYTES + 64 * 1024
+)
+
 # Добавляем middleware для обработки reverse proxy заголовков (ВАЖНО: первым!)
 app.add_middleware(ProxyHeadersMiddleware)
 
@@ -78,9 +92,6 @@ app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
 # Добавляем middleware для логирования
 app.add_middleware(LoggingMiddleware)
 
-# Подключаем папку static для раздачи файлов
-app.mount("/static", StaticFiles(directory="/app/static"), name="static")
-
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -88,6 +99,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Курсор следующей страницы списков должен быть доступен браузерным клиентам
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Подключаем маршруты
@@ -98,6 +111,25 @@ app.include_router(photos_router)
 app.include_router(users_router)
 app.include_router(tournaments_router)
 app.include_router(winners_router)
+# Файлы фотографий (/static) раздаёт API только при PHOTO_STORAGE=local; при s3 — бакет/CDN
+if settings.PHOTO_STORAGE == "local":
+    app.include_router(static_router)
+
+@app.on_event("startup")
+async def start_vote_buffer():
+    vote_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_vote_buffer():
+    await vote_buffer.stop()
+
+@app.on_event("startup")
+async def start_tournament_events():
+    tournament_events.start()
+
+@app.on_event("shutdown")
+async def stop_tournament_events():
+    await tournament_events.stop()
 
 @app.get("/")
 def read_root(db: Session = Depends(get_db)):
@@ -109,6 +141,11 @@ def health_check():
     """Health check endpoint для Docker и мониторинга"""
     return {"status": "healthy", "service": "LEGO Collection API", "timestamp": datetime.now().isoformat()}
 
+@app.get("/cache/stats")
+def cache_stats(current_user: User = Depends(get_admin_user)):
+    """Счётчики кэша ответов, кэша пользователей и буфера голосов (по текущему процессу)"""
+    return {**response_cache.stats(), "principals": principal_cache.stats(), "vote_buffer": vote_buffer.stats()}
+
 # Обработчик для перехвата необработанных исключений
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -1,7 +1,8 @@
 # src/middleware.py
 import time
 from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi import Request, Response
+from fastapi import Request, Response, HTTPException
+from fastapi.responses import JSONResponse
 from src.logger import request_logger
 
 class LoggingMiddleware(BaseHTTPMiddleware):
@@ -15,4 +16,67 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             return response
         except Exception as exc:
             request_logger.error(f"Request failed: {str(exc)}")
-            raise 
\ No newline at end of file
+            raise 
+
+class RequestTooLarge(HTTPException):
+    """
+    Тело больше лимита. HTTPException, чтобы FastAPI при разборе тела пробросил
+    её как есть (ответ 413), а не заменил на 400 "error parsing the body".
+    """
+
+    def __init__(self):
+        super().__init__(status_code=413, detail="Размер загружаемого файла превышает допустимый")
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Ограничение размера тела запросов загрузки файлов (paths) до разбора multipart.
+    Starlette отдаёт UploadFile обработчику только после приёма и сохранения всего
+    тела, поэтому лимит проверяется здесь: по Content-Length — сразу, не читая тело;
+    без него (chunked) — по мере приёма, и приём обрывается ответом 413.
+    """
+
+    def __init__(self, app, paths: tuple, max_body_bytes: int):
+        self.app = app
+        self.paths = paths
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].endswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            request_logger.warning(f"Тело запроса {scope['path']} ({int(content_length)} байт) превышает лимит загрузки")
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise RequestTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except RequestTooLarge:
+            request_logger.warning(f"Тело запроса {scope['path']} превысило лимит загрузки при приёме")
+            if not response_started:
+                await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": RequestTooLarge().detail})
+        await response(scope, receive, send)
@@ -1,69 +1,159 @@
 # src/minifigures/db.py
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from psycopg2.errors import UniqueViolation, ForeignKeyViolation, NotNullViolation, CheckViolation
 from src.minifigures.models import Minifigure
 from src.photos.models import Photo
 from src.tags.models import Tag, MinifigureTag
+from src.tags.utils import parse_tag_names, check_tags_exist
 from src.minifigures.schemas import MinifigureCreate, MinifigureUpdate, MinifigureDelete
 from typing import Optional, List
 from sqlalchemy.sql import func
-from sqlalchemy import distinct
+from sqlalchemy import distinct, select
 from src.logger import log_db_operation
+from src.cache import response_cache, minifigure_tag
+from src.pagination import decode_cursor, apply_keyset
+from src.search import RELEVANCE_SORT, normalize_search, search_condition, search_distance
 
-@log_db_operation
-def get_db_minifigures(db: Session, limit: int = 10, offset: int = 0, search: str = "", tag_names: Optional[str] = "", tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None) -> list[Minifigure]:
-    # Формируем базовый запрос с загрузкой связанных данных
-    query = db.query(Minifigure).options(
-        joinedload(Minifigure.face_photo),
-        joinedload(Minifigure.photos),
-        joinedload(Minifigure.tags)
-    ).filter(Minifigure.name.contains(search))
+# Выражения сортировки для курсорной пагинации по (sort_key, minifigure_id).
+# Цена может быть NULL, поэтому сортируем по coalesce(price, 0) (под него есть индекс)
+MINIFIGURE_SORT_COLUMNS = {
+    "minifigure_id": Minifigure.minifigure_id,
+    "name": Minifigure.name,
+    "price": func.coalesce(Minifigure.price, 0),
+}
+
+def get_minifigure_cursor_values(minifigure: Minifigure, sort_by: str) -> list:
+    """Значения (sort_key, minifigure_id) записи для курсора следующей страницы"""
+    if sort_by == RELEVANCE_SORT:
+        # Релевантность не хранится в модели: её проставляет get_db_minifigures
+        return [minifigure.page_sort_key, minifigure.minifigure_id]
+    if sort_by == "price":
+        return [minifigure.price if minifigure.price is not None else 0, minifigure.minifigure_id]
+    return [getattr(minifigure, sort_by), minifigure.minifigure_id]
+
+def _filter_minifigures_query(query, search: str, tags_list: Optional[List[str]], tag_logic: str, min_price: Optional[float], max_price: Optional[float]):
+    """Фильтры списка минифигурок: общие для страниц каталога и выборки участников турнира"""
+    if search:
+        query = query.where(search_condition(Minifigure.search_text, search))
 
     # Применяем фильтрацию по цене
     if min_price is not None:
-        query = query.filter(Minifigure.price >= min_price)
+        query = query.where(Minifigure.price >= min_price)
     if max_price is not None:
-        query = query.filter(Minifigure.price <= max_price)
-
-    # Обрабатываем фильтрацию по тегам
-    tags_list = []
-    if tag_names:
-        tags_list = [tag.strip() for tag in tag_names.split(",") if tag.strip()]
-        # Удаляем дубликаты из списка тегов
-        tags_list = list(set(tags_list))
-        
-        # Проверяем существование всех тегов
-        non_existent_tags = []
-        for tag_name in tags_list:
-            tag = db.query(Tag).filter(Tag.name == tag_name).first()
-            if not tag:
-                non_existent_tags.append(tag_name)
-        if non_existent_tags:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Теги с именами {', '.join(non_existent_tags)} не найдены"
-            )
-        
-        # Применяем фильтрацию по тегам
-        query = query.join(MinifigureTag, Minifigure.minifigure_id == MinifigureTag.minifigure_id)\
-                     .join(Tag, MinifigureTag.tag_id == Tag.tag_id)\
-                     .filter(Tag.name.in_(tags_list))
+        query = query.where(Minifigure.price <= max_price)
+
+    # Применяем фильтрацию по тегам через подзапрос, чтобы основной запрос
+    # не дублировал строки (OR) и не требовал GROUP BY по минифигуркам (AND)
+    if tags_list:
+        tagged_minifigures = select(MinifigureTag.minifigure_id)\
+            .join(Tag, MinifigureTag.tag_id == Tag.tag_id)\
+            .where(Tag.name.in_(tags_list))
         if tag_logic == "AND":
             # Для AND возвращаем только минифигурки, содержащие все указанные теги
-            query = query.group_by(Minifigure.minifigure_id)\
-                         .having(func.count(distinct(Tag.name)) == len(tags_list))
+            tagged_minifigures = tagged_minifigures.group_by(MinifigureTag.minifigure_id)\
+                                                   .having(func.count(distinct(Tag.name)) == len(tags_list))
         # Для OR не используем having, что возвращает минифигурки с хотя бы одним тегом
+        query = query.where(Minifigure.minifigure_id.in_(tagged_minifigures))
+    return query
 
-    # Применяем пагинацию
-    minifigures = query.limit(limit).offset(offset).all()
-    
-    # Сортируем фотографии для каждой минифигурки, чтобы главная фотография была первой
-    for minifigure in minifigures:
-        minifigure.photos = sorted(minifigure.photos, key=lambda photo: 0 if photo.is_main else 1)
-    
-    return minifigures
+def _build_minifigure_ids_query(search: str = "", tags_list: Optional[List[str]] = None, tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None, sort_by: str = "minifigure_id", sort_order: str = "ASC", cursor: Optional[str] = None):
+    """
+    Первая фаза выборки списка: только идентификаторы минифигурок страницы
+    с фильтрами и сортировкой (sort_key, minifigure_id), без JOIN фотографий и тегов.
+    Общая для синхронной и асинхронной версий get_db_minifigures.
+    """
+    # Поиск по названию и имени персонажа через триграммный индекс на search_text
+    search = normalize_search(search)
+    if sort_by == RELEVANCE_SORT:
+        sort_expression = search_distance(Minifigure.search_text, search)
+    else:
+        sort_expression = MINIFIGURE_SORT_COLUMNS[sort_by]
+    query = select(Minifigure.minifigure_id, sort_expression.label("sort_key"))
+    query = _filter_minifigures_query(query, search, tags_list, tag_logic, min_price, max_price)
+
+    # Сортировка и условие курсора (keyset): страница N стоит столько же, сколько первая
+    cursor_values = decode_cursor(cursor, sort_by, sort_order) if cursor else None
+    return apply_keyset(query, sort_expression, Minifigure.minifigure_id, sort_order, cursor_values)
+
+def _hydrate_minifigures_query(minifigure_ids: List[str]):
+    """
+    Вторая фаза: загрузка минифигурок страницы по идентификаторам.
+    Фотографии и теги подгружаются отдельным пакетным IN-запросом на каждую связь,
+    главная фотография идёт первой благодаря order_by у связи Minifigure.photos.
+    """
+    return select(Minifigure).options(
+        joinedload(Minifigure.face_photo),
+        selectinload(Minifigure.photos),
+        selectinload(Minifigure.tags)
+    ).where(Minifigure.minifigure_id.in_(minifigure_ids))
+
+def _order_by_ids(minifigures: List[Minifigure], page_rows: list) -> List[Minifigure]:
+    # Восстанавливаем порядок первой фазы: IN (...) порядок не гарантирует
+    minifigures_by_id = {minifigure.minifigure_id: minifigure for minifigure in minifigures}
+    ordered = []
+    for minifigure_id, sort_key in page_rows:
+        if minifigure_id in minifigures_by_id:
+            minifigure = minifigures_by_id[minifigure_id]
+            # Ключ сортировки из первой фазы нужен для курсора при сортировке по релевантности
+            minifigure.page_sort_key = sort_key
+            ordered.append(minifigure)
+    return ordered
+
+@log_db_operation
+def get_db_minifigures(db: Session, limit: int = 10, offset: int = 0, search: str = "", tag_names: Optional[str] = "", tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None, sort_by: str = "minifigure_id", sort_order: str = "ASC", cursor: Optional[str] = None) -> list[Minifigure]:
+    # Обрабатываем фильтрацию по тегам: проверяем существование всех тегов одним запросом
+    tags_list = parse_tag_names(tag_names)
+    if tags_list:
+        existing_names = db.execute(select(Tag.name).where(Tag.name.in_(tags_list))).scalars().all()
+        check_tags_exist(tags_list, existing_names)
+
+    query = _build_minifigure_ids_query(search, tags_list, tag_logic, min_price, max_price, sort_by, sort_order, cursor)
+
+    # Применяем пагинацию: в режиме курсора offset не нужен
+    query = query.limit(limit) if cursor else query.limit(limit).offset(offset)
+    page_rows = db.execute(query).all()
+    if not page_rows:
+        return []
+    minifigure_ids = [row.minifigure_id for row in page_rows]
+
+    minifigures = db.execute(_hydrate_minifigures_query(minifigure_ids)).scalars().all()
+    return _order_by_ids(minifigures, page_rows)
+
+@log_db_operation
+async def get_async_db_minifigures(db: AsyncSession, limit: int = 10, offset: int = 0, search: str = "", tag_names: Optional[str] = "", tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None, sort_by: str = "minifigure_id", sort_order: str = "ASC", cursor: Optional[str] = None) -> list[Minifigure]:
+    """Асинхронный вариант get_db_minifigures для эндпоинтов чтения"""
+    tags_list = parse_tag_names(tag_names)
+    if tags_list:
+        existing_names = (await db.execute(select(Tag.name).where(Tag.name.in_(tags_list)))).scalars().all()
+        check_tags_exist(tags_list, existing_names)
+
+    query = _build_minifigure_ids_query(search, tags_list, tag_logic, min_price, max_price, sort_by, sort_order, cursor)
+
+    query = query.limit(limit) if cursor else query.limit(limit).offset(offset)
+    page_rows = (await db.execute(query)).all()
+    if not page_rows:
+        return []
+    minifigure_ids = [row.minifigure_id for row in page_rows]
+
+    minifigures = (await db.execute(_hydrate_minifigures_query(minifigure_ids))).scalars().all()
+    return _order_by_ids(minifigures, page_rows)
+
+@log_db_operation
+def get_db_random_minifigure_ids(db: Session, limit: int, search: str = "", tag_names: Optional[str] = "", tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[str]:
+    """
+    Случайная выборка идентификаторов минифигурок с фильтрами каталога (ORDER BY random() LIMIT):
+    без загрузки объектов, фотографий и тегов
+    """
+    tags_list = parse_tag_names(tag_names)
+    if tags_list:
+        existing_names = db.execute(select(Tag.name).where(Tag.name.in_(tags_list))).scalars().all()
+        check_tags_exist(tags_list, existing_names)
+
+    query = _filter_minifigures_query(select(Minifigure.minifigure_id), normalize_search(search), tags_list, tag_logic, min_price, max_price)
+    return db.execute(query.order_by(func.random()).limit(limit)).scalars().all()
 
 @log_db_operation
 def create_db_minifigure(minifigure: MinifigureCreate, db: Session) -> Minifigure:
@@ -72,6 +162,8 @@ def create_db_minifigure(minifigure: MinifigureCreate, db: Session) -> Minifigur
         db.add(new_minifigure)
         db.commit()
         db.refresh(new_minifigure)
+        # Новая минифигурка может попасть в любой список минифигурок
+        response_cache.invalidate("minifigures")
         return db.query(Minifigure).options(joinedload(Minifigure.face_photo), joinedload(Minifigure.photos)).filter(Minifigure.minifigure_id == new_minifigure.minifigure_id).first()
     except IntegrityError as e:
         db.rollback()
@@ -86,19 +178,25 @@ def create_db_minifigure(minifigure: MinifigureCreate, db: Session) -> Minifigur
         else:
             raise HTTPException(status_code=400, detail="Integrity error")
 
+def _one_minifigure_query(minifigure_id: str):
+    # Фотографии и теги загружаются отдельными IN-запросами, главная фотография идёт первой
+    return _hydrate_minifigures_query([minifigure_id])
+
 @log_db_operation
 def get_db_one_minifigure(db: Session, minifigure_id: str) -> Minifigure:
-    one_minifigure = db.query(Minifigure).options(
-        joinedload(Minifigure.face_photo),
-        joinedload(Minifigure.photos),
-        joinedload(Minifigure.tags)
-    ).filter(Minifigure.minifigure_id == minifigure_id).first()
+    one_minifigure = db.execute(_one_minifigure_query(minifigure_id)).scalars().first()
     if not one_minifigure:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Minifigure with id {minifigure_id} was not found")
     
-    # Сортируем фотографии, чтобы главная фотография была первой
-    one_minifigure.photos = sorted(one_minifigure.photos, key=lambda photo: 0 if photo.is_main else 1)
-    
+    return one_minifigure
+
+@log_db_operation
+async def get_async_db_one_minifigure(db: AsyncSession, minifigure_id: str) -> Minifigure:
+    """Асинхронный вариант get_db_one_minifigure для эндпоинтов чтения"""
+    one_minifigure = (await db.execute(_one_minifigure_query(minifigure_id))).scalars().first()
+    if not one_minifigure:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Minifigure with id {minifigure_id} was not found")
+
     return one_minifigure
 
 @log_db_operation
@@ -109,6 +207,8 @@ def update_db_minifigure(minifigure_id: str, minifigure_update: MinifigureUpdate
         setattr(db_minifigure, key, value)
     try:
         db.commit()
+        # Изменение полей может поменять состав и порядок любых списков
+        response_cache.invalidate("minifigures", minifigure_tag(minifigure_id))
         return db.query(Minifigure).options(joinedload(Minifigure.face_photo), joinedload(Minifigure.photos)).filter(Minifigure.minifigure_id == minifigure_id).first()
     except IntegrityError as e:
         db.rollback()
@@ -128,4 +228,5 @@ def delete_db_minifigure(minifigure_delete: MinifigureDelete, db: Session) -> di
     db_minifigure = get_db_one_minifigure(db, minifigure_delete.minifigure_id)
     db.delete(db_minifigure)
     db.commit()
+    response_cache.invalidate("minifigures", minifigure_tag(minifigure_delete.minifigure_id))
     return {"message": f"Minifigure with id {minifigure_delete.minifigure_id} deleted successfully"}
\ No newline at end of file
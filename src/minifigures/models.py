@@ -1,22 +1,35 @@
 # src/minifigures/models.py
-from sqlalchemy import Column, String, Integer, ForeignKey
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, Computed, func
 from sqlalchemy.orm import relationship
 from src.database import Base
 
 class Minifigure(Base):
     __tablename__ = "minifigures"
+    # Составные индексы (sort_key, minifigure_id) для сортировки и курсорной пагинации
+    __table_args__ = (
+        Index("ix_minifigures_name_minifigure_id", "name", "minifigure_id"),
+        # Триграммный индекс для регистронезависимого и нечёткого поиска
+        Index("ix_minifigures_search_text_trgm", "search_text", postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"}),
+    )
 
     minifigure_id = Column(String, primary_key=True, index=True)
     character_name = Column(String, nullable=False)
     name = Column(String, unique=True, nullable=False)
     price = Column(Integer, nullable=True)
     face_photo_id = Column(Integer, ForeignKey("photos.photo_id", ondelete="SET NULL"), nullable=True)
+    # Текст для поиска: название и имя персонажа (вычисляется базой данных)
+    search_text = Column(String, Computed("name || ' ' || character_name", persisted=True))
 
     # Связь с фотографией лица
     face_photo = relationship("Photo", foreign_keys=[face_photo_id], back_populates="minifigures")
     # Связь с фотографиями минифигурок
-    photos = relationship("Photo", back_populates="minifigure", foreign_keys="Photo.minifigure_id")
+    photos = relationship("Photo", back_populates="minifigure", foreign_keys="Photo.minifigure_id",
+                          # Главная фотография первой, затем в порядке добавления
+                          order_by="(Photo.is_main.desc().nullslast(), Photo.photo_id)")
     # Явная связь с тегами через minifigure_tags
     tags = relationship("Tag", secondary="minifigure_tags", back_populates="minifigures")
     # Связь с турнирами (минифигурки в турнирах)
-    tournament_participants = relationship("TournamentParticipant", back_populates="minifigure")
\ No newline at end of file
+    tournament_participants = relationship("TournamentParticipant", back_populates="minifigure")
+
+# Функциональный индекс для сортировки по цене: цена может быть NULL, поэтому сортируем по coalesce(price, 0)
+Index("ix_minifigures_price_minifigure_id", func.coalesce(Minifigure.price, 0), Minifigure.minifigure_id)
@@ -1,23 +1,30 @@
 # src/minifigures/routes.py
-from fastapi import status, HTTPException, Depends, APIRouter, Form
+from fastapi import status, HTTPException, Depends, APIRouter, Form, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 from src.minifigures.schemas import MinifigureCreate, MinifigureResponse, MinifigureUpdate, MinifigureDelete, MinifigureFilter
-from src.database import get_db
+from src.database import get_db, get_async_db
 from src.minifigures.db import (
     get_db_minifigures,
+    get_async_db_minifigures,
+    get_minifigure_cursor_values,
     create_db_minifigure,
     get_db_one_minifigure,
+    get_async_db_one_minifigure,
     update_db_minifigure,
     delete_db_minifigure
 )
-from src.users.utils import get_current_active_user
+from src.users.utils import get_current_active_principal
 from src.logger import app_logger
+from src.pagination import NEXT_CURSOR_HEADER, build_next_cursor
+from src.cache import response_cache, tag_name_tag
+from src.tags.utils import parse_tag_names
 
 router = APIRouter(
     prefix="/minifigures",
     tags=["Minifigures"],
-    dependencies=[Depends(get_current_active_user)]
+    dependencies=[Depends(get_current_active_principal)]
 )
 
 @router.get(
@@ -27,11 +34,20 @@ router = APIRouter(
     summary="Получить список минифигурок",
     description="Возвращает список всех минифигурок LEGO с возможностью пагинации, поиска, фильтрации по тегу и цене"
 )
-async def get_minifigures(filter: MinifigureFilter = Depends(), db: Session = Depends(get_db)):
+async def get_minifigures(response: Response, filter: MinifigureFilter = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     Получить список минифигурок с фильтрацией и пагинацией.
+    Курсор следующей страницы возвращается в заголовке X-Next-Cursor.
     """
-    minifigures = get_db_minifigures(
+    cache_key = response_cache.make_key("minifigures:list", filter.model_dump())
+    cached = await response_cache.aget(cache_key)
+    if cached is not None:
+        if cached["next_cursor"]:
+            response.headers[NEXT_CURSOR_HEADER] = cached["next_cursor"]
+        app_logger.info(f"Получено {len(cached['items'])} минифигурок из кэша (фильтр: {filter.dict()})")
+        return cached["items"]
+
+    minifigures = await get_async_db_minifigures(
         db=db,
         limit=filter.limit,
         offset=filter.offset,
@@ -39,10 +55,26 @@ async def get_minifigures(filter: MinifigureFilter = Depends(), db: Session = De
         tag_names=filter.tag_names,
         tag_logic=filter.tag_logic,
         min_price=filter.min_price,
-        max_price=filter.max_price
+        max_price=filter.max_price,
+        sort_by=filter.sort_by,
+        sort_order=filter.sort_order,
+        cursor=filter.cursor
+    )
+    next_cursor = build_next_cursor(
+        minifigures, filter.limit, filter.sort_by, filter.sort_order,
+        key=lambda minifigure: get_minifigure_cursor_values(minifigure, filter.sort_by)
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    items = [MinifigureResponse.model_validate(minifigure).model_dump(mode="json") for minifigure in minifigures]
+    # Список зависит от всех минифигурок и от связей тегов, по которым он отфильтрован
+    await response_cache.aset(
+        cache_key,
+        {"items": items, "next_cursor": next_cursor},
+        tags=["minifigures", *[tag_name_tag(tag_name) for tag_name in parse_tag_names(filter.tag_names)]]
     )
     app_logger.info(f"Получено {len(minifigures)} минифигурок (фильтр: {filter.dict()})")
-    return minifigures
+    return items
 
 @router.post(
     "/", 
@@ -86,7 +118,15 @@ async def delete_minifigure(minifigure_delete: MinifigureDelete, db: Session = D
     summary="Получить минифигурку по ID",
     description="Возвращает информацию о конкретной минифигурке LEGO по ее ID"
 )
-async def get_one_minifigure(minifigure_id: str, db: Session = Depends(get_db)):
-    minifigure = get_db_one_minifigure(db, minifigure_id)
+async def get_one_minifigure(minifigure_id: str, db: AsyncSession = Depends(get_async_db)):
+    cache_key = response_cache.make_key("minifigures:one", {"minifigure_id": minifigure_id})
+    cached = await response_cache.aget(cache_key)
+    if cached is not None:
+        app_logger.info(f"Получена минифигурка ID: {minifigure_id} из кэша")
+        return cached
+
+    minifigure = await get_async_db_one_minifigure(db, minifigure_id)
+    item = MinifigureResponse.model_validate(minifigure).model_dump(mode="json")
+    await response_cache.aset(cache_key, item)
     app_logger.info(f"Получена минифигурка ID: {minifigure_id}")
-    return minifigure
\ No newline at end of file
+    return item
\ No newline at end of file
@@ -1,9 +1,10 @@
 # src/minifigures/schemas.py
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import Optional, List, Dict, Any
 from fastapi import HTTPException, status
 from src.photos.schemas import PhotoResponse
 from src.tags.schemas import TagResponse
+from src.search import RELEVANCE_SORT
 
 class MinifigureBase(BaseModel):
     minifigure_id: str = Field(..., description="Уникальный идентификатор минифигурки (например, hp150)", example="hp150")
@@ -32,14 +33,20 @@ class MinifigureResponse(MinifigureBase):
 class MinifigureDelete(BaseModel):
     minifigure_id: str = Field(..., description="Уникальный идентификатор минифигурки для удаления", example="hp150")
 
+# Поля, по которым доступна сортировка и курсорная пагинация минифигурок
+MINIFIGURE_SORT_FIELDS = ("minifigure_id", "name", "price", RELEVANCE_SORT)
+
 class MinifigureFilter(BaseModel):
     limit: int = Field(default=10, description="Количество возвращаемых записей", ge=1, le=1000)
     offset: int = Field(default=0, description="Смещение для пагинации", ge=0)
-    search: Optional[str] = Field(default="", description="Поиск по названию минифигурки")
+    search: Optional[str] = Field(default="", description="Поиск по названию и имени персонажа (без учёта регистра, с допуском опечаток)")
     tag_names: Optional[str] = Field(default="", description="Список имен тегов, разделённых запятыми, для фильтрации минифигурок")
     tag_logic: Optional[str] = Field(default="AND", description="Логика фильтрации тегов: AND или OR")
     min_price: Optional[float] = Field(default=None, description="Минимальная цена минифигурки в рублях", ge=0)
     max_price: Optional[float] = Field(default=None, description="Максимальная цена минифигурки в рублях", ge=0)
+    sort_by: Optional[str] = Field(default=None, description=f"Поле сортировки: {', '.join(MINIFIGURE_SORT_FIELDS)}. По умолчанию relevance при поиске, иначе minifigure_id")
+    sort_order: Optional[str] = Field(default="ASC", description="Направление сортировки: ASC или DESC")
+    cursor: Optional[str] = Field(default=None, description="Курсор следующей страницы из заголовка X-Next-Cursor (если указан, offset игнорируется)")
 
     @field_validator("tag_logic")
     @classmethod
@@ -51,6 +58,34 @@ class MinifigureFilter(BaseModel):
             )
         return value.upper()
 
+    @field_validator("sort_by")
+    @classmethod
+    def validate_sort_by(cls, value):
+        if value is not None and value not in MINIFIGURE_SORT_FIELDS:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"sort_by должен быть одним из: {', '.join(MINIFIGURE_SORT_FIELDS)}"
+            )
+        return value
+
+    @field_validator("sort_order")
+    @classmethod
+    def validate_sort_order(cls, value):
+        if value.upper() not in ["ASC", "DESC"]:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="sort_order должен быть 'ASC' или 'DESC'"
+            )
+        return value.upper()
+
+    @model_validator(mode="after")
+    def resolve_sort_by(self):
+        # При поиске по умолчанию сортируем по релевантности; без поиска релевантность не определена
+        has_search = bool((self.search or "").strip())
+        if self.sort_by is None or (self.sort_by == RELEVANCE_SORT and not has_search):
+            self.sort_by = RELEVANCE_SORT if has_search else "minifigure_id"
+        return self
+
     @field_validator("min_price", "max_price")
     @classmethod
     def validate_non_negative(cls, value, field):
@@ -0,0 +1,61 @@
+# src/pagination.py
+import base64
+import binascii
+import json
+from typing import Any, Callable, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+# Заголовок ответа с курсором следующей страницы. Тело списков не меняется,
+# поэтому старые клиенты с limit/offset продолжают работать как раньше
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort_by: str, sort_order: str, values: List[Any]) -> str:
+    """Кодирует позицию последней записи страницы в непрозрачный курсор"""
+    payload = json.dumps({"s": sort_by, "o": sort_order, "v": values}, separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> List[Any]:
+    """Декодирует курсор и проверяет, что он выдан для той же сортировки"""
+    invalid_cursor = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Некорректный курсор пагинации"
+    )
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise invalid_cursor
+    if not isinstance(payload, dict) or not isinstance(payload.get("v"), list) or len(payload["v"]) != 2:
+        raise invalid_cursor
+    if payload.get("s") != sort_by or payload.get("o") != sort_order:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Курсор был выдан для другой сортировки"
+        )
+    return payload["v"]
+
+
+def apply_keyset(query, sort_expression, id_column, sort_order: str, cursor_values: Optional[List[Any]] = None):
+    """
+    Добавляет в запрос сортировку (sort_key, id) и, если передан курсор,
+    условие "строго после курсора". Сравнение кортежей использует составной
+    индекс (sort_key, id), поэтому страница N стоит столько же, сколько первая.
+    """
+    descending = sort_order == "DESC"
+    if cursor_values is not None:
+        row = tuple_(sort_expression, id_column)
+        query = query.where(row < tuple_(*cursor_values) if descending else row > tuple_(*cursor_values))
+    if descending:
+        return query.order_by(sort_expression.desc(), id_column.desc())
+    return query.order_by(sort_expression.asc(), id_column.asc())
+
+
+def build_next_cursor(items: list, limit: int, sort_by: str, sort_order: str, key: Callable[[Any], List[Any]]) -> Optional[str]:
+    """Возвращает курсор следующей страницы или None, если страница неполная"""
+    if not items or len(items) < limit:
+        return None
+    return encode_cursor(sort_by, sort_order, key(items[-1]))
@@ -1,11 +1,16 @@
 # src/photos/db.py
+from typing import Optional, Union
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
 from sqlalchemy.exc import IntegrityError
 from psycopg2.errors import UniqueViolation, ForeignKeyViolation, NotNullViolation, CheckViolation
 from src.photos.models import Photo
 from src.photos.schemas import PhotoCreate, PhotoUpdate, PhotoDelete
+from src.photos.utils import StagedUpload, StoredUpload, is_content_path, remove_photo_files
 from src.logger import log_db_operation
+from src.cache import response_cache, photo_tag, set_tag, minifigure_tag
 
 @log_db_operation
 def get_db_photos(db: Session, limit: int = 10, offset: int = 0) -> list[Photo]:
@@ -13,15 +18,54 @@ def get_db_photos(db: Session, limit: int = 10, offset: int = 0) -> list[Photo]:
     return photos
 
 @log_db_operation
-def create_db_photo(photo: PhotoCreate, db: Session) -> Photo:
+async def get_async_db_photos(db: AsyncSession, limit: int = 10, offset: int = 0) -> list[Photo]:
+    """Асинхронный вариант get_db_photos для эндпоинтов чтения"""
+    result = await db.execute(select(Photo).limit(limit).offset(offset))
+    return list(result.scalars().all())
+
+def _invalidate_photo_owner(photo: Photo) -> None:
+    # Фотографии входят в ответы наборов и минифигурок, которым принадлежат
+    tags = [photo_tag(photo.photo_id)]
+    if photo.set_id is not None:
+        tags.append(set_tag(photo.set_id))
+    if photo.minifigure_id is not None:
+        tags.append(minifigure_tag(photo.minifigure_id))
+    response_cache.invalidate(*tags)
+
+def _lock_photo_file(db: Session, photo_url: str) -> None:
+    # Размещение файла новой строкой и удаление файла последней ссылкой на него
+    # сериализуются блокировкой по пути до конца транзакции
+    db.execute(select(func.pg_advisory_xact_lock(func.hashtext(photo_url))))
+
+@log_db_operation
+def create_db_photo(photo: PhotoCreate, db: Session, staged: Optional[Union[StagedUpload, StoredUpload]] = None) -> Photo:
+    """
+    Создание фотографии. С staged (загруженный файл) строка вставляется и файл
+    занимает место по хешу в одной транзакции под блокировкой пути: если такой
+    файл уже есть, новая строка ссылается на него, и второй копии не появляется.
+    Для StoredUpload (файл уже загружен напрямую в хранилище) под той же
+    блокировкой проверяется, что файл ещё на месте.
+    """
     new_photo = Photo(**photo.dict())
     try:
         db.add(new_photo)
+        if staged is not None:
+            _lock_photo_file(db, photo.photo_url)
+            db.flush()
+            try:
+                staged.place()
+            except BaseException:
+                db.rollback()
+                staged.discard()
+                raise
         db.commit()
         db.refresh(new_photo)
+        _invalidate_photo_owner(new_photo)
         return new_photo
     except IntegrityError as e:
         db.rollback()
+        if staged is not None:
+            staged.discard()
         if isinstance(e.orig, UniqueViolation):
             raise HTTPException(status_code=400, detail="Check unique field failed")
         elif isinstance(e.orig, ForeignKeyViolation):
@@ -40,15 +84,31 @@ def get_db_one_photo(db: Session, photo_id: int) -> Photo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Photo with id {photo_id} was not found")
     return one_photo
 
+@log_db_operation
+async def get_async_db_one_photo(db: AsyncSession, photo_id: int) -> Photo:
+    """Асинхронный вариант get_db_one_photo для эндпоинтов чтения"""
+    one_photo = await db.get(Photo, photo_id)
+    if not one_photo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Photo with id {photo_id} was not found")
+    return one_photo
+
 @log_db_operation
 def update_db_photo(photo_id: int, photo_update: PhotoUpdate, db: Session) -> Photo:
     db_photo = get_db_one_photo(db, photo_id)
+    previous_url = db_photo.photo_url
     update_data = photo_update.dict(exclude_unset=True)
+    if 'photo_url' in update_data and update_data['photo_url'] != db_photo.photo_url:
+        # Варианты построены по прежнему оригиналу
+        update_data.update(thumbnail_url=None, medium_url=None, webp_url=None)
     for key, value in update_data.items():
         setattr(db_photo, key, value)
     try:
         db.commit()
         db.refresh(db_photo)
+        # Записи прежнего владельца помечены тегом фотографии, нового — тегом владельца
+        _invalidate_photo_owner(db_photo)
+        if db_photo.photo_url != previous_url:
+            release_db_photo_file(db, previous_url)
         return db_photo
     except IntegrityError as e:
         db.rollback()
@@ -63,9 +123,42 @@ def update_db_photo(photo_id: int, photo_update: PhotoUpdate, db: Session) -> Ph
         else:
             raise HTTPException(status_code=400, detail="Integrity error")
 
+@log_db_operation
+def set_db_photo_variants(db: Session, photo_id: int, photo_url: str, variant_urls: dict) -> bool:
+    """
+    Записывает пути вариантов фотографии, если её оригинал не сменился за время
+    обработки. Возвращает False, если фотографии нет или photo_url уже другой.
+    """
+    db_photo = db.query(Photo).filter(Photo.photo_id == photo_id).first()
+    if not db_photo or db_photo.photo_url != photo_url:
+        return False
+    for column, url in variant_urls.items():
+        setattr(db_photo, column, url)
+    db.commit()
+    _invalidate_photo_owner(db_photo)
+    return True
+
+@log_db_operation
+def release_db_photo_file(db: Session, photo_url: str) -> bool:
+    """
+    Удаляет файл из хранилища по содержимому (с вариантами), если на него больше
+    не ссылается ни одна фотография. Вызывается после commit удаления или замены.
+    """
+    if not is_content_path(photo_url):
+        return False
+    _lock_photo_file(db, photo_url)
+    references = db.query(func.count(Photo.photo_id)).filter(Photo.photo_url == photo_url).scalar()
+    if references == 0:
+        remove_photo_files(photo_url)
+    db.commit()
+    return references == 0
+
 @log_db_operation
 def delete_db_photo(photo_delete: PhotoDelete, db: Session) -> dict:
     db_photo = get_db_one_photo(db, photo_delete.photo_id)
+    photo_url = db_photo.photo_url
     db.delete(db_photo)
     db.commit()
+    response_cache.invalidate(photo_tag(photo_delete.photo_id))
+    release_db_photo_file(db, photo_url)
     return {"message": f"Photo with id {photo_delete.photo_id} deleted successfully"}
\ No newline at end of file
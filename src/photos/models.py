@@ -7,9 +7,15 @@ class Photo(Base):
     __tablename__ = "photos"
 
     photo_id = Column(Integer, primary_key=True, index=True)
-    set_id = Column(Integer, ForeignKey("sets.set_id", ondelete="CASCADE"), nullable=True)
-    minifigure_id = Column(String, ForeignKey("minifigures.minifigure_id", ondelete="CASCADE"), nullable=True)
-    photo_url = Column(String, nullable=False)
+    # Индексы нужны для пакетной загрузки фотографий по IN (set_id / minifigure_id)
+    set_id = Column(Integer, ForeignKey("sets.set_id", ondelete="CASCADE"), nullable=True, index=True)
+    minifigure_id = Column(String, ForeignKey("minifigures.minifigure_id", ondelete="CASCADE"), nullable=True, index=True)
+    # Индекс для подсчёта ссылок на файл в хранилище по содержимому (release_db_photo_file)
+    photo_url = Column(String, nullable=False, index=True)
+    # WebP-варианты оригинала (src/photos/variants.py); пусты, пока задача их не построила
+    thumbnail_url = Column(String, nullable=True)
+    medium_url = Column(String, nullable=True)
+    webp_url = Column(String, nullable=True)
     is_main = Column(Boolean, default=False)
 
     # Связи для фотографий, которые относятся к наборам или минифигуркам
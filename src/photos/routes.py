@@ -1,27 +1,52 @@
 # src/photos/routes.py
-from fastapi import status, HTTPException, Depends, APIRouter, Form, UploadFile, File
+from fastapi import status, HTTPException, Depends, APIRouter, Form, UploadFile, File, Header, Response
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import shutil
 import os
+import stat
 from pathlib import Path
-from src.photos.schemas import PhotoCreate, PhotoResponse, PhotoUpdate, PhotoDelete, PhotoUploadData
-from src.database import get_db
+from src.photos.schemas import (
+    PhotoCreate, PhotoResponse, PhotoUpdate, PhotoDelete, PhotoUploadData,
+    PhotoUploadUrlRequest, PhotoUploadUrl, PhotoUploadComplete
+)
+from src.database import get_db, get_async_db
 from src.photos.db import (
     get_db_photos,
+    get_async_db_photos,
     create_db_photo,
     get_db_one_photo,
+    get_async_db_one_photo,
     update_db_photo,
     delete_db_photo
 )
-from src.photos.utils import save_uploaded_file
-from src.users.utils import get_current_active_user
+from src.photos.utils import (
+    stage_uploaded_file,
+    direct_upload_key,
+    check_stored_upload,
+    photo_cache_headers
+)
+from src.cache import etag_matches
+from src.photos.storage import photo_storage
+from src.config import settings
+from src.photos.tasks import generate_photo_variants
+from src.users.utils import get_current_active_principal
 from src.logger import app_logger
 
+def enqueue_photo_variants(photo_id: int) -> None:
+    """Ставит построение вариантов фотографии в очередь; без брокера фото отдаётся оригиналом"""
+    try:
+        generate_photo_variants.delay(photo_id)
+    except Exception as e:
+        app_logger.warning(f"Не удалось поставить построение вариантов фото {photo_id}: {e}")
+
 router = APIRouter(
     prefix="/photos",
     tags=["Photos"],
-    dependencies=[Depends(get_current_active_user)]
+    dependencies=[Depends(get_current_active_principal)]
 )
 
 
@@ -37,8 +62,9 @@ async def upload_photo(
     data: PhotoUploadData = Depends(),
     db: Session = Depends(get_db)
 ):
-    # Сохраняем файл и получаем относительный путь
-    relative_path = await save_uploaded_file(file)
+    # Принимаем файл; путь определяется хешем содержимого
+    staged = await stage_uploaded_file(file)
+    relative_path = staged.relative_path
     
     # Создаем запись в БД
     photo_data = PhotoCreate(
@@ -48,9 +74,65 @@ async def upload_photo(
         is_main=data.is_main
     )
     
-    # Сохраняем в БД
-    new_photo = create_db_photo(photo_data, db)
+    # Сохраняем в БД; файл занимает место по хешу (или переиспользуется) в той же транзакции.
+    # Блокировка пути и перенос файла в хранилище (до 20 МБ в S3) блокируют поток,
+    # поэтому выполняются в пуле потоков, а не в event loop
+    new_photo = await run_in_threadpool(create_db_photo, photo_data, db, staged)
     app_logger.info(f"Загружено фото: {relative_path} (set_id={data.set_id}, minifigure_id={data.minifigure_id})")
+    # Публикация в брокер тоже блокирующая
+    await run_in_threadpool(enqueue_photo_variants, new_photo.photo_id)
+    return new_photo
+
+@router.post(
+    "/upload-url/",
+    status_code=200,
+    response_model=PhotoUploadUrl,
+    summary="Получить URL для прямой загрузки фотографии",
+    description="Выдаёт presigned URL загрузки файла напрямую в хранилище (S3), минуя API. "
+                "Если файл с таким SHA-256 уже есть, upload_url пуст и загружать ничего не нужно. "
+                "После загрузки вызовите POST /photos/upload-complete/"
+)
+def get_photo_upload_url(request: PhotoUploadUrlRequest):
+    max_bytes = settings.PHOTO_UPLOAD_MAX_BYTES
+    if request.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Размер файла превышает {max_bytes // (1024 * 1024)} МБ")
+    relative_path = direct_upload_key(request.sha256, request.content_type)
+    if photo_storage.exists(relative_path):
+        app_logger.info(f"Файл {relative_path} уже в хранилище, загрузка не нужна")
+        return PhotoUploadUrl(photo_url=relative_path)
+    upload = photo_storage.presigned_upload(relative_path, request.content_type, request.size, request.sha256)
+    if upload is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Прямая загрузка недоступна для локального хранилища, используйте POST /photos/upload/"
+        )
+    app_logger.info(f"Выдан URL прямой загрузки для {relative_path} ({request.size} байт)")
+    return PhotoUploadUrl(
+        photo_url=relative_path,
+        upload_url=upload["url"],
+        method=upload["method"],
+        headers=upload["headers"],
+        expires_in=upload["expires_in"]
+    )
+
+@router.post(
+    "/upload-complete/",
+    status_code=status.HTTP_201_CREATED,
+    response_model=PhotoResponse,
+    summary="Завершить прямую загрузку фотографии",
+    description="Проверяет файл, загруженный по URL из POST /photos/upload-url/, и создает запись в базе данных"
+)
+def complete_photo_upload(data: PhotoUploadComplete, db: Session = Depends(get_db)):
+    stored = check_stored_upload(data.photo_url)
+    photo_data = PhotoCreate(
+        photo_url=data.photo_url,
+        set_id=data.set_id,
+        minifigure_id=data.minifigure_id,
+        is_main=data.is_main
+    )
+    new_photo = create_db_photo(photo_data, db, stored)
+    app_logger.info(f"Загружено фото напрямую: {data.photo_url} (set_id={data.set_id}, minifigure_id={data.minifigure_id})")
+    enqueue_photo_variants(new_photo.photo_id)
     return new_photo
 
 @router.get(
@@ -61,11 +143,11 @@ async def upload_photo(
     description="Возвращает список всех фотографий с возможностью пагинации"
 )
 async def get_photos(
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     limit: int = 10, 
     offset: int = 0
 ):
-    photos = get_db_photos(db, limit, offset)
+    photos = await get_async_db_photos(db, limit, offset)
     app_logger.info(f"Получено {len(photos)} фото (limit={limit}, offset={offset})")
     return photos
 
@@ -88,8 +170,8 @@ async def create_photo(photo: PhotoCreate, db: Session = Depends(get_db)):
     summary="Получить фотографию по ID",
     description="Возвращает информацию о конкретной фотографии по ее ID"
 )
-async def get_one_photo(photo_id: int, db: Session = Depends(get_db)):
-    photo = get_db_one_photo(db, photo_id)
+async def get_one_photo(photo_id: int, db: AsyncSession = Depends(get_async_db)):
+    photo = await get_async_db_one_photo(db, photo_id)
     app_logger.info(f"Получено фото ID: {photo_id}")
     return photo
 
@@ -103,6 +185,8 @@ async def get_one_photo(photo_id: int, db: Session = Depends(get_db)):
 async def update_photo(photo_id: int, photo_update: PhotoUpdate, db: Session = Depends(get_db)):
     updated_photo = update_db_photo(photo_id, photo_update, db)
     app_logger.info(f"Обновлено фото ID: {photo_id}")
+    if photo_update.photo_url is not None and updated_photo.thumbnail_url is None:
+        enqueue_photo_variants(photo_id)
     return updated_photo
 
 @router.delete(
@@ -114,4 +198,33 @@ async def update_photo(photo_id: int, photo_update: PhotoUpdate, db: Session = D
 async def delete_photo(photo_delete: PhotoDelete, db: Session = Depends(get_db)):
     result = delete_db_photo(photo_delete, db)
     app_logger.info(f"Удалено фото ID: {photo_delete.photo_id}")
-    return result
\ No newline at end of file
+    return result
+
+
+# Раздача файлов локального хранилища (PHOTO_STORAGE=local), без авторизации
+static_router = APIRouter(prefix="/static", tags=["Static"])
+
+@static_router.api_route("/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def get_static_file(file_path: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Файлы с именами по содержимому отдаются с Cache-Control immutable и ETag из
+    хеша: повторная загрузка не доходит до сервера, а при проверке (If-None-Match)
+    получает 304 без тела. Range обрабатывает FileResponse (206, If-Range по ETag;
+    Starlette >= 0.39). Под uvicorn файл отдаётся блоками, без sendfile.
+    """
+    path = photo_storage.resolve(file_path)
+    # Временные файлы загрузок (.<uuid>.part) не отдаются
+    if path is None or path.name.startswith("."):
+        raise HTTPException(status_code=404, detail="Not Found")
+    try:
+        stat_result = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    etag, cache_control = photo_cache_headers(file_path, stat_result)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, headers=headers, stat_result=stat_result)
@@ -1,7 +1,7 @@
 # src/Photo/schemas.py
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional
-from src.config import settings
+from typing import Dict, Literal, Optional
+from src.photos.storage import photo_storage
 
 class PhotoBase(BaseModel):
     set_id: Optional[int] = Field(None, description="ID набора LEGO, к которому относится фото", example=75968)
@@ -21,13 +21,18 @@ class PhotoUpdate(BaseModel):
 
 class PhotoResponse(PhotoBase):
     photo_id: int = Field(..., description="Уникальный идентификатор фотографии")
+    thumbnail_url: Optional[str] = Field(None, description="Миниатюра WebP (до 320px) для сеток каталога")
+    medium_url: Optional[str] = Field(None, description="WebP среднего размера (до 1024px)")
+    webp_url: Optional[str] = Field(None, description="WebP в полном размере")
 
-    @field_validator("photo_url", mode="before")
+    @field_validator("photo_url", "thumbnail_url", "medium_url", "webp_url", mode="before")
     @classmethod
     def make_absolute_url(cls, value):
-        # Преобразуем относительный путь в абсолютный URL используя BASE_URL из настроек
-        base_url = settings.BASE_URL
-        return f"{base_url}/api/static/{value}"
+        # Варианты появляются после фоновой обработки, до этого их нет
+        if value is None:
+            return None
+        # Преобразуем путь в хранилище в абсолютный URL (/api/static или бакет/CDN)
+        return photo_storage.public_url(value)
     
     class Config:
         from_attributes = True
@@ -38,4 +43,19 @@ class PhotoDelete(BaseModel):
 class PhotoUploadData(BaseModel):
     set_id: Optional[int] = Field(None, description="ID набора LEGO (оставьте пустым если не связано с набором)")
     minifigure_id: Optional[str] = Field(None, description="ID минифигурки LEGO (оставьте пустым если не связано с минифигуркой)")
-    is_main: bool = Field(False, description="Является ли фото основным")
\ No newline at end of file
+    is_main: bool = Field(False, description="Является ли фото основным")
+
+class PhotoUploadUrlRequest(BaseModel):
+    sha256: str = Field(..., pattern=r"^[0-9a-f]{64}$", description="SHA-256 содержимого файла (hex, нижний регистр)")
+    size: int = Field(..., gt=0, description="Размер файла в байтах")
+    content_type: Literal["image/jpeg", "image/png", "image/gif", "image/webp"] = Field(..., description="MIME-тип изображения")
+
+class PhotoUploadUrl(BaseModel):
+    photo_url: str = Field(..., description="Путь файла в хранилище; передаётся в POST /photos/upload-complete/")
+    upload_url: Optional[str] = Field(None, description="Presigned URL загрузки; пусто, если такой файл уже в хранилище")
+    method: Optional[str] = Field(None, description="HTTP-метод загрузки")
+    headers: Dict[str, str] = Field(default_factory=dict, description="Заголовки, обязательные при загрузке")
+    expires_in: Optional[int] = Field(None, description="Срок действия upload_url, с")
+
+class PhotoUploadComplete(PhotoUploadData):
+    photo_url: str = Field(..., description="Путь файла из ответа POST /photos/upload-url/")
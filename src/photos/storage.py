@@ -0,0 +1,218 @@
+# src/photos/storage.py
+import base64
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from src.config import settings
+from src.logger import app_logger
+
+# Хранилище файлов фотографий. Ключ файла — относительный путь
+# (photos/ab/cd/<sha256>.jpg), он же хранится в Photo.photo_url.
+#
+# LocalPhotoStorage — каталог static: файлы раздаёт сам API (/api/static), а API
+# и воркерам Celery нужен общий том. S3PhotoStorage — S3-совместимый бакет (AWS,
+# MinIO): файлы раздаёт бакет или CDN перед ним, клиенты загружают их напрямую
+# по presigned URL (POST /photos/upload-url/), общий том не нужен.
+# Драйвер выбирается настройкой PHOTO_STORAGE.
+
+# Файлы в хранилище лежат под путями по содержимому и под своим именем не меняются
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+
+
+class LocalPhotoStorage:
+    """Файлы в локальном каталоге, раздаются через /api/static"""
+
+    def __init__(self, root: Path, base_url: str):
+        self.root = root
+        self.base_url = base_url
+
+    def staging_dir(self) -> Path:
+        # Временные файлы в той же файловой системе, что и итоговые (rename атомарен)
+        path = self.root / "photos"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def resolve(self, key: str) -> Optional[Path]:
+        """Путь файла по ключу; None, если ключ указывает за пределы каталога"""
+        root = self.root.resolve()
+        path = (root / key).resolve()
+        return path if root in path.parents else None
+
+    def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return (self.root / key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def read_head(self, key: str, length: int) -> bytes:
+        with open(self.root / key, "rb") as file:
+            return file.read(length)
+
+    def put_file(self, local_path: Path, key: str, content_type: str) -> None:
+        """Переносит локальный файл в хранилище под ключом key (исходный файл забирается)"""
+        target = self.root / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(local_path, target)
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[Path]:
+        yield self.root / key
+
+    def delete(self, key: str) -> None:
+        (self.root / key).unlink(missing_ok=True)
+
+    def public_url(self, key: str) -> str:
+        return f"{self.base_url}/api/static/{key}"
+
+    def presigned_upload(self, key: str, content_type: str, size: int, sha256: str) -> Optional[Dict]:
+        # Прямой загрузки в локальный каталог нет, только через POST /photos/upload/
+        return None
+
+
+class S3PhotoStorage:
+    """Файлы в S3-совместимом бакете; загрузка клиентом напрямую по presigned URL"""
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        public_url: Optional[str] = None,
+        upload_url_expires: int = 600,
+    ):
+        # boto3 нужен только этому драйверу
+        try:
+            import boto3
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError as exc:
+            raise RuntimeError("Для PHOTO_STORAGE=s3 нужен пакет boto3") from exc
+
+        self.bucket = bucket
+        self.upload_url_expires = upload_url_expires
+        self._client_error = ClientError
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=Config(signature_version="s3v4"),
+        )
+        base = public_url or f"{endpoint_url or 'https://s3.amazonaws.com'}/{bucket}"
+        self.public_base = base.rstrip("/")
+
+    def staging_dir(self) -> Path:
+        return Path(tempfile.gettempdir())
+
+    def _head(self, key: str) -> Optional[Dict]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except self._client_error as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def size(self, key: str) -> Optional[int]:
+        head = self._head(key)
+        return None if head is None else head["ContentLength"]
+
+    def read_head(self, key: str, length: int) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{length - 1}")
+        return response["Body"].read()
+
+    def put_file(self, local_path: Path, key: str, content_type: str) -> None:
+        """Загружает локальный файл в бакет под ключом key и удаляет локальный файл"""
+        try:
+            self.client.upload_file(
+                str(local_path), self.bucket, key,
+                ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL}
+            )
+        finally:
+            local_path.unlink(missing_ok=True)
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[Path]:
+        """Временная локальная копия объекта (для построения вариантов)"""
+        path = self.staging_dir() / f"{uuid.uuid4().hex}-{Path(key).name}"
+        try:
+            self.client.download_file(self.bucket, key, str(path))
+            yield path
+        finally:
+            path.unlink(missing_ok=True)
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def public_url(self, key: str) -> str:
+        return f"{self.public_base}/{key}"
+
+    def presigned_upload(self, key: str, content_type: str, size: int, sha256: str) -> Optional[Dict]:
+        """
+        Presigned PUT для загрузки клиентом напрямую в бакет. Тип, размер и
+        контрольная сумма SHA-256 входят в подпись: S3 отклонит файл с другим
+        содержимым, поэтому ключ по хешу остаётся верным без проверки на API.
+        """
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode("ascii")
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": key,
+                "ContentType": content_type,
+                "ContentLength": size,
+                "CacheControl": IMMUTABLE_CACHE_CONTROL,
+                "ChecksumSHA256": checksum,
+            },
+            ExpiresIn=self.upload_url_expires,
+        )
+        return {
+            "url": url,
+            "method": "PUT",
+            "headers": {
+                "Content-Type": content_type,
+                "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+                "x-amz-checksum-sha256": checksum,
+            },
+            "expires_in": self.upload_url_expires,
+        }
+
+
+def _create_storage():
+    if settings.PHOTO_STORAGE == "s3":
+        if not settings.PHOTO_S3_BUCKET:
+            raise RuntimeError("Для PHOTO_STORAGE=s3 нужно задать PHOTO_S3_BUCKET")
+        app_logger.info(f"Фотографии хранятся в S3-бакете {settings.PHOTO_S3_BUCKET}")
+        # Пустые переменные окружения (docker-compose) — то же, что незаданные
+        return S3PhotoStorage(
+            bucket=settings.PHOTO_S3_BUCKET,
+            endpoint_url=settings.PHOTO_S3_ENDPOINT_URL or None,
+            region=settings.PHOTO_S3_REGION or None,
+            access_key=settings.PHOTO_S3_ACCESS_KEY or None,
+            secret_key=settings.PHOTO_S3_SECRET_KEY or None,
+            public_url=settings.PHOTO_S3_PUBLIC_URL or None,
+            upload_url_expires=settings.PHOTO_UPLOAD_URL_EXPIRES_SECONDS,
+        )
+    return LocalPhotoStorage(Path("static"), settings.BASE_URL)
+
+
+photo_storage = _create_storage()
@@ -0,0 +1,37 @@
+# src/photos/tasks.py
+from src.database import SessionLocal
+from src.photos.models import Photo
+from src.photos.db import set_db_photo_variants, release_db_photo_file
+from src.photos.storage import photo_storage
+from src.photos.variants import build_photo_variants
+from src.logger import app_logger
+from src.celery_app import celery_app
+
+@celery_app.task(name='src.photos.tasks.generate_photo_variants')
+def generate_photo_variants(photo_id: int):
+    """
+    Фоновая задача построения WebP-вариантов фотографии (thumbnail, medium, webp).
+    Выполняется в процессах воркера Celery, не занимая процессор API.
+    """
+    db = SessionLocal()
+    try:
+        photo_url = db.query(Photo.photo_url).filter(Photo.photo_id == photo_id).scalar()
+        if photo_url is None:
+            app_logger.warning(f"Фотография {photo_id} не найдена, варианты не построены")
+            return
+        if not photo_storage.exists(photo_url):
+            # Внешний URL или файл вне хранилища — строить не из чего
+            app_logger.info(f"Оригинал фотографии {photo_id} ({photo_url}) не найден в хранилище, варианты не построены")
+            return
+        # Обработка изображения не держит соединение с базой
+        db.rollback()
+        variant_urls = build_photo_variants(photo_url)
+        if not set_db_photo_variants(db, photo_id, photo_url, variant_urls):
+            app_logger.info(f"Фотография {photo_id} удалена или заменена во время обработки, варианты не записаны")
+            # Если ссылок на файл больше нет, только что построенные варианты тоже не нужны
+            release_db_photo_file(db, photo_url)
+    except Exception as e:
+        app_logger.error(f"Ошибка построения вариантов фотографии {photo_id}: {e}")
+        raise
+    finally:
+        db.close()
@@ -1,42 +1,187 @@
 from fastapi import HTTPException, UploadFile
-import shutil
+import hashlib
 import os
+import posixpath
+import re
+import uuid
 from pathlib import Path
-import time
+from typing import List, Optional, Tuple
 import aiofiles
+from src.config import settings
 from src.logger import app_logger
+from src.photos.storage import CONTENT_TYPES, IMMUTABLE_CACHE_CONTROL, photo_storage
 
-def get_unique_filename(filename: str) -> str:
-    """Создает уникальное имя файла, добавляя метку времени"""
-    name, ext = os.path.splitext(filename)
-    timestamp = int(time.time())
-    unique = f"{name}_{timestamp}{ext}"
-    app_logger.info(f"Сгенерировано уникальное имя файла: {unique}")
-    return unique
-
-async def save_uploaded_file(file: UploadFile, folder: str = "photos") -> str:
-    """Сохраняет загруженный файл на диск и возвращает относительный путь для БД"""
-    # Проверяем, что файл - изображение
-    if not file.content_type.startswith("image/"):
-        app_logger.warning(f"Попытка загрузить не изображение: {file.filename}")
-        raise HTTPException(status_code=400, detail="Загружаемый файл должен быть изображением")
-    
-    # Создаем уникальное имя файла
-    unique_filename = get_unique_filename(file.filename)
+# Загруженные фотографии хранятся по содержимому: photos/ab/cd/<sha256><ext>,
+# где ab и cd — первые байты хеша (чтобы в одном каталоге не копились сотни тысяч
+# файлов). Одинаковые изображения занимают один файл, на который ссылаются несколько
+# строк Photo; файл удаляется вместе с последней ссылкой (release_db_photo_file).
+# Где лежат файлы (локальный каталог или S3), решает photo_storage (src/photos/storage.py).
+CONTENT_PATH_RE = re.compile(r"^photos/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z]+$")
+# Оригинал или его вариант: имя (хеш и суффикс варианта) однозначно задаёт содержимое
+IMMUTABLE_PATH_RE = re.compile(r"^photos/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}(?:_[a-z]+)?)\.[a-z]+$")
+
+def content_path(digest: str, extension: str, folder: str = "photos") -> str:
+    """Относительный путь файла по SHA-256 содержимого"""
+    return f"{folder}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+def is_content_path(relative_path: str) -> bool:
+    """Путь из хранилища по содержимому (а не внешний URL или старое имя с меткой времени)"""
+    return CONTENT_PATH_RE.match(relative_path) is not None
+
+# Варианты фотографии (src/photos/variants.py) -> (колонка Photo, наибольшая сторона
+# в пикселях; None — без уменьшения). Файлы лежат рядом с оригиналом: <имя>_<вариант>.webp
+PHOTO_VARIANTS = {
+    "thumbnail": ("thumbnail_url", 320),
+    "medium": ("medium_url", 1024),
+    "full": ("webp_url", None),
+}
+
+def variant_key(relative_path: str, name: str) -> str:
+    return f"{posixpath.splitext(relative_path)[0]}_{name}.webp"
+
+def variant_keys(relative_path: str) -> List[str]:
+    return [variant_key(relative_path, name) for name in PHOTO_VARIANTS]
+
+class StoredUpload:
+    """Файл, загруженный клиентом напрямую в хранилище по presigned URL"""
+
+    def __init__(self, relative_path: str):
+        self.relative_path = relative_path
+
+    def place(self) -> bool:
+        # Под блокировкой пути проверяем, что файл не удалён вместе с последней ссылкой
+        if not photo_storage.exists(self.relative_path):
+            raise HTTPException(status_code=400, detail="Файл не найден в хранилище, загрузите его повторно")
+        return False
+
+    def discard(self) -> None:
+        pass
+
+class StagedUpload:
+    """Полностью принятый файл во временном файле, ещё не в хранилище"""
+
+    def __init__(self, temp_path: Path, relative_path: str, size: int):
+        self.temp_path = temp_path
+        self.relative_path = relative_path
+        self.size = size
+
+    def place(self) -> bool:
+        """
+        Переносит файл в хранилище; если такой файл уже есть (то же содержимое),
+        временный файл удаляется. Возвращает True, если файл записан впервые.
+        """
+        if photo_storage.exists(self.relative_path):
+            self.temp_path.unlink(missing_ok=True)
+            return False
+        content_type = CONTENT_TYPES[posixpath.splitext(self.relative_path)[1]]
+        photo_storage.put_file(self.temp_path, self.relative_path, content_type)
+        return True
+
+    def discard(self) -> None:
+        self.temp_path.unlink(missing_ok=True)
+
+# Сигнатуры (magic bytes) поддерживаемых изображений -> расширение файла.
+# Тип определяется по содержимому, content_type и расширение от клиента не учитываются.
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+def sniff_image_extension(header: bytes) -> Optional[str]:
+    """Расширение по первым байтам файла; None, если это не поддерживаемое изображение"""
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    # WebP: контейнер RIFF с типом WEBP
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+async def stage_uploaded_file(file: UploadFile, folder: str = "photos") -> StagedUpload:
+    """
+    Принимает загруженный файл во временный файл, считая SHA-256 по ходу записи.
+    Файл копируется блоками PHOTO_UPLOAD_CHUNK_SIZE, поэтому в памяти одновременно
+    не больше одного блока. На итоговое место (по хешу) его переносит StagedUpload.place().
+    К этому моменту Starlette уже принял всё тело запроса: слишком большие загрузки
+    обрывает раньше UploadSizeLimitMiddleware, здесь — точная проверка размера файла.
+    """
+    chunk_size = settings.PHOTO_UPLOAD_CHUNK_SIZE
+    max_bytes = settings.PHOTO_UPLOAD_MAX_BYTES
     
-    # Путь для сохранения файла
-    upload_folder = Path("static") / folder
-    upload_folder.mkdir(parents=True, exist_ok=True)
+    # Проверяем по сигнатуре, что файл - изображение
+    first_chunk = await file.read(chunk_size)
+    extension = sniff_image_extension(first_chunk)
+    if extension is None:
+        app_logger.warning(f"Попытка загрузить не изображение: {file.filename}")
+        raise HTTPException(status_code=400, detail="Загружаемый файл должен быть изображением (JPEG, PNG, GIF или WebP)")
     
-    # Полный путь к файлу
-    file_path = upload_folder / unique_filename
+    temp_path = photo_storage.staging_dir() / f".{uuid.uuid4().hex}.part"
     
-    # Сохраняем файл асинхронно
-    async with aiofiles.open(file_path, "wb") as buffer:
-        content = await file.read()
-        await buffer.write(content)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            chunk = first_chunk
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    app_logger.warning(f"Файл {file.filename} превышает {max_bytes} байт, загрузка прервана")
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Размер файла превышает {max_bytes // (1024 * 1024)} МБ"
+                    )
+                digest.update(chunk)
+                await buffer.write(chunk)
+                chunk = await file.read(chunk_size)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
     
-    # Относительный путь для БД
-    relative_path = f"{folder}/{unique_filename}"
-    app_logger.info(f"Файл {file.filename} сохранён как {relative_path}")
-    return relative_path
+    relative_path = content_path(digest.hexdigest(), extension, folder)
+    app_logger.info(f"Файл {file.filename} принят ({size} байт), путь по содержимому {relative_path}")
+    return StagedUpload(temp_path=temp_path, relative_path=relative_path, size=size)
+
+def direct_upload_key(sha256: str, content_type: str, folder: str = "photos") -> str:
+    """Путь по содержимому для прямой загрузки: хеш и тип файла сообщает клиент"""
+    extension = next(ext for ext, value in CONTENT_TYPES.items() if value == content_type)
+    return content_path(sha256, extension, folder)
+
+def check_stored_upload(relative_path: str) -> StoredUpload:
+    """
+    Проверяет файл, загруженный напрямую в хранилище: путь по содержимому, размер
+    и сигнатура изображения. Файл, не прошедший проверку, удаляется — файл с тем же
+    содержимым (тем же путём) прошёл бы проверку так же, поэтому ссылок на него нет.
+    """
+    if not is_content_path(relative_path):
+        raise HTTPException(status_code=400, detail="Некорректный путь загруженного файла")
+    size = photo_storage.size(relative_path)
+    if size is None:
+        raise HTTPException(status_code=400, detail="Файл не найден в хранилище, загрузите его повторно")
+    max_bytes = settings.PHOTO_UPLOAD_MAX_BYTES
+    if size > max_bytes:
+        photo_storage.delete(relative_path)
+        raise HTTPException(status_code=413, detail=f"Размер файла превышает {max_bytes // (1024 * 1024)} МБ")
+    extension = sniff_image_extension(photo_storage.read_head(relative_path, 16))
+    if extension != posixpath.splitext(relative_path)[1]:
+        photo_storage.delete(relative_path)
+        app_logger.warning(f"Загруженный напрямую файл {relative_path} не является изображением заявленного типа")
+        raise HTTPException(status_code=400, detail="Загружаемый файл должен быть изображением (JPEG, PNG, GIF или WebP)")
+    return StoredUpload(relative_path)
+
+def photo_cache_headers(relative_path: str, stat_result: os.stat_result) -> Tuple[str, str]:
+    """ETag и Cache-Control для файла локального хранилища"""
+    match = IMMUTABLE_PATH_RE.match(relative_path)
+    if match:
+        # Имя по содержимому: ETag из хеша без чтения файла, кэшировать навсегда
+        return f'"{match.group(1)}"', IMMUTABLE_CACHE_CONTROL
+    # Старые имена (с меткой времени) теоретически можно перезаписать: ETag по mtime
+    # и размеру, клиент переспрашивает сервер и получает 304 без тела
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"', "public, no-cache"
+
+def remove_photo_files(relative_path: str) -> None:
+    """Удаляет файл из хранилища по содержимому вместе с его вариантами"""
+    for key in [relative_path, *variant_keys(relative_path)]:
+        photo_storage.delete(key)
+    app_logger.info(f"Удалён файл без ссылок: {relative_path}")
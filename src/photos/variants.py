@@ -0,0 +1,59 @@
+# src/photos/variants.py
+import uuid
+from typing import Dict
+
+from PIL import Image, ImageOps
+
+from src.photos.storage import photo_storage
+from src.photos.utils import PHOTO_VARIANTS, is_content_path, variant_key
+from src.logger import app_logger
+
+# Производные изображения фотографии (строятся задачей generate_photo_variants).
+#
+# Для каждой загруженной фотографии сохраняются WebP-варианты: thumbnail для
+# сеток каталога, medium для карточек и full (webp_url) — полный размер. Оригинал
+# остаётся в photo_url как запасной вариант для клиентов без WebP.
+# Файлы лежат в хранилище рядом с оригиналом: photos/ab/cd/<sha256>_<вариант>.webp.
+# Для файлов из хранилища по содержимому готовые варианты не пересобираются:
+# повторная загрузка того же изображения не тратит на них процессор.
+
+WEBP_QUALITY = 80
+
+
+def _store(image: Image.Image, key: str) -> None:
+    # Вариант пишется во временный файл и целиком переносится в хранилище
+    temp_path = photo_storage.staging_dir() / f".{uuid.uuid4().hex}.part"
+    try:
+        image.save(temp_path, format="WEBP", quality=WEBP_QUALITY, method=4)
+        photo_storage.put_file(temp_path, key, "image/webp")
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def build_photo_variants(photo_url: str) -> Dict[str, str]:
+    """
+    Строит варианты фотографии по пути оригинала в хранилище (photos/ab/cd/<hash>.jpg).
+    Возвращает {колонка Photo: путь варианта}.
+    """
+    keys = {name: variant_key(photo_url, name) for name in PHOTO_VARIANTS}
+    urls = {column: keys[name] for name, (column, _) in PHOTO_VARIANTS.items()}
+    if is_content_path(photo_url) and all(photo_storage.exists(key) for key in keys.values()):
+        app_logger.info(f"Варианты фотографии {photo_url} уже построены")
+        return urls
+
+    with photo_storage.local_copy(photo_url) as source, Image.open(source) as original:
+        # Поворот по EXIF, иначе снимки с телефона окажутся повёрнутыми
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        for name, (_, max_side) in PHOTO_VARIANTS.items():
+            variant = image
+            if max_side is not None and max(image.size) > max_side:
+                variant = image.copy()
+                variant.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            _store(variant, keys[name])
+
+    app_logger.info(f"Построены варианты фотографии {photo_url}: {', '.join(PHOTO_VARIANTS)}")
+    return urls
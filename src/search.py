@@ -0,0 +1,37 @@
+# src/search.py
+from sqlalchemy import Float, literal, or_
+
+# Поиск по каталогу построен на расширении pg_trgm и GIN-индексах gin_trgm_ops
+# (см. миграцию add_trigram_search). Оба условия ниже используют эти индексы:
+# ILIKE '%x%' — регистронезависимый поиск подстроки,
+# 'x' <% column — нечёткое совпадение по словам (опечатки), порог задаётся
+# параметром pg_trgm.word_similarity_threshold (по умолчанию 0.6).
+
+# Сортировка по релевантности доступна только при непустом поиске
+RELEVANCE_SORT = "relevance"
+
+
+def normalize_search(search: str | None) -> str:
+    """Обрезает пробелы; пустая строка означает отсутствие поиска"""
+    return (search or "").strip()
+
+
+def escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE, чтобы '%' и '_' в запросе искались буквально"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_condition(column, search: str):
+    """Условие поиска: подстрока без учёта регистра или похожее слово"""
+    return or_(
+        column.ilike(f"%{escape_like(search)}%", escape="\\"),
+        literal(search).op("<%")(column)
+    )
+
+
+def search_distance(column, search: str):
+    """
+    Расстояние до запроса (1 - word_similarity): чем меньше, тем релевантнее.
+    Сортировка по возрастанию ставит лучшие совпадения первыми.
+    """
+    return literal(search).op("<<->", return_type=Float)(column)
@@ -1,76 +1,165 @@
 # src/sets/db.py
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from psycopg2.errors import UniqueViolation, ForeignKeyViolation, NotNullViolation, CheckViolation
 from src.sets.models import Set, SetMinifigure
 from src.photos.models import Photo
 from src.tags.models import Tag, SetTag
+from src.tags.utils import parse_tag_names, check_tags_exist
 from src.sets.schemas import SetCreate, SetUpdate, SetDelete, SetMinifigureCreate, SetMinifigureDelete
 from typing import Optional, List
 from sqlalchemy.sql import func
-from sqlalchemy import distinct, case
+from sqlalchemy import distinct, case, select
 from src.logger import log_db_operation
+from src.cache import response_cache, set_tag
+from src.pagination import decode_cursor, apply_keyset
+from src.search import RELEVANCE_SORT, normalize_search, search_condition, search_distance
 
-@log_db_operation
-def get_db_sets(db: Session, limit: int = 10, offset: int = 0, search: str = "", tag_names: Optional[str] = "", tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None, min_piece_count: Optional[int] = None, max_piece_count: Optional[int] = None) -> list[Set]:
-    # Формируем базовый запрос с загрузкой связанных данных
-    query = db.query(Set).options(
-        joinedload(Set.face_photo),
-        joinedload(Set.tags),
-        # Загружаем все фотографии без предварительной сортировки в SQL
-        joinedload(Set.photos)
-    ).filter(Set.name.contains(search))
+# Выражения сортировки для курсорной пагинации по (sort_key, set_id)
+SET_SORT_COLUMNS = {
+    "set_id": Set.set_id,
+    "name": Set.name,
+    "price": Set.price,
+    "piece_count": Set.piece_count,
+    "release_year": Set.release_year,
+}
+
+def get_set_cursor_values(set_item: Set, sort_by: str) -> list:
+    """Значения (sort_key, set_id) записи для курсора следующей страницы"""
+    if sort_by == RELEVANCE_SORT:
+        # Релевантность не хранится в модели: её проставляет get_db_sets
+        return [set_item.page_sort_key, set_item.set_id]
+    return [getattr(set_item, sort_by), set_item.set_id]
+
+def _filter_sets_query(query, search: str, tags_list: Optional[List[str]], tag_logic: str, min_price: Optional[float], max_price: Optional[float], min_piece_count: Optional[int], max_piece_count: Optional[int]):
+    """Фильтры списка наборов: общие для страниц каталога и выборки участников турнира"""
+    if search:
+        query = query.where(search_condition(Set.search_text, search))
 
     # Применяем фильтрацию по цене
     if min_price is not None:
-        query = query.filter(Set.price >= min_price)
+        query = query.where(Set.price >= min_price)
     if max_price is not None:
-        query = query.filter(Set.price <= max_price)
+        query = query.where(Set.price <= max_price)
 
     # Применяем фильтрацию по количеству деталей
     if min_piece_count is not None:
-        query = query.filter(Set.piece_count >= min_piece_count)
+        query = query.where(Set.piece_count >= min_piece_count)
     if max_piece_count is not None:
-        query = query.filter(Set.piece_count <= max_piece_count)
-
-    # Обрабатываем фильтрацию по тегам
-    tags_list = []
-    if tag_names:
-        tags_list = [tag.strip() for tag in tag_names.split(",") if tag.strip()]
-        # Удаляем дубликаты из списка тегов
-        tags_list = list(set(tags_list))
-        
-        # Проверяем существование всех тегов
-        non_existent_tags = []
-        for tag_name in tags_list:
-            tag = db.query(Tag).filter(Tag.name == tag_name).first()
-            if not tag:
-                non_existent_tags.append(tag_name)
-        if non_existent_tags:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Теги с именами {', '.join(non_existent_tags)} не найдены"
-            )
-        
-        # Применяем фильтрацию по тегам
-        query = query.join(SetTag, Set.set_id == SetTag.set_id)\
-                     .join(Tag, SetTag.tag_id == Tag.tag_id)\
-                     .filter(Tag.name.in_(tags_list))
+        query = query.where(Set.piece_count <= max_piece_count)
+
+    # Применяем фильтрацию по тегам через подзапрос, чтобы основной запрос
+    # не дублировал строки (OR) и не требовал GROUP BY по наборам (AND)
+    if tags_list:
+        tagged_sets = select(SetTag.set_id)\
+            .join(Tag, SetTag.tag_id == Tag.tag_id)\
+            .where(Tag.name.in_(tags_list))
         if tag_logic == "AND":
             # Для AND возвращаем только наборы, содержащие все указанные теги
-            query = query.group_by(Set.set_id)\
-                         .having(func.count(distinct(Tag.name)) == len(tags_list))
+            tagged_sets = tagged_sets.group_by(SetTag.set_id)\
+                                     .having(func.count(distinct(Tag.name)) == len(tags_list))
         # Для OR не используем having, что возвращает наборы с хотя бы одним тегом
+        query = query.where(Set.set_id.in_(tagged_sets))
+    return query
 
-    # Применяем пагинацию
-    sets = query.limit(limit).offset(offset).all()
-    
-    # Сортируем фотографии для каждого набора, чтобы главная фотография была первой
-    for set_item in sets:
-        set_item.photos = sorted(set_item.photos, key=lambda photo: 0 if photo.is_main else 1)
-    
-    return sets
+def _build_set_ids_query(search: str = "", tags_list: Optional[List[str]] = None, tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None, min_piece_count: Optional[int] = None, max_piece_count: Optional[int] = None, sort_by: str = "set_id", sort_order: str = "ASC", cursor: Optional[str] = None):
+    """
+    Первая фаза выборки списка: только идентификаторы наборов страницы
+    с фильтрами и сортировкой (sort_key, set_id), без JOIN фотографий и тегов.
+    Общая для синхронной и асинхронной версий get_db_sets.
+    """
+    # Поиск по названию, теме и подтеме через триграммный индекс на search_text
+    search = normalize_search(search)
+    if sort_by == RELEVANCE_SORT:
+        sort_expression = search_distance(Set.search_text, search)
+    else:
+        sort_expression = SET_SORT_COLUMNS[sort_by]
+    query = select(Set.set_id, sort_expression.label("sort_key"))
+    query = _filter_sets_query(query, search, tags_list, tag_logic, min_price, max_price, min_piece_count, max_piece_count)
+
+    # Сортировка и условие курсора (keyset): страница N стоит столько же, сколько первая
+    cursor_values = decode_cursor(cursor, sort_by, sort_order) if cursor else None
+    return apply_keyset(query, sort_expression, Set.set_id, sort_order, cursor_values)
+
+def _hydrate_sets_query(set_ids: List[int]):
+    """
+    Вторая фаза: загрузка наборов страницы по идентификаторам.
+    Фотографии и теги подгружаются отдельным пакетным IN-запросом на каждую связь,
+    поэтому строки не размножаются (фото × теги). Главная фотография идёт первой
+    благодаря order_by у связи Set.photos.
+    """
+    return select(Set).options(
+        joinedload(Set.face_photo),
+        selectinload(Set.tags),
+        selectinload(Set.photos)
+    ).where(Set.set_id.in_(set_ids))
+
+def _order_by_ids(sets: List[Set], page_rows: list) -> List[Set]:
+    # Восстанавливаем порядок первой фазы: IN (...) порядок не гарантирует
+    sets_by_id = {set_item.set_id: set_item for set_item in sets}
+    ordered = []
+    for set_id, sort_key in page_rows:
+        if set_id in sets_by_id:
+            set_item = sets_by_id[set_id]
+            # Ключ сортировки из первой фазы нужен для курсора при сортировке по релевантности
+            set_item.page_sort_key = sort_key
+            ordered.append(set_item)
+    return ordered
+
+@log_db_operation
+def get_db_sets(db: Session, limit: int = 10, offset: int = 0, search: str = "", tag_names: Optional[str] = "", tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None, min_piece_count: Optional[int] = None, max_piece_count: Optional[int] = None, sort_by: str = "set_id", sort_order: str = "ASC", cursor: Optional[str] = None) -> list[Set]:
+    # Обрабатываем фильтрацию по тегам: проверяем существование всех тегов одним запросом
+    tags_list = parse_tag_names(tag_names)
+    if tags_list:
+        existing_names = db.execute(select(Tag.name).where(Tag.name.in_(tags_list))).scalars().all()
+        check_tags_exist(tags_list, existing_names)
+
+    query = _build_set_ids_query(search, tags_list, tag_logic, min_price, max_price, min_piece_count, max_piece_count, sort_by, sort_order, cursor)
+
+    # Применяем пагинацию: в режиме курсора offset не нужен
+    query = query.limit(limit) if cursor else query.limit(limit).offset(offset)
+    page_rows = db.execute(query).all()
+    if not page_rows:
+        return []
+    set_ids = [row.set_id for row in page_rows]
+
+    sets = db.execute(_hydrate_sets_query(set_ids)).scalars().all()
+    return _order_by_ids(sets, page_rows)
+
+@log_db_operation
+async def get_async_db_sets(db: AsyncSession, limit: int = 10, offset: int = 0, search: str = "", tag_names: Optional[str] = "", tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None, min_piece_count: Optional[int] = None, max_piece_count: Optional[int] = None, sort_by: str = "set_id", sort_order: str = "ASC", cursor: Optional[str] = None) -> list[Set]:
+    """Асинхронный вариант get_db_sets для эндпоинтов чтения"""
+    tags_list = parse_tag_names(tag_names)
+    if tags_list:
+        existing_names = (await db.execute(select(Tag.name).where(Tag.name.in_(tags_list)))).scalars().all()
+        check_tags_exist(tags_list, existing_names)
+
+    query = _build_set_ids_query(search, tags_list, tag_logic, min_price, max_price, min_piece_count, max_piece_count, sort_by, sort_order, cursor)
+
+    query = query.limit(limit) if cursor else query.limit(limit).offset(offset)
+    page_rows = (await db.execute(query)).all()
+    if not page_rows:
+        return []
+    set_ids = [row.set_id for row in page_rows]
+
+    sets = (await db.execute(_hydrate_sets_query(set_ids))).scalars().all()
+    return _order_by_ids(sets, page_rows)
+
+@log_db_operation
+def get_db_random_set_ids(db: Session, limit: int, search: str = "", tag_names: Optional[str] = "", tag_logic: str = "AND", min_price: Optional[float] = None, max_price: Optional[float] = None, min_piece_count: Optional[int] = None, max_piece_count: Optional[int] = None) -> List[int]:
+    """
+    Случайная выборка идентификаторов наборов с фильтрами каталога (ORDER BY random() LIMIT):
+    без загрузки объектов, фотографий и тегов
+    """
+    tags_list = parse_tag_names(tag_names)
+    if tags_list:
+        existing_names = db.execute(select(Tag.name).where(Tag.name.in_(tags_list))).scalars().all()
+        check_tags_exist(tags_list, existing_names)
+
+    query = _filter_sets_query(select(Set.set_id), normalize_search(search), tags_list, tag_logic, min_price, max_price, min_piece_count, max_piece_count)
+    return db.execute(query.order_by(func.random()).limit(limit)).scalars().all()
 
 @log_db_operation
 def create_db_set(set: SetCreate, db: Session) -> Set:
@@ -79,6 +168,8 @@ def create_db_set(set: SetCreate, db: Session) -> Set:
         db.add(new_set)
         db.commit()
         db.refresh(new_set)
+        # Новый набор может попасть в любой список наборов
+        response_cache.invalidate("sets")
         return db.query(Set).options(joinedload(Set.face_photo), joinedload(Set.photos)).filter(Set.set_id == new_set.set_id).first()
     except IntegrityError as e:
         db.rollback()
@@ -93,22 +184,27 @@ def create_db_set(set: SetCreate, db: Session) -> Set:
         else:
             raise HTTPException(status_code=400, detail="Integrity error")
 
+def _one_set_query(set_id: int):
+    # Фотографии и теги загружаются отдельными IN-запросами, главная фотография идёт первой
+    return _hydrate_sets_query([set_id])
+
 @log_db_operation
 def get_db_one_set(db: Session, set_id: int) -> Set:
-    # Используем joinedload для загрузки связанных фотографий и тегов одним запросом
-    one_set = db.query(Set).options(
-        joinedload(Set.face_photo),
-        joinedload(Set.tags),
-        # Загружаем все фотографии без предварительной сортировки в SQL
-        joinedload(Set.photos)
-    ).filter(Set.set_id == set_id).first()
+    one_set = db.execute(_one_set_query(set_id)).scalars().first()
     
     if not one_set:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Set with id {set_id} was not found")
     
-    # Сортируем фотографии, чтобы главная фотография была первой
-    one_set.photos = sorted(one_set.photos, key=lambda photo: 0 if photo.is_main else 1)
-    
+    return one_set
+
+@log_db_operation
+async def get_async_db_one_set(db: AsyncSession, set_id: int) -> Set:
+    """Асинхронный вариант get_db_one_set для эндпоинтов чтения"""
+    one_set = (await db.execute(_one_set_query(set_id))).scalars().first()
+
+    if not one_set:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Set with id {set_id} was not found")
+
     return one_set
 
 @log_db_operation
@@ -119,6 +215,8 @@ def update_db_set(set_id: int, set_update: SetUpdate, db: Session) -> Set:
         setattr(db_set, key, value)
     try:
         db.commit()
+        # Изменение полей может поменять состав и порядок любых списков
+        response_cache.invalidate("sets", set_tag(set_id))
         return db.query(Set).options(joinedload(Set.face_photo), joinedload(Set.photos)).filter(Set.set_id == set_id).first()
     except IntegrityError as e:
         db.rollback()
@@ -138,6 +236,7 @@ def delete_db_set(set_delete: SetDelete, db: Session) -> dict:
     db_set = get_db_one_set(db, set_delete.set_id)
     db.delete(db_set)
     db.commit()
+    response_cache.invalidate("sets", set_tag(set_delete.set_id))
     return {"message": f"Set with id {set_delete.set_id} deleted successfully"}
 
 # Операции для SetMinifigure
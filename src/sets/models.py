@@ -1,10 +1,19 @@
 # src/sets/models.py
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index, Computed
 from sqlalchemy.orm import relationship
 from src.database import Base
 
 class Set(Base):
     __tablename__ = "sets"
+    # Составные индексы (sort_key, set_id) для сортировки и курсорной пагинации
+    __table_args__ = (
+        Index("ix_sets_name_set_id", "name", "set_id"),
+        Index("ix_sets_price_set_id", "price", "set_id"),
+        Index("ix_sets_piece_count_set_id", "piece_count", "set_id"),
+        Index("ix_sets_release_year_set_id", "release_year", "set_id"),
+        # Триграммный индекс для регистронезависимого и нечёткого поиска
+        Index("ix_sets_search_text_trgm", "search_text", postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"}),
+    )
 
     set_id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -14,13 +23,17 @@ class Set(Base):
     sub_theme = Column(String, nullable=True)
     price = Column(Float, nullable=False)
     face_photo_id = Column(Integer, ForeignKey("photos.photo_id"), nullable=True)
+    # Текст для поиска: название, тема и подтема (вычисляется базой данных)
+    search_text = Column(String, Computed("name || ' ' || theme || ' ' || coalesce(sub_theme, '')", persisted=True))
 
     # Связь с фотографией
     face_photo = relationship("Photo", foreign_keys=[face_photo_id], back_populates="sets")
     # Связь с минифигурками через Set_Minifigures
     minifigures = relationship("Minifigure", secondary="set_minifigures", backref="sets")
     # Связь с фотографиями наборов
-    photos = relationship("Photo", back_populates="set", foreign_keys="Photo.set_id")
+    photos = relationship("Photo", back_populates="set", foreign_keys="Photo.set_id",
+                          # Главная фотография первой, затем в порядке добавления
+                          order_by="(Photo.is_main.desc().nullslast(), Photo.photo_id)")
     # Явная связь с тегами через set_tags
     tags = relationship("Tag", secondary="set_tags", back_populates="sets")
     # Связь с турнирами (наборы в турнирах)
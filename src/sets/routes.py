@@ -1,25 +1,32 @@
 # src/sets/routes.py
-from fastapi import status, HTTPException, Depends, APIRouter, Request, Form
+from fastapi import status, HTTPException, Depends, APIRouter, Request, Form, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 from src.sets.schemas import SetCreate, SetResponse, SetUpdate, SetDelete, SetMinifigureCreate, SetMinifigureResponse, SetMinifigureDelete, SetFilter
-from src.database import get_db
+from src.database import get_db, get_async_db
 from src.sets.db import (
     get_db_sets,
+    get_async_db_sets,
+    get_set_cursor_values,
     create_db_set,
     get_db_one_set,
+    get_async_db_one_set,
     update_db_set,
     delete_db_set,
     create_db_set_minifigure,
     delete_db_set_minifigure
 )
-from src.users.utils import get_current_active_user
+from src.users.utils import get_current_active_principal
 from src.logger import app_logger
+from src.pagination import NEXT_CURSOR_HEADER, build_next_cursor
+from src.cache import response_cache, tag_name_tag
+from src.tags.utils import parse_tag_names
 
 router = APIRouter(
     prefix="/sets",
     tags=["Sets"],
-    dependencies=[Depends(get_current_active_user)]
+    dependencies=[Depends(get_current_active_principal)]
 )
 
 @router.get(
@@ -29,11 +36,20 @@ router = APIRouter(
     summary="Получить список наборов LEGO", 
     description="Возвращает список всех наборов LEGO с возможностью пагинации, поиска, фильтрации по тегу, цене и количеству деталей"
 )
-async def get_sets(filter: SetFilter = Depends(), db: Session = Depends(get_db)):
+async def get_sets(response: Response, filter: SetFilter = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     Получить список наборов с фильтрацией и пагинацией.
+    Курсор следующей страницы возвращается в заголовке X-Next-Cursor.
     """
-    sets = get_db_sets(
+    cache_key = response_cache.make_key("sets:list", filter.model_dump())
+    cached = await response_cache.aget(cache_key)
+    if cached is not None:
+        if cached["next_cursor"]:
+            response.headers[NEXT_CURSOR_HEADER] = cached["next_cursor"]
+        app_logger.info(f"Получено {len(cached['items'])} наборов из кэша (фильтр: {filter.dict()})")
+        return cached["items"]
+
+    sets = await get_async_db_sets(
         db=db,
         limit=filter.limit,
         offset=filter.offset,
@@ -43,10 +59,26 @@ async def get_sets(filter: SetFilter = Depends(), db: Session = Depends(get_db))
         min_price=filter.min_price,
         max_price=filter.max_price,
         min_piece_count=filter.min_piece_count,
-        max_piece_count=filter.max_piece_count
+        max_piece_count=filter.max_piece_count,
+        sort_by=filter.sort_by,
+        sort_order=filter.sort_order,
+        cursor=filter.cursor
+    )
+    next_cursor = build_next_cursor(
+        sets, filter.limit, filter.sort_by, filter.sort_order,
+        key=lambda set_item: get_set_cursor_values(set_item, filter.sort_by)
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    items = [SetResponse.model_validate(set_item).model_dump(mode="json") for set_item in sets]
+    # Список зависит от всех наборов и от связей тегов, по которым он отфильтрован
+    await response_cache.aset(
+        cache_key,
+        {"items": items, "next_cursor": next_cursor},
+        tags=["sets", *[tag_name_tag(tag_name) for tag_name in parse_tag_names(filter.tag_names)]]
     )
     app_logger.info(f"Получено {len(sets)} наборов (фильтр: {filter.dict()})")
-    return sets
+    return items
 
 @router.post(
     "/",
@@ -67,10 +99,18 @@ async def create_set(set: SetCreate, db: Session = Depends(get_db)):
     summary="Получить набор LEGO по ID",
     description="Возвращает информацию о конкретном наборе LEGO по его ID"
 )
-async def get_one_set(set_id: int, db: Session = Depends(get_db)):
-    set = get_db_one_set(db, set_id)
+async def get_one_set(set_id: int, db: AsyncSession = Depends(get_async_db)):
+    cache_key = response_cache.make_key("sets:one", {"set_id": set_id})
+    cached = await response_cache.aget(cache_key)
+    if cached is not None:
+        app_logger.info(f"Получен набор ID: {set_id} из кэша")
+        return cached
+
+    set = await get_async_db_one_set(db, set_id)
+    item = SetResponse.model_validate(set).model_dump(mode="json")
+    await response_cache.aset(cache_key, item)
     app_logger.info(f"Получен набор ID: {set_id}")
-    return set
+    return item
 
 @router.put(
     "/{set_id}/",
@@ -1,8 +1,9 @@
 # src/sets/schemas.py
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import Optional, Dict, Any, List
 from src.photos.schemas import PhotoResponse
 from src.tags.schemas import TagResponse
+from src.search import RELEVANCE_SORT
 from fastapi import Query, HTTPException, status
 
 class SetBase(BaseModel):
@@ -39,16 +40,22 @@ class SetDelete(BaseModel):
     set_id: int = Field(..., description="Уникальный идентификатор набора для удаления")
 
 
+# Поля, по которым доступна сортировка и курсорная пагинация наборов
+SET_SORT_FIELDS = ("set_id", "name", "price", "piece_count", "release_year", RELEVANCE_SORT)
+
 class SetFilter(BaseModel):
     limit: int = Field(default=10, description="Количество возвращаемых записей", ge=1, le=1000)
     offset: int = Field(default=0, description="Смещение для пагинации", ge=0)
-    search: Optional[str] = Field(default="", description="Поиск по названию набора")
+    search: Optional[str] = Field(default="", description="Поиск по названию, теме и подтеме набора (без учёта регистра, с допуском опечаток)")
     tag_names: Optional[str] = Field(default="", description="Список имен тегов, разделённых запятыми, для фильтрации наборов")
     tag_logic: Optional[str] = Field(default="AND", description="Логика фильтрации тегов: AND или OR")
     min_price: Optional[float] = Field(default=None, description="Минимальная цена набора в рублях", ge=0)
     max_price: Optional[float] = Field(default=None, description="Максимальная цена набора в рублях", ge=0)
     min_piece_count: Optional[int] = Field(default=None, description="Минимальное количество деталей в наборе", ge=0)
     max_piece_count: Optional[int] = Field(default=None, description="Максимальное количество деталей в наборе", ge=0)
+    sort_by: Optional[str] = Field(default=None, description=f"Поле сортировки: {', '.join(SET_SORT_FIELDS)}. По умолчанию relevance при поиске, иначе set_id")
+    sort_order: Optional[str] = Field(default="ASC", description="Направление сортировки: ASC или DESC")
+    cursor: Optional[str] = Field(default=None, description="Курсор следующей страницы из заголовка X-Next-Cursor (если указан, offset игнорируется)")
 
     @field_validator("tag_logic")
     @classmethod
@@ -60,6 +67,34 @@ class SetFilter(BaseModel):
             )
         return value.upper()
 
+    @field_validator("sort_by")
+    @classmethod
+    def validate_sort_by(cls, value):
+        if value is not None and value not in SET_SORT_FIELDS:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"sort_by должен быть одним из: {', '.join(SET_SORT_FIELDS)}"
+            )
+        return value
+
+    @field_validator("sort_order")
+    @classmethod
+    def validate_sort_order(cls, value):
+        if value.upper() not in ["ASC", "DESC"]:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="sort_order должен быть 'ASC' или 'DESC'"
+            )
+        return value.upper()
+
+    @model_validator(mode="after")
+    def resolve_sort_by(self):
+        # При поиске по умолчанию сортируем по релевантности; без поиска релевантность не определена
+        has_search = bool((self.search or "").strip())
+        if self.sort_by is None or (self.sort_by == RELEVANCE_SORT and not has_search):
+            self.sort_by = RELEVANCE_SORT if has_search else "set_id"
+        return self
+
     @field_validator("min_price", "max_price", "min_piece_count", "max_piece_count")
     @classmethod
     def validate_non_negative(cls, value, field):
@@ -1,16 +1,35 @@
 # src/tags/db.py
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from psycopg2.errors import UniqueViolation, ForeignKeyViolation, NotNullViolation, CheckViolation
 from src.tags.models import Tag, SetTag, MinifigureTag
 from src.tags.schemas import TagCreate, TagUpdate, TagDelete, SetTagCreate, SetTagDelete, MinifigureTagCreate, MinifigureTagDelete
 from src.logger import log_db_operation
+from src.cache import response_cache, set_tag, minifigure_tag, tag_tag, tag_name_tag
+from src.search import normalize_search, search_condition, search_distance
+
+def _tags_query(search: str | None = ""):
+    # Поиск по имени через триграммный индекс, при поиске — сначала самые похожие
+    search = normalize_search(search)
+    query = select(Tag)
+    if search:
+        return query.where(search_condition(Tag.name, search))\
+                    .order_by(search_distance(Tag.name, search), Tag.tag_id)
+    return query.order_by(Tag.tag_id)
 
 @log_db_operation
 def get_db_tags(db: Session, limit: int = 10, offset: int = 0, search: str | None = "") -> list[Tag]:
-    tags = db.query(Tag).filter(Tag.name.contains(search)).limit(limit).offset(offset).all()
-    return tags
+    tags = db.execute(_tags_query(search).limit(limit).offset(offset)).scalars().all()
+    return list(tags)
+
+@log_db_operation
+async def get_async_db_tags(db: AsyncSession, limit: int = 10, offset: int = 0, search: str | None = "") -> list[Tag]:
+    """Асинхронный вариант get_db_tags для эндпоинтов чтения"""
+    result = await db.execute(_tags_query(search).limit(limit).offset(offset))
+    return list(result.scalars().all())
 
 @log_db_operation
 def create_db_tag(tag: TagCreate, db: Session) -> Tag:
@@ -19,6 +38,7 @@ def create_db_tag(tag: TagCreate, db: Session) -> Tag:
         db.add(new_tag)
         db.commit()
         db.refresh(new_tag)
+        response_cache.invalidate("tags")
         return new_tag
     except IntegrityError as e:
         db.rollback()
@@ -40,15 +60,26 @@ def get_db_one_tag(db: Session, tag_id: int) -> Tag:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tag with id {tag_id} was not found")
     return one_tag
 
+@log_db_operation
+async def get_async_db_one_tag(db: AsyncSession, tag_id: int) -> Tag:
+    """Асинхронный вариант get_db_one_tag для эндпоинтов чтения"""
+    one_tag = await db.get(Tag, tag_id)
+    if not one_tag:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tag with id {tag_id} was not found")
+    return one_tag
+
 @log_db_operation
 def update_db_tag(tag_id: int, tag_update: TagUpdate, db: Session) -> Tag:
     db_tag = get_db_one_tag(db, tag_id)
+    old_name = db_tag.name
     update_data = tag_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_tag, key, value)
     try:
         db.commit()
         db.refresh(db_tag)
+        # Тег входит в ответы наборов и минифигурок, а его имя — в фильтры списков
+        response_cache.invalidate("tags", tag_tag(tag_id), tag_name_tag(old_name), tag_name_tag(db_tag.name))
         return db_tag
     except IntegrityError as e:
         db.rollback()
@@ -66,10 +97,20 @@ def update_db_tag(tag_id: int, tag_update: TagUpdate, db: Session) -> Tag:
 @log_db_operation
 def delete_db_tag(tag_delete: TagDelete, db: Session) -> dict:
     db_tag = get_db_one_tag(db, tag_delete.tag_id)
+    tag_name = db_tag.name
     db.delete(db_tag)
     db.commit()
+    response_cache.invalidate("tags", tag_tag(tag_delete.tag_id), tag_name_tag(tag_name))
     return {"message": f"Tag with id {tag_delete.tag_id} deleted successfully"}
 
+def _invalidate_tag_link(db: Session, tag_id: int, owner_tag: str) -> None:
+    # Связь меняет ответ владельца и состав списков, отфильтрованных по этому тегу
+    tag = db.get(Tag, tag_id)
+    tags = [owner_tag]
+    if tag is not None:
+        tags.append(tag_name_tag(tag.name))
+    response_cache.invalidate(*tags)
+
 # Операции для SetTag
 @log_db_operation
 def create_db_set_tag(set_tag: SetTagCreate, db: Session) -> SetTag:
@@ -78,6 +119,7 @@ def create_db_set_tag(set_tag: SetTagCreate, db: Session) -> SetTag:
         db.add(new_set_tag)
         db.commit()
         db.refresh(new_set_tag)
+        _invalidate_tag_link(db, new_set_tag.tag_id, set_tag(new_set_tag.set_id))
         return new_set_tag
     except IntegrityError as e:
         db.rollback()
@@ -102,6 +144,7 @@ def delete_db_set_tag(set_tag_delete: SetTagDelete, db: Session) -> dict:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SetTag not found")
     db.delete(db_set_tag)
     db.commit()
+    _invalidate_tag_link(db, set_tag_delete.tag_id, set_tag(set_tag_delete.set_id))
     return {"message": f"SetTag with set_id {set_tag_delete.set_id} and tag_id {set_tag_delete.tag_id} deleted successfully"}
 
 # Операции для MinifigureTag
@@ -112,6 +155,7 @@ def create_db_minifigure_tag(minifigure_tag: MinifigureTagCreate, db: Session) -
         db.add(new_minifigure_tag)
         db.commit()
         db.refresh(new_minifigure_tag)
+        _invalidate_tag_link(db, new_minifigure_tag.tag_id, minifigure_tag(new_minifigure_tag.minifigure_id))
         return new_minifigure_tag
     except IntegrityError as e:
         db.rollback()
@@ -136,4 +180,5 @@ def delete_db_minifigure_tag(minifigure_tag_delete: MinifigureTagDelete, db: Ses
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="MinifigureTag not found")
     db.delete(db_minifigure_tag)
     db.commit()
+    _invalidate_tag_link(db, minifigure_tag_delete.tag_id, minifigure_tag(minifigure_tag_delete.minifigure_id))
     return {"message": f"MinifigureTag with minifigure_id {minifigure_tag_delete.minifigure_id} and tag_id {minifigure_tag_delete.tag_id} deleted successfully"}
\ No newline at end of file
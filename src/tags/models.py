@@ -1,5 +1,5 @@
 # src/tags/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from src.database import Base
 import enum
@@ -11,6 +11,10 @@ class TagType(enum.Enum):
 
 class Tag(Base):
     __tablename__ = "tags"
+    # Триграммный индекс для регистронезависимого и нечёткого поиска по имени
+    __table_args__ = (
+        Index("ix_tags_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
 
     tag_id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)
@@ -23,12 +27,16 @@ class Tag(Base):
 
 class SetTag(Base):
     __tablename__ = "set_tags"
+    # Первичный ключ (set_id, tag_id) не помогает искать наборы по тегу
+    __table_args__ = (Index("ix_set_tags_tag_id_set_id", "tag_id", "set_id"),)
 
     set_id = Column(Integer, ForeignKey("sets.set_id", ondelete="CASCADE"), primary_key=True)
     tag_id = Column(Integer, ForeignKey("tags.tag_id", ondelete="CASCADE"), primary_key=True)
 
 class MinifigureTag(Base):
     __tablename__ = "minifigure_tags"
+    # Первичный ключ (minifigure_id, tag_id) не помогает искать минифигурки по тегу
+    __table_args__ = (Index("ix_minifigure_tags_tag_id_minifigure_id", "tag_id", "minifigure_id"),)
 
     minifigure_id = Column(String, ForeignKey("minifigures.minifigure_id", ondelete="CASCADE"), primary_key=True)
     tag_id = Column(Integer, ForeignKey("tags.tag_id", ondelete="CASCADE"), primary_key=True)
\ No newline at end of file
@@ -1,13 +1,16 @@
 # src/tags/routes.py
 from fastapi import status, HTTPException, Depends, APIRouter, Form
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Literal
 from src.tags.schemas import TagCreate, TagResponse, TagUpdate, TagDelete, SetTagCreate, SetTagResponse, SetTagDelete, MinifigureTagCreate, MinifigureTagResponse, MinifigureTagDelete
-from src.database import get_db
+from src.database import get_db, get_async_db
 from src.tags.db import (
     get_db_tags,
+    get_async_db_tags,
     create_db_tag,
     get_db_one_tag,
+    get_async_db_one_tag,
     update_db_tag,
     delete_db_tag,
     create_db_set_tag,
@@ -15,13 +18,14 @@ from src.tags.db import (
     create_db_minifigure_tag,
     delete_db_minifigure_tag
 )
-from src.users.utils import get_current_active_user
+from src.users.utils import get_current_active_principal
 from src.logger import app_logger
+from src.cache import response_cache
 
 router = APIRouter(
     prefix="/tags",
     tags=["Tags"],
-    dependencies=[Depends(get_current_active_user)]
+    dependencies=[Depends(get_current_active_principal)]
 )
 
 @router.get(
@@ -32,14 +36,22 @@ router = APIRouter(
     description="Возвращает список всех тегов с возможностью пагинации и поиска"
 )
 async def get_tags(
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     limit: int = 10, 
     offset: int = 0, 
     search: str | None = ""
 ):
-    tags = get_db_tags(db, limit, offset, search)
+    cache_key = response_cache.make_key("tags:list", {"limit": limit, "offset": offset, "search": search})
+    cached = await response_cache.aget(cache_key)
+    if cached is not None:
+        app_logger.info(f"Получено {len(cached)} тегов из кэша (limit={limit}, offset={offset}, search='{search}')")
+        return cached
+
+    tags = await get_async_db_tags(db, limit, offset, search)
+    items = [TagResponse.model_validate(tag).model_dump(mode="json") for tag in tags]
+    await response_cache.aset(cache_key, items, tags=["tags"])
     app_logger.info(f"Получено {len(tags)} тегов (limit={limit}, offset={offset}, search='{search}')")
-    return tags
+    return items
 
 @router.post(
     "/", 
@@ -60,8 +72,8 @@ async def create_tag(tag: TagCreate, db: Session = Depends(get_db)):
     summary="Получить тег по ID",
     description="Возвращает информацию о конкретном теге по его ID"
 )
-async def get_one_tag(tag_id: int, db: Session = Depends(get_db)):
-    tag = get_db_one_tag(db, tag_id)
+async def get_one_tag(tag_id: int, db: AsyncSession = Depends(get_async_db)):
+    tag = await get_async_db_one_tag(db, tag_id)
     app_logger.info(f"Получен тег ID: {tag_id}")
     return tag
 
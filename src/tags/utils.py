@@ -0,0 +1,20 @@
+from fastapi import HTTPException, status
+from typing import Optional, List
+
+def parse_tag_names(tag_names: Optional[str]) -> List[str]:
+    """Разбирает строку тегов, разделённых запятыми, в список без дубликатов"""
+    if not tag_names:
+        return []
+    tags_list = [tag.strip() for tag in tag_names.split(",") if tag.strip()]
+    # Удаляем дубликаты из списка тегов
+    return list(set(tags_list))
+
+def check_tags_exist(tags_list: List[str], existing_names: List[str]) -> None:
+    """Проверяет, что все запрошенные теги найдены в БД, иначе возвращает 400"""
+    existing = set(existing_names)
+    non_existent_tags = [tag_name for tag_name in tags_list if tag_name not in existing]
+    if non_existent_tags:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Теги с именами {', '.join(non_existent_tags)} не найдены"
+        )
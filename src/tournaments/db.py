@@ -1,12 +1,17 @@
 # src/tournaments/db.py
-from sqlalchemy.orm import Session, joinedload, contains_eager
-from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import Session, joinedload, contains_eager, selectinload, noload, aliased
+from sqlalchemy import and_, or_, func, select, insert, update, case, exists, literal, values, column, union_all, true, Integer, String
+from sqlalchemy.engine import Row
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from fastapi import HTTPException, status
 
 from src.tournaments.models import Tournament, TournamentParticipant, TournamentPair, TournamentVote
+from src.sets.models import Set
+from src.minifigures.models import Minifigure
 from src.tournaments.schemas import TournamentCreate
+from src.tournaments.stages import COMPLETED_STAGE
 from src.logger import log_db_operation
 
 @log_db_operation
@@ -14,6 +19,19 @@ def get_db_tournament(db: Session, tournament_id: int) -> Optional[Tournament]:
     """Получение турнира по ID с загрузкой всех связанных данных"""
     return db.query(Tournament).filter(Tournament.tournament_id == tournament_id).first()
 
+@log_db_operation
+def get_db_tournament_for_update(db: Session, tournament_id: int) -> Optional[Tournament]:
+    """
+    Получение турнира с блокировкой строки до конца транзакции (FOR UPDATE SKIP LOCKED).
+    None — турнира нет или его строку уже держит другая транзакция.
+    """
+    return db.execute(
+        select(Tournament)
+        .where(Tournament.tournament_id == tournament_id)
+        .with_for_update(skip_locked=True)
+        .execution_options(populate_existing=True)
+    ).scalars().first()
+
 @log_db_operation
 def get_db_tournament_with_participants(db: Session, tournament_id: int) -> Optional[Tournament]:
     """Получение турнира по ID с участниками"""
@@ -24,36 +42,66 @@ def get_db_tournament_with_participants(db: Session, tournament_id: int) -> Opti
         .first()
     )
 
+def _participant_details_options(participant_relationship):
+    """Загрузка набора/минифигурки участника со всем, что входит в ответ, пакетными IN-запросами"""
+    return (
+        participant_relationship.selectinload(TournamentParticipant.set).options(
+            joinedload(Set.face_photo),
+            selectinload(Set.photos),
+            selectinload(Set.tags)
+        ),
+        participant_relationship.selectinload(TournamentParticipant.minifigure).options(
+            joinedload(Minifigure.face_photo),
+            selectinload(Minifigure.photos),
+            selectinload(Minifigure.tags)
+        ),
+    )
+
+def _attach_vote_counts(pairs: List[TournamentPair]) -> None:
+    """Проставляет парам количество голосов за каждого участника из счётчиков пары"""
+    for pair in pairs:
+        pair.votes_for_participant1 = pair.votes_participant1
+        pair.votes_for_participant2 = pair.votes_participant2 if pair.participant2_id else 0
+
 @log_db_operation
-def get_db_tournament_with_pairs(db: Session, tournament_id: int) -> Optional[Tournament]:
-    """Получение турнира по ID с парами"""
-    tournament = (
-        db.query(Tournament)
-        .options(
-            joinedload(Tournament.pairs)
-            .joinedload(TournamentPair.participant1)
+def get_db_tournament_with_pairs(db: Session, tournament_id: int, stage: Optional[int] = None) -> Optional[Tournament]:
+    """
+    Получение турнира по ID с парами (всеми или только стадии stage).
+    Число запросов не зависит от размера сетки и количества голосов:
+    связи грузятся пакетными IN-запросами, строки голосов не загружаются,
+    а их количество берётся из счётчиков пар.
+    """
+    pairs_relationship = Tournament.pairs
+    participants_relationship = Tournament.participants
+    if stage is not None:
+        # Пары раунда читаются по индексу (tournament_id, stage), участники — только из этих пар
+        pairs_relationship = Tournament.pairs.and_(TournamentPair.stage == stage)
+        stage_pairs = select(TournamentPair.participant1_id, TournamentPair.participant2_id).where(
+            TournamentPair.tournament_id == tournament_id,
+            TournamentPair.stage == stage
+        ).subquery()
+        participants_relationship = Tournament.participants.and_(
+            or_(
+                TournamentParticipant.participant_id.in_(select(stage_pairs.c.participant1_id)),
+                TournamentParticipant.participant_id.in_(select(stage_pairs.c.participant2_id))
+            )
         )
+    tournament = db.execute(
+        select(Tournament)
         .options(
-            joinedload(Tournament.pairs)
-            .joinedload(TournamentPair.participant2)
+            *_participant_details_options(selectinload(participants_relationship)),
+            selectinload(pairs_relationship).options(
+                # Участники уже загружены выше и берутся из identity map
+                selectinload(TournamentPair.participant1),
+                selectinload(TournamentPair.participant2),
+                selectinload(TournamentPair.winner),
+                noload(TournamentPair.votes)
+            )
         )
-        .options(
-            joinedload(Tournament.pairs)
-            .joinedload(TournamentPair.winner)
-        )
-        .options(
-            joinedload(Tournament.pairs)
-            .joinedload(TournamentPair.votes)
-        )
-        .filter(Tournament.tournament_id == tournament_id)
-        .first()
-    )
+        .where(Tournament.tournament_id == tournament_id)
+    ).scalars().first()
     if tournament:
-        for pair in tournament.pairs:
-            # Подсчитываем голоса для каждой пары
-            votes = get_db_participant_votes(db, pair.pair_id)
-            pair.votes_for_participant1 = votes.get(pair.participant1_id, 0)
-            pair.votes_for_participant2 = votes.get(pair.participant2_id, 0) if pair.participant2_id else 0
+        _attach_vote_counts(tournament.pairs)
     return tournament
 
 @log_db_operation
@@ -97,16 +145,93 @@ def get_db_participant_votes(db: Session, pair_id: int) -> dict:
     return {voted_for: count for voted_for, count in votes}
 
 @log_db_operation
-def get_db_current_stage_pairs(db: Session, tournament_id: int) -> List[TournamentPair]:
-    """Получение всех пар текущей стадии турнира"""
-    tournament = get_db_tournament(db, tournament_id)
-    if not tournament:
+def get_db_stage_results(db: Session, tournament_id: int, stage: int) -> list:
+    """
+    Итоги стадии одним запросом: пары стадии в порядке pair_id со счётчиками голосов
+    и суммой голосов каждого участника за все стадии турнира (total1 / total2)
+    """
+    votes = union_all(
+        select(TournamentPair.participant1_id.label("participant_id"), TournamentPair.votes_participant1.label("votes"))
+        .where(TournamentPair.tournament_id == tournament_id),
+        select(TournamentPair.participant2_id, TournamentPair.votes_participant2)
+        .where(TournamentPair.tournament_id == tournament_id, TournamentPair.participant2_id.isnot(None))
+    ).subquery("votes")
+    totals = (
+        select(votes.c.participant_id, func.sum(votes.c.votes).label("total"))
+        .group_by(votes.c.participant_id)
+        .cte("totals")
+    )
+    totals1 = totals.alias("totals1")
+    totals2 = totals.alias("totals2")
+    return db.execute(
+        select(
+            TournamentPair.pair_id,
+            TournamentPair.participant1_id,
+            TournamentPair.participant2_id,
+            TournamentPair.votes_participant1,
+            TournamentPair.votes_participant2,
+            func.coalesce(totals1.c.total, 0).label("total1"),
+            func.coalesce(totals2.c.total, 0).label("total2")
+        )
+        .outerjoin(totals1, totals1.c.participant_id == TournamentPair.participant1_id)
+        .outerjoin(totals2, totals2.c.participant_id == TournamentPair.participant2_id)
+        .where(TournamentPair.tournament_id == tournament_id, TournamentPair.stage == stage)
+        .order_by(TournamentPair.pair_id)
+    ).all()
+
+@log_db_operation
+def set_db_pair_winners(db: Session, winners: List[Tuple[int, int]]) -> None:
+    """Проставляет победителей пар (pair_id, winner_id) одним UPDATE ... FROM (VALUES ...), без commit"""
+    if not winners:
+        return
+    pair_winners = values(
+        column("pair_id", Integer), column("winner_id", Integer),
+        name="pair_winners"
+    ).data(winners)
+    db.execute(
+        update(TournamentPair)
+        .where(TournamentPair.pair_id == pair_winners.c.pair_id)
+        .values(winner_id=pair_winners.c.winner_id)
+        .execution_options(synchronize_session=False)
+    )
+
+@log_db_operation
+def create_db_tournament_participants(db: Session, tournament_id: int, tournament_type: str, entity_ids: list) -> List[int]:
+    """
+    Создание участников турнира одним многострочным INSERT, без commit.
+    Позиция участника — его порядок в entity_ids; возвращает participant_id в том же порядке.
+    """
+    if not entity_ids:
         return []
-    
-    return db.query(TournamentPair).filter(
-        TournamentPair.tournament_id == tournament_id,
-        TournamentPair.stage == tournament.current_stage
+    id_field = "set_id" if tournament_type == "sets" else "minifigure_id"
+    rows = db.execute(
+        insert(TournamentParticipant)
+        .values([
+            {"tournament_id": tournament_id, id_field: entity_id, "position": position}
+            for position, entity_id in enumerate(entity_ids, start=1)
+        ])
+        .returning(TournamentParticipant.participant_id, TournamentParticipant.position)
     ).all()
+    return [row.participant_id for row in sorted(rows, key=lambda row: row.position)]
+
+@log_db_operation
+def create_db_stage_pairs(db: Session, tournament_id: int, stage: int, participant_pairs: List[Tuple[int, Optional[int]]]) -> List[int]:
+    """Создание пар стадии одним многострочным INSERT, без commit; возвращает pair_id"""
+    if not participant_pairs:
+        return []
+    return db.execute(
+        insert(TournamentPair)
+        .values([
+            {
+                "tournament_id": tournament_id,
+                "stage": stage,
+                "participant1_id": participant1_id,
+                "participant2_id": participant2_id
+            }
+            for participant1_id, participant2_id in participant_pairs
+        ])
+        .returning(TournamentPair.pair_id)
+    ).scalars().all()
 
 @log_db_operation
 def create_db_tournament_vote(db: Session, pair_id: int, user_id: int, voted_for: int) -> TournamentVote:
@@ -117,33 +242,216 @@ def create_db_tournament_vote(db: Session, pair_id: int, user_id: int, voted_for
         voted_for=voted_for
     )
     db.add(vote)
+    db.flush()
+    # Счётчик пары увеличивается атомарно (x = x + 1) в той же транзакции, что и голос
+    db.execute(
+        update(TournamentPair)
+        .where(TournamentPair.pair_id == pair_id)
+        .values(
+            votes_participant1=TournamentPair.votes_participant1 + case((TournamentPair.participant1_id == voted_for, 1), else_=0),
+            votes_participant2=TournamentPair.votes_participant2 + case((TournamentPair.participant2_id == voted_for, 1), else_=0)
+        )
+    )
     db.commit()
     db.refresh(vote)
     return vote
 
 @log_db_operation
-def get_db_tournament_pair_with_details(db: Session, pair_id: int) -> Optional[TournamentPair]:
-    """Получение пары по ID с полной информацией об участниках и голосах"""
-    pair = (
-        db.query(TournamentPair)
-        .options(
-            joinedload(TournamentPair.participant1)
+def cast_db_tournament_vote(db: Session, tournament_id: int, pair_id: int, user_id: str, voted_for: int) -> Tuple[bool, Optional[Row]]:
+    """
+    Голосование одним запросом: проверка пары/стадии/дедлайна, вставка голоса
+    и увеличение счётчика пары в одном INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+
+    Возвращает (пара допускает голос, пара после вставки): строка vote_id, pair_id,
+    participant1_id, votes_participant1, participant2_id, votes_participant2
+    со счётчиками после голоса. None, если голос не вставлен: при допустимой паре
+    это означает повторный голос пользователя.
+    """
+    eligible = (
+        select(TournamentPair.pair_id)
+        .join(Tournament, Tournament.tournament_id == TournamentPair.tournament_id)
+        .where(
+            TournamentPair.pair_id == pair_id,
+            TournamentPair.tournament_id == tournament_id,
+            TournamentPair.stage == Tournament.current_stage,
+            Tournament.current_stage != COMPLETED_STAGE,
+            Tournament.stage_deadline > func.now(),
+            or_(TournamentPair.participant1_id == voted_for, TournamentPair.participant2_id == voted_for)
         )
-        .options(
-            joinedload(TournamentPair.participant2)
+        .cte("eligible")
+    )
+    inserted = (
+        pg_insert(TournamentVote)
+        .from_select(
+            ["pair_id", "user_id", "voted_for", "created_at"],
+            select(eligible.c.pair_id, literal(user_id), literal(voted_for), func.now())
         )
-        .options(
-            joinedload(TournamentPair.winner)
+        .on_conflict_do_nothing(index_elements=["pair_id", "user_id"])
+        .returning(TournamentVote.vote_id, TournamentVote.pair_id)
+        .cte("inserted")
+    )
+    counted = (
+        update(TournamentPair)
+        .where(TournamentPair.pair_id == inserted.c.pair_id)
+        .values(
+            votes_participant1=TournamentPair.votes_participant1 + case((TournamentPair.participant1_id == voted_for, 1), else_=0),
+            votes_participant2=TournamentPair.votes_participant2 + case((TournamentPair.participant2_id == voted_for, 1), else_=0)
         )
-        .options(
-            joinedload(TournamentPair.votes)
+        .returning(
+            inserted.c.vote_id,
+            TournamentPair.pair_id,
+            TournamentPair.participant1_id,
+            TournamentPair.votes_participant1,
+            TournamentPair.participant2_id,
+            TournamentPair.votes_participant2
         )
-        .filter(TournamentPair.pair_id == pair_id)
-        .first()
+        .cte("counted")
+    )
+    # Строка есть и при отклонённом голосе: признак допуска нужен для причины отказа
+    one = select(literal(1).label("one")).subquery("one")
+    row = db.execute(
+        select(exists(select(eligible.c.pair_id)).label("eligible"), counted)
+        .select_from(one.outerjoin(counted, true()))
+    ).one()
+    db.commit()
+    return row.eligible, (row if row.vote_id is not None else None)
+
+@log_db_operation
+def check_db_vote_eligibility(db: Session, tournament_id: int, pair_id: int, user_id: str, voted_for: int) -> Tuple[bool, bool, Optional[int]]:
+    """
+    Проверка голоса одним SELECT без записи:
+    (пара допускает голос, пользователь уже голосовал, стадия пары)
+    """
+    eligible = (
+        select(TournamentPair.pair_id)
+        .join(Tournament, Tournament.tournament_id == TournamentPair.tournament_id)
+        .where(
+            TournamentPair.pair_id == pair_id,
+            TournamentPair.tournament_id == tournament_id,
+            TournamentPair.stage == Tournament.current_stage,
+            Tournament.current_stage != COMPLETED_STAGE,
+            Tournament.stage_deadline > func.now(),
+            or_(TournamentPair.participant1_id == voted_for, TournamentPair.participant2_id == voted_for)
+        )
+    )
+    voted = select(TournamentVote.vote_id).where(
+        TournamentVote.pair_id == pair_id,
+        TournamentVote.user_id == user_id
+    )
+    stage = select(TournamentPair.stage).where(TournamentPair.pair_id == pair_id)
+    row = db.execute(select(
+        exists(eligible).label("eligible"),
+        exists(voted).label("voted"),
+        stage.scalar_subquery().label("stage")
+    )).one()
+    return row.eligible, row.voted, row.stage
+
+@log_db_operation
+def bulk_insert_db_tournament_votes(db: Session, votes: List[Tuple[int, str, int]]) -> list:
+    """
+    Пакетная вставка буферизованных голосов (pair_id, user_id, voted_for) одним запросом
+    вместе с увеличением счётчиков пар. Голоса за пары, стадия которых уже закрыта,
+    и повторные голоса отбрасываются. Возвращает по строке на изменённую пару:
+    tournament_id, pair_id, participant1_id, votes1, participant2_id, votes2 (вставленные голоса),
+    votes_participant1, votes_participant2 (счётчики пары после вставки).
+    """
+    if not votes:
+        return []
+    buffered = values(
+        column("pair_id", Integer), column("user_id", String), column("voted_for", Integer),
+        name="buffered"
+    ).data(votes)
+    inserted = (
+        pg_insert(TournamentVote)
+        .from_select(
+            ["pair_id", "user_id", "voted_for", "created_at"],
+            select(buffered.c.pair_id, buffered.c.user_id, buffered.c.voted_for, func.now())
+            .join(TournamentPair, TournamentPair.pair_id == buffered.c.pair_id)
+            .join(Tournament, Tournament.tournament_id == TournamentPair.tournament_id)
+            .where(TournamentPair.stage == Tournament.current_stage)
+        )
+        .on_conflict_do_nothing(index_elements=["pair_id", "user_id"])
+        .returning(TournamentVote.pair_id, TournamentVote.voted_for)
+        .cte("inserted")
     )
+    pair = aliased(TournamentPair)
+    per_pair = (
+        select(
+            inserted.c.pair_id,
+            func.count().filter(inserted.c.voted_for == pair.participant1_id).label("votes1"),
+            func.count().filter(inserted.c.voted_for == pair.participant2_id).label("votes2")
+        )
+        .join(pair, pair.pair_id == inserted.c.pair_id)
+        .group_by(inserted.c.pair_id)
+        .subquery("per_pair")
+    )
+    counted = (
+        update(TournamentPair)
+        .where(TournamentPair.pair_id == per_pair.c.pair_id)
+        .values(
+            votes_participant1=TournamentPair.votes_participant1 + per_pair.c.votes1,
+            votes_participant2=TournamentPair.votes_participant2 + per_pair.c.votes2
+        )
+        .returning(
+            TournamentPair.tournament_id,
+            TournamentPair.pair_id,
+            TournamentPair.participant1_id,
+            per_pair.c.votes1,
+            TournamentPair.participant2_id,
+            per_pair.c.votes2,
+            TournamentPair.votes_participant1,
+            TournamentPair.votes_participant2
+        )
+        .cte("counted")
+    )
+    rows = db.execute(select(counted)).all()
+    db.commit()
+    return rows
+
+@log_db_operation
+def get_db_tournament_pair_with_details(db: Session, pair_id: int) -> Optional[TournamentPair]:
+    """Получение пары по ID с полной информацией об участниках и количеством голосов (без строк голосов)"""
+    pair = db.execute(
+        select(TournamentPair)
+        .options(
+            *_participant_details_options(selectinload(TournamentPair.participant1)),
+            *_participant_details_options(selectinload(TournamentPair.participant2)),
+            selectinload(TournamentPair.winner),
+            noload(TournamentPair.votes)
+        )
+        .where(TournamentPair.pair_id == pair_id)
+    ).scalars().first()
     if pair:
-        # Подсчитываем голоса для каждой пары
-        votes = get_db_participant_votes(db, pair.pair_id)
-        pair.votes_for_participant1 = votes.get(pair.participant1_id, 0)
-        pair.votes_for_participant2 = votes.get(pair.participant2_id, 0) if pair.participant2_id else 0
+        _attach_vote_counts([pair])
     return pair
+
+@log_db_operation
+def reconcile_db_pair_vote_counters(db: Session, tournament_id: Optional[int] = None) -> int:
+    """
+    Пересчитывает счётчики голосов пар из таблицы tournament_votes.
+    Обновляет только расходящиеся пары и возвращает их количество.
+    """
+    def votes_for(participant_column):
+        return (
+            select(func.count())
+            .select_from(TournamentVote)
+            .where(
+                TournamentVote.pair_id == TournamentPair.pair_id,
+                TournamentVote.voted_for == participant_column
+            )
+            .scalar_subquery()
+        )
+
+    actual1 = votes_for(TournamentPair.participant1_id)
+    actual2 = votes_for(TournamentPair.participant2_id)
+    statement = (
+        update(TournamentPair)
+        .where(or_(TournamentPair.votes_participant1 != actual1, TournamentPair.votes_participant2 != actual2))
+        .values(votes_participant1=actual1, votes_participant2=actual2)
+        .execution_options(synchronize_session=False)
+    )
+    if tournament_id is not None:
+        statement = statement.where(TournamentPair.tournament_id == tournament_id)
+    result = db.execute(statement)
+    db.commit()
+    return result.rowcount
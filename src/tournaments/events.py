@@ -0,0 +1,200 @@
+# src/tournaments/events.py
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+import redis
+import redis.asyncio as aioredis
+from starlette.requests import Request
+
+from src.config import settings
+from src.logger import app_logger
+
+# Живые обновления турниров для GET /tournaments/{id}/stream (Server-Sent Events).
+#
+# Голосование и смена стадий публикуют события (publish_votes / publish_stage).
+# С REDIS_URL события уходят в канал Redis "tournament-events:{id}", и каждый процесс
+# API держит ОДНУ подписку на все каналы, раздавая события своим подключённым
+# зрителям; без REDIS_URL события раздаются внутри процесса (события из Celery,
+# например закрытие стадии по дедлайну, в этом режиме не доходят).
+#
+# Дельты голосов не рассылаются по одной: они суммируются по турниру и уходят
+# одним событием "votes" раз в TOURNAMENT_EVENTS_INTERVAL_MS. Нагрузка на базу от
+# зрителей не зависит от их числа: поток не читает базу вовсе, а после события
+# "stage" клиент перечитывает сетку из снимка (GET /tournaments/{id}).
+#
+# Клиент сначала подключается к потоку, затем читает снимок: голоса, пришедшие
+# между чтением и подключением, иначе были бы потеряны.
+
+CHANNEL_PREFIX = "tournament-events:"
+# Событий в очереди зрителя; медленный клиент получает "resync" и отключается
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+
+
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class Subscription:
+    """Очередь событий одного зрителя"""
+
+    def __init__(self, tournament_id: int):
+        self.tournament_id = tournament_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.lost = False
+
+    def push(self, event: Dict[str, Any]) -> None:
+        if self.lost:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: события потеряны, ему нужно перечитать снимок
+            self.lost = True
+
+
+class TournamentEvents:
+    """Публикация событий турниров и раздача их подписчикам процесса"""
+
+    def __init__(self, redis_url: Optional[str], interval_ms: int):
+        self.redis_url = redis_url
+        self.interval = interval_ms / 1000
+        self.client = redis.Redis.from_url(redis_url) if redis_url else None
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        # Накопленные дельты голосов: tournament_id -> "pair_id:participant_id" -> количество
+        self._pending_votes: Dict[int, Dict[str, int]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks = []
+
+    # Публикация (синхронный код: сервисы, буфер голосов, Celery)
+
+    def publish_votes(self, tournament_id: int, deltas: Dict[str, int]) -> None:
+        """Принятые голоса ("pair_id:participant_id" -> количество)"""
+        if deltas:
+            self._publish(tournament_id, {"type": "votes", "deltas": deltas})
+
+    def publish_stage(self, tournament_id: int, stage: str, stage_deadline: Optional[str] = None) -> None:
+        """Переход турнира на новую стадию (или завершение — stage == "completed")"""
+        self._publish(tournament_id, {"type": "stage", "stage": stage, "stage_deadline": stage_deadline})
+
+    def _publish(self, tournament_id: int, event: Dict[str, Any]) -> None:
+        if self.client is not None:
+            try:
+                self.client.publish(f"{CHANNEL_PREFIX}{tournament_id}", json.dumps(event))
+            except redis.RedisError as exc:
+                app_logger.warning(f"Ошибка публикации события турнира {tournament_id}: {exc}")
+            return
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._dispatch, tournament_id, event)
+
+    # Раздача (event loop процесса API)
+
+    def _dispatch(self, tournament_id: int, event: Dict[str, Any]) -> None:
+        if tournament_id not in self._subscribers:
+            return
+        if event["type"] == "votes":
+            pending = self._pending_votes.setdefault(tournament_id, {})
+            for field, delta in event["deltas"].items():
+                pending[field] = pending.get(field, 0) + delta
+            return
+        # Голоса прошлой стадии уходят раньше события о её закрытии
+        self._send_votes(tournament_id)
+        self._broadcast(tournament_id, event)
+
+    def _send_votes(self, tournament_id: int) -> None:
+        deltas = self._pending_votes.pop(tournament_id, None)
+        if not deltas:
+            return
+        votes = []
+        for field, delta in deltas.items():
+            pair_id, participant_id = field.split(":", 1)
+            votes.append({"pair_id": int(pair_id), "participant_id": int(participant_id), "delta": delta})
+        self._broadcast(tournament_id, {"type": "votes", "votes": votes})
+
+    def _broadcast(self, tournament_id: int, event: Dict[str, Any]) -> None:
+        for subscription in self._subscribers.get(tournament_id, ()):
+            subscription.push(event)
+
+    async def _flush_votes(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            for tournament_id in list(self._pending_votes):
+                try:
+                    self._send_votes(tournament_id)
+                except Exception as exc:
+                    app_logger.error(f"Ошибка рассылки голосов турнира {tournament_id}: {exc}")
+
+    async def _listen(self) -> None:
+        """Единственная подписка процесса на события всех турниров в Redis"""
+        client = aioredis.Redis.from_url(self.redis_url)
+        while True:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    # Ошибка в одном сообщении не должна останавливать подписку всего процесса
+                    try:
+                        channel = message["channel"].decode("utf-8")
+                        tournament_id = int(channel[len(CHANNEL_PREFIX):])
+                        self._dispatch(tournament_id, json.loads(message["data"]))
+                    except Exception as exc:
+                        app_logger.error(f"Ошибка обработки события турнира ({message.get('channel')!r}): {exc}")
+            except redis.RedisError as exc:
+                app_logger.error(f"Подписка на события турниров прервана: {exc}")
+                await asyncio.sleep(1)
+            except Exception as exc:
+                app_logger.error(f"Ошибка подписки на события турниров, переподключение: {exc}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.reset()
+
+    def start(self) -> None:
+        """Запускает раздачу событий в текущем event loop (при старте приложения)"""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._tasks.append(asyncio.create_task(self._flush_votes()))
+        if self.redis_url:
+            self._tasks.append(asyncio.create_task(self._listen()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._loop = None
+
+    async def stream(self, tournament_id: int, request: Request) -> AsyncIterator[str]:
+        """Поток SSE для одного зрителя"""
+        subscription = Subscription(tournament_id)
+        self._subscribers.setdefault(tournament_id, set()).add(subscription)
+        try:
+            yield format_sse("ready", {"tournament_id": tournament_id})
+            while not subscription.lost:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Комментарий SSE держит соединение открытым через прокси
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event["type"], {key: value for key, value in event.items() if key != "type"})
+            if subscription.lost:
+                yield format_sse("resync", {"tournament_id": tournament_id})
+        finally:
+            subscribers = self._subscribers.get(tournament_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[tournament_id]
+                    self._pending_votes.pop(tournament_id, None)
+
+
+tournament_events = TournamentEvents(settings.REDIS_URL, settings.TOURNAMENT_EVENTS_INTERVAL_MS)
@@ -1,5 +1,5 @@
 # src/tournaments/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, CheckConstraint, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, CheckConstraint, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from src.database import Base
@@ -12,7 +12,8 @@ class Tournament(Base):
     tournament_id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
     type = Column(String, nullable=False)
-    current_stage = Column(String, nullable=False)
+    # Номер стадии (см. src/tournaments/stages.py): 1 — финал, 0 — турнир завершён
+    current_stage = Column(Integer, nullable=False)
     stage_deadline = Column(DateTime(timezone=True), nullable=False)
     created_at = Column(DateTime(timezone=True), default=func.now())
 
@@ -48,10 +49,14 @@ class TournamentPair(Base):
 
     pair_id = Column(Integer, primary_key=True)
     tournament_id = Column(Integer, ForeignKey("tournaments.tournament_id", ondelete="CASCADE"), nullable=False)
-    stage = Column(String, nullable=False)
+    stage = Column(Integer, nullable=False)
     participant1_id = Column(Integer, ForeignKey("tournament_participants.participant_id", ondelete="CASCADE"), nullable=False)
     participant2_id = Column(Integer, ForeignKey("tournament_participants.participant_id", ondelete="CASCADE"), nullable=True)
     winner_id = Column(Integer, ForeignKey("tournament_participants.participant_id", ondelete="SET NULL"), nullable=True)
+    # Денормализованные счётчики голосов: увеличиваются в той же транзакции, что и вставка голоса,
+    # пересчитываются из tournament_votes командой reconcile_votes.py
+    votes_participant1 = Column(Integer, nullable=False, default=0, server_default="0")
+    votes_participant2 = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Связи
     tournament = relationship("Tournament", back_populates="pairs")
@@ -62,6 +67,8 @@ class TournamentPair(Base):
 
     __table_args__ = (
         UniqueConstraint("tournament_id", "stage", "participant1_id", "participant2_id"),
+        # Чтение пар одной стадии в порядке сетки (итоги стадии, сетка по раунду)
+        Index("ix_tournament_pairs_tournament_stage", "tournament_id", "stage", "pair_id"),
     )
 
 class TournamentVote(Base):
@@ -1,10 +1,11 @@
 # src/tournaments/routes.py
-from fastapi import APIRouter, Depends, Path, Query, status, HTTPException
+from fastapi import APIRouter, Depends, Path, Query, Header, Request, Response, status, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
-from src.database import get_db
+from src.database import get_db, SessionLocal
 from src.tournaments.schemas import (
     TournamentCreate,
     TournamentResponse,
@@ -16,7 +17,8 @@ from src.tournaments.schemas import (
 from src.tournaments.services import (
     create_tournament,
     vote_in_tournament,
-    advance_tournament_stage
+    advance_tournament_stage,
+    build_bracket_document
 )
 from src.tournaments.db import (
     get_db_tournament,
@@ -24,7 +26,12 @@ from src.tournaments.db import (
     get_db_tournaments,
     get_db_tournament_pair_with_details
 )
-from src.users.utils import get_current_user, get_admin_user
+from src.tournaments.stages import parse_stage_label
+from src.tournaments.snapshots import bracket_snapshots
+from src.cache import etag_matches, response_cache
+from src.tournaments.events import tournament_events
+from src.users.utils import get_current_principal, get_admin_user
+from src.users.schemas import TokenData
 from src.users.models import User
 from src.logger import app_logger
 
@@ -92,17 +99,75 @@ def get_tournaments(
     
     return result
 
+@router.get("/{tournament_id}/stream")
+def stream_tournament(
+    request: Request,
+    tournament_id: int = Path(..., description="ID турнира")
+):
+    """
+    Живые обновления турнира (Server-Sent Events).
+    
+    События: **votes** — суммированные приросты голосов по парам (не чаще раза в секунду),
+    **stage** — переход на новую стадию (сетку нужно перечитать через GET /tournaments/{id}),
+    **resync** — клиент отстал, события потеряны: перечитать сетку и переподключиться.
+    Подключаться к потоку нужно до чтения сетки.
+    """
+    # Поток живёт долго, поэтому сессия берётся только на проверку и сразу закрывается
+    if bracket_snapshots.get_etag(tournament_id) is None:
+        db = SessionLocal()
+        try:
+            tournament = get_db_tournament(db, tournament_id)
+        finally:
+            db.close()
+        if not tournament:
+            app_logger.warning(f"Турнир с ID {tournament_id} не найден")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Турнир с ID {tournament_id} не найден"
+            )
+    return StreamingResponse(
+        tournament_events.stream(tournament_id, request),
+        media_type="text/event-stream",
+        # X-Accel-Buffering отключает буферизацию ответа в nginx
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/{tournament_id}", response_model=TournamentResponse)
 def get_tournament(
     tournament_id: int = Path(..., description="ID турнира"),
+    stage: Optional[str] = Query(None, description="Только пары стадии: 'final', 'semifinal', 'quarterfinal', '1/8', '1/16', ..."),
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     Получение информации о турнире по ID.
+    Полная сетка отдаётся из снимка с ETag; при совпадении If-None-Match — 304 без тела.
     
     - **tournament_id**: ID турнира
+    - **stage**: Стадия сетки; если указана, возвращаются только её пары и их участники
     """
-    tournament = get_db_tournament_with_pairs(db, tournament_id)
+    if stage is None:
+        current_etag = bracket_snapshots.get_etag(tournament_id) if if_none_match is not None else None
+        if current_etag is not None and etag_matches(if_none_match, current_etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": current_etag})
+        snapshot = bracket_snapshots.get_or_build(tournament_id, lambda: build_bracket_document(db, tournament_id))
+        if snapshot is None:
+            app_logger.warning(f"Турнир с ID {tournament_id} не найден")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Турнир с ID {tournament_id} не найден"
+            )
+        etag, document = snapshot
+        app_logger.info(f"Получен турнир ID: {tournament_id} из снимка")
+        return Response(content=document, media_type="application/json", headers={"ETag": etag})
+
+    stage_number = parse_stage_label(stage)
+    if stage_number is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Неизвестная стадия: {stage}"
+        )
+    tournament = get_db_tournament_with_pairs(db, tournament_id, stage_number)
     if not tournament:
         app_logger.warning(f"Турнир с ID {tournament_id} не найден")
         raise HTTPException(
@@ -117,7 +182,7 @@ def vote_for_participant(
     tournament_id: int = Path(..., description="ID турнира"),
     vote_data: TournamentVoteCreate = None,
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_user)
+    current_user: TokenData = Depends(get_current_principal)
 ):
     """
     Голосование за участника в паре.
@@ -170,6 +235,9 @@ def delete_tournament(
     
     db.delete(tournament)
     db.commit()
+    bracket_snapshots.delete(tournament_id)
+    # Победители турнира удалены каскадно вместе с ним
+    response_cache.invalidate("winners")
     app_logger.info(f"Турнир с ID {tournament_id} удален")
     
     return {"message": f"Турнир с ID {tournament_id} успешно удален"}
@@ -0,0 +1,46 @@
+# src/tournaments/scheduler.py
+from datetime import datetime, timedelta, timezone
+
+from src.celery_app import celery_app
+from src.logger import app_logger
+from src.tournaments.stages import COMPLETED_STAGE, stage_label
+
+# Планировщик дедлайнов стадий.
+#
+# Когда create_tournament или advance_tournament_stage назначают дедлайн, в Celery
+# ставится задача advance_tournament_at_deadline с eta=stage_deadline, и стадия
+# закрывается в момент дедлайна, без ежеминутного опроса базы.
+#
+# Задачи с далёким eta не отправляются сразу: воркер держит такие сообщения
+# неподтверждёнными, а RabbitMQ закрывает канал по consumer_timeout (30 минут
+# по умолчанию). Поэтому сразу ставятся только дедлайны в пределах SCHEDULE_HORIZON,
+# остальные ставит страховочный опрос check_and_advance_tournaments, который раз
+# в SAFETY_NET_INTERVAL планирует ближайшие дедлайны и закрывает просроченные стадии.
+#
+# Задача идемпотентна: она продвигает турнир, только если стадия всё ещё та,
+# под которую задача ставилась, и дедлайн наступил, а строку турнира забирает
+# через FOR UPDATE SKIP LOCKED. Дубли и устаревшие задачи поэтому безопасны.
+
+ADVANCE_TASK = "src.tournaments.tasks.advance_tournament_at_deadline"
+SAFETY_NET_INTERVAL = timedelta(minutes=10)
+# С запасом, чтобы окна соседних опросов перекрывались
+SCHEDULE_HORIZON = SAFETY_NET_INTERVAL + timedelta(minutes=2)
+
+
+def schedule_stage_deadline(tournament_id: int, stage: int, deadline: datetime) -> bool:
+    """
+    Ставит задачу закрытия стадии на момент дедлайна (вызывать после commit).
+    Возвращает False, если дедлайн дальше горизонта или брокер недоступен —
+    тогда стадию запланирует или закроет страховочный опрос.
+    """
+    if stage == COMPLETED_STAGE:
+        return False
+    if deadline - datetime.now(timezone.utc) > SCHEDULE_HORIZON:
+        return False
+    try:
+        celery_app.send_task(ADVANCE_TASK, args=[tournament_id, stage], eta=deadline)
+    except Exception as exc:
+        app_logger.error(f"Не удалось запланировать закрытие стадии {stage_label(stage)} турнира {tournament_id}: {exc}")
+        return False
+    app_logger.info(f"Закрытие стадии {stage_label(stage)} турнира {tournament_id} запланировано на {deadline.isoformat()}")
+    return True
@@ -5,6 +5,12 @@ from typing import List, Optional, Union, Dict, Any
 from src.sets.schemas import SetResponse
 from src.minifigures.schemas import MinifigureResponse
 from src.users.schemas import UserResponse
+from src.tournaments.stages import stage_label
+
+# Стадии генерируются по размеру сетки (см. src/tournaments/stages.py),
+# ограничение на число участников — только защита от слишком тяжёлых турниров
+MAX_TOURNAMENT_PARTICIPANTS = 4096
+DEFAULT_TOURNAMENT_PARTICIPANTS = 128
 
 # Входящие данные (запросы)
 
@@ -20,6 +26,7 @@ class TournamentCreate(BaseModel):
     min_piece_count: Optional[int] = Field(None, description="Минимальное количество деталей (для наборов)")
     max_piece_count: Optional[int] = Field(None, description="Максимальное количество деталей (для наборов)")
     stage_duration_hours: Optional[int] = Field(24, description="Длительность каждой стадии турнира в часах")
+    max_participants: int = Field(DEFAULT_TOURNAMENT_PARTICIPANTS, description="Максимальное число участников (выбираются случайно среди подходящих)")
 
     @field_validator("type")
     def validate_type(cls, v):
@@ -33,6 +40,12 @@ class TournamentCreate(BaseModel):
             raise ValueError("Логика для тегов должна быть 'AND' или 'OR'")
         return v
 
+    @field_validator("max_participants")
+    def validate_max_participants(cls, v):
+        if v < 2 or v > MAX_TOURNAMENT_PARTICIPANTS:
+            raise ValueError(f"Число участников должно быть от 2 до {MAX_TOURNAMENT_PARTICIPANTS}")
+        return v
+
     @field_validator("stage_duration_hours")
     def validate_duration(cls, v):
         if v <= 0:
@@ -74,6 +87,11 @@ class TournamentPairBase(BaseModel):
     participant2_id: Optional[int] = None
     winner_id: Optional[int] = None
 
+    @field_validator("stage", mode="before")
+    def validate_stage(cls, v):
+        # В базе стадия хранится номером, в API отдаётся названием
+        return stage_label(v) if isinstance(v, int) else v
+
     class Config:
         orm_mode = True
 
@@ -93,6 +111,10 @@ class TournamentBase(BaseModel):
     stage_deadline: datetime
     created_at: datetime
 
+    @field_validator("current_stage", mode="before")
+    def validate_current_stage(cls, v):
+        return stage_label(v) if isinstance(v, int) else v
+
     class Config:
         orm_mode = True
 
@@ -6,14 +6,23 @@ from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 
 from src.tournaments.models import Tournament, TournamentParticipant, TournamentPair, TournamentVote
-from src.tournaments.schemas import TournamentCreate, TournamentVoteCreate
+from src.tournaments.schemas import TournamentCreate, TournamentVoteCreate, TournamentResponse
 from src.tournaments.db import (
     get_db_tournament,
     get_db_tournament_pair,
-    get_db_tournament_vote,
-    get_db_current_stage_pairs,
-    create_db_tournament_vote
+    get_db_tournament_for_update,
+    create_db_tournament_participants,
+    get_db_tournament_with_pairs,
+    get_db_stage_results,
+    set_db_pair_winners,
+    cast_db_tournament_vote,
+    check_db_vote_eligibility
 )
+from src.tournaments.vote_buffer import vote_buffer, StageClosedError
+from src.tournaments.scheduler import schedule_stage_deadline
+from src.tournaments.stages import COMPLETED_STAGE, stage_label
+from src.tournaments.snapshots import bracket_snapshots, pair_vote_counts
+from src.tournaments.events import tournament_events
 from src.tournaments.utils import (
     get_tournament_participants,
     round_to_power_of_two,
@@ -27,6 +36,15 @@ from src.tournaments.utils import (
 # Импортируем функции из нового модуля winners
 from src.winners.db import create_db_tournament_winner, get_participant_details
 
+def build_bracket_document(db: Session, tournament_id: int) -> Optional[str]:
+    """
+    Сборка JSON-документа сетки турнира (TournamentResponse) для снимка
+    """
+    tournament = get_db_tournament_with_pairs(db, tournament_id)
+    if not tournament:
+        return None
+    return TournamentResponse.model_validate(tournament, from_attributes=True).model_dump_json()
+
 def create_tournament(db: Session, tournament_data: TournamentCreate) -> Tournament:
     """
     Создание нового турнира
@@ -40,9 +58,6 @@ def create_tournament(db: Session, tournament_data: TournamentCreate) -> Tournam
             detail="Не найдено участников, соответствующих заданным критериям"
         )
     
-    # Перемешиваем участников
-    random.shuffle(participants)
-    
     # Определяем количество участников и стадию
     num_participants = len(participants)
     target_num = round_to_power_of_two(num_participants)
@@ -58,24 +73,15 @@ def create_tournament(db: Session, tournament_data: TournamentCreate) -> Tournam
     db.add(tournament)
     db.flush()
     
-    # Создаем участников турнира
-    tournament_participants = []
-    for i, participant in enumerate(participants):
-        tournament_participant = TournamentParticipant(
-            tournament_id=tournament.tournament_id,
-            set_id=participant.set_id if tournament_data.type == "sets" else None,
-            minifigure_id=participant.minifigure_id if tournament_data.type == "minifigures" else None,
-            position=i + 1
-        )
-        tournament_participants.append(tournament_participant)
-    
-    db.add_all(tournament_participants)
-    db.flush()
+    # Создаем участников турнира в случайном порядке выборки
+    participant_ids = create_db_tournament_participants(db, tournament.tournament_id, tournament_data.type, participants)
     
     # Генерируем пары для первой стадии
-    generate_tournament_pairs(db, tournament, tournament_participants, first_stage, target_num)
+    generate_tournament_pairs(db, tournament, participant_ids, first_stage, target_num)
     
     db.commit()
+    schedule_stage_deadline(tournament.tournament_id, tournament.current_stage, tournament.stage_deadline)
+    bracket_snapshots.refresh(tournament.tournament_id, lambda: build_bracket_document(db, tournament.tournament_id))
     return tournament
 
 def vote_in_tournament(
@@ -85,7 +91,42 @@ def vote_in_tournament(
     user_id: int
 ) -> Dict[str, str]:
     """
-    Голосование в турнире
+    Голосование в турнире.
+    Проверки и вставка выполняются одним запросом; при отказе причина
+    определяется дополнительными запросами только на этом (редком) пути.
+    """
+    if vote_buffer.enabled:
+        # Проверка одним SELECT без commit, голос пишется в базу пачкой из буфера
+        eligible, voted, stage = check_db_vote_eligibility(db, tournament_id, vote_data.pair_id, user_id, vote_data.voted_for)
+        try:
+            # Голос кладётся со стадией, которую видела проверка: если стадию
+            # успели продвинуть, буфер отклонит голос по маркеру закрытия
+            accepted = eligible and not voted and vote_buffer.add(tournament_id, stage, vote_data.pair_id, user_id, vote_data.voted_for)
+        except StageClosedError:
+            # Стадия продвигается: голос не попал бы в её итоги
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Стадия турнира завершается, голос не принят"
+            )
+    else:
+        eligible, counted_pair = cast_db_tournament_vote(db, tournament_id, vote_data.pair_id, user_id, vote_data.voted_for)
+        accepted = counted_pair is not None
+        if accepted:
+            bracket_snapshots.set_vote_counts(tournament_id, pair_vote_counts([counted_pair]))
+            tournament_events.publish_votes(tournament_id, {f"{vote_data.pair_id}:{vote_data.voted_for}": 1})
+    if accepted:
+        return {"message": "Голос успешно учтен"}
+    if eligible:
+        # Пара допускает голос, значит вставку отклонил конфликт (pair_id, user_id)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Вы уже проголосовали за эту пару"
+        )
+    raise_vote_rejection(db, tournament_id, vote_data)
+
+def raise_vote_rejection(db: Session, tournament_id: int, vote_data: TournamentVoteCreate) -> None:
+    """
+    Определяет, почему голос не допущен, и выбрасывает соответствующую ошибку
     """
     # Проверяем существование турнира
     tournament = get_db_tournament(db, tournament_id)
@@ -96,7 +137,7 @@ def vote_in_tournament(
         )
     
     # Проверяем, что турнир не завершен
-    if tournament.current_stage == "completed":
+    if tournament.current_stage == COMPLETED_STAGE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Турнир завершен"
@@ -124,17 +165,11 @@ def vote_in_tournament(
             detail="Голосовать можно только за одного из участников пары"
         )
     
-    # Проверяем, не голосовал ли пользователь уже за эту пару
-    existing_vote = get_db_tournament_vote(db, vote_data.pair_id, user_id)
-    if existing_vote:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Вы уже проголосовали за эту пару"
-        )
-    
-    # Создаем голос
-    create_db_tournament_vote(db, vote_data.pair_id, user_id, vote_data.voted_for)
-    return {"message": "Голос успешно учтен"}
+    # Все условия выполнены к моменту проверки: стадия сменилась между запросами
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Стадия турнира изменилась, повторите голосование"
+    )
 
 def advance_tournament_stage(db: Session, tournament_id: int, duration_hours: Optional[int] = None) -> Dict[str, str]:
     """
@@ -145,16 +180,43 @@ def advance_tournament_stage(db: Session, tournament_id: int, duration_hours: Op
         tournament_id: ID турнира
         duration_hours: Длительность следующей стадии в часах (если не указано, используется 24 часа)
     """
-    # Проверяем существование турнира
+    # Закрываем приём голосов за текущую стадию и дописываем принятые до блокировки
+    # турнира (сброс буфера делает commit): позже принятый голос не попал бы в итоги
     tournament = get_db_tournament(db, tournament_id)
+    stage = tournament.current_stage if tournament else None
+    if stage is not None and stage != COMPLETED_STAGE:
+        vote_buffer.close_stage(tournament_id, stage)
+    try:
+        vote_buffer.flush(db)
+        return _advance_locked_tournament_stage(db, tournament_id, duration_hours)
+    except Exception as exc:
+        # 409 — стадию продвигает другой процесс, приём открывать нельзя
+        if stage is not None and not (isinstance(exc, HTTPException) and exc.status_code == status.HTTP_409_CONFLICT):
+            db.rollback()
+            # Стадия не сменилась (продвижение отклонено или не дошло до commit) —
+            # открываем приём за неё снова
+            tournament = get_db_tournament(db, tournament_id)
+            if tournament and tournament.current_stage == stage:
+                vote_buffer.reopen_stage(tournament_id, stage)
+        raise
+
+def _advance_locked_tournament_stage(db: Session, tournament_id: int, duration_hours: Optional[int]) -> Dict[str, str]:
+    # Забираем строку турнира до конца транзакции: параллельное продвижение
+    # (воркеры Celery, ручной вызов) того же турнира получит отказ, а не второй проход
+    tournament = get_db_tournament_for_update(db, tournament_id)
     if not tournament:
+        if get_db_tournament(db, tournament_id):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Турнир уже продвигается"
+            )
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Турнир не найден"
         )
     
     # Проверяем, что турнир не завершен
-    if tournament.current_stage == "completed":
+    if tournament.current_stage == COMPLETED_STAGE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Турнир уже завершен"
@@ -167,20 +229,22 @@ def advance_tournament_stage(db: Session, tournament_id: int, duration_hours: Op
             detail=f"Текущая стадия еще не завершена. Осталось: {tournament.stage_deadline - datetime.now(timezone.utc)}"
         )
     
-    # Получаем пары текущей стадии
-    pairs = get_db_current_stage_pairs(db, tournament_id)
-    if not pairs:
+    # Итоги текущей стадии: пары, счётчики и суммы голосов одним запросом
+    results = get_db_stage_results(db, tournament_id, tournament.current_stage)
+    if not results:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нет пар для текущей стадии"
         )
     
-    # Считаем победителей
-    winner_ids = calculate_winners(db, pairs)
+    # Считаем победителей и проставляем их одним UPDATE
+    pair_winners = calculate_winners(results)
+    set_db_pair_winners(db, pair_winners)
+    winner_ids = [winner_id for _, winner_id in pair_winners]
     
     # Определяем следующую стадию
     next_stage = get_next_stage(tournament.current_stage)
-    if not next_stage:
+    if next_stage is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Невозможно определить следующую стадию"
@@ -190,21 +254,20 @@ def advance_tournament_stage(db: Session, tournament_id: int, duration_hours: Op
     tournament.current_stage = next_stage
     
     # Если это финал и он уже сыгран, отмечаем турнир как завершенный
-    if next_stage == "completed":
+    if next_stage == COMPLETED_STAGE:
         tournament.stage_deadline = datetime.now(timezone.utc)
         
         # Определяем победителя турнира (финалиста)
-        if pairs and len(pairs) == 1 and pairs[0].winner_id:
+        if len(results) == 1 and winner_ids[0]:
             # Получаем информацию о победителе
-            winner_participant_id = pairs[0].winner_id
+            final = results[0]
+            winner_participant_id = winner_ids[0]
             
             # Получаем set_id и minifigure_id победителя
             set_id, minifigure_id = get_participant_details(db, winner_participant_id)
             
-            # Подсчитываем общее количество голосов за победителя за все стадии
-            total_votes = db.query(TournamentVote).filter(
-                TournamentVote.voted_for == winner_participant_id
-            ).count()
+            # Общее количество голосов за победителя за все стадии уже посчитано в итогах
+            total_votes = final.total1 if winner_participant_id == final.participant1_id else final.total2
             
             # Создаем запись о победителе турнира через новый модуль winners
             create_db_tournament_winner(
@@ -216,6 +279,8 @@ def advance_tournament_stage(db: Session, tournament_id: int, duration_hours: Op
             )
         
         db.commit()
+        bracket_snapshots.refresh(tournament_id, lambda: build_bracket_document(db, tournament_id))
+        tournament_events.publish_stage(tournament_id, stage_label(COMPLETED_STAGE))
         return {"message": "Турнир успешно завершен"}
     
     # Устанавливаем новый дедлайн для следующей стадии
@@ -227,4 +292,7 @@ def advance_tournament_stage(db: Session, tournament_id: int, duration_hours: Op
     generate_next_stage_pairs(db, tournament, winner_ids)
     
     db.commit()
-    return {"message": f"Турнир успешно продвинут на стадию {next_stage}"} 
\ No newline at end of file
+    schedule_stage_deadline(tournament_id, next_stage, tournament.stage_deadline)
+    bracket_snapshots.refresh(tournament_id, lambda: build_bracket_document(db, tournament_id))
+    tournament_events.publish_stage(tournament_id, stage_label(next_stage), tournament.stage_deadline.isoformat())
+    return {"message": f"Турнир успешно продвинут на стадию {stage_label(next_stage)}"} 
\ No newline at end of file
@@ -0,0 +1,312 @@
+# src/tournaments/snapshots.py
+import json
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import redis
+
+from src.config import settings
+from src.logger import app_logger
+
+# Снимки сетки турнира для GET /tournaments/{id}.
+#
+# Снимок — готовый JSON-документ TournamentResponse, собранный один раз при создании
+# турнира и при переходе на новую стадию (или при первом чтении, если снимка нет).
+# Голоса не пересобирают документ: принятый голос записывает рядом со снимком
+# счётчики своей пары после вставки ("pair_id:participant_id" -> голосов всего),
+# и при отдаче в votes_for_participant1/2 берётся большее из документа и этих
+# счётчиков. Каждое изменение увеличивает ревизию снимка, из идентификатора сборки
+# и ревизии строится ETag, поэтому ответ 304 на If-None-Match стоит одного
+# обращения к хранилищу.
+#
+# Счётчики пар только растут, поэтому порядок сборки снимка и записи голосов не
+# важен: голос, вставленный во время сборки, не теряется и не учитывается дважды.
+# По той же причине сохранение снимка не сбрасывает счётчики. Пересборка (refresh)
+# очищает их до чтения базы и получает номер: более старая пересборка не
+# перезапишет снимок более новой, а сборка при чтении сохраняет снимок, только
+# если его ещё нет.
+#
+# Снимок живёт TOURNAMENT_SNAPSHOT_TTL_SECONDS: данные каталога (названия, фото)
+# внутри него сходятся не позже TTL.
+
+Snapshot = Tuple[str, str]
+
+
+def make_etag(tournament_id: int, build_id: str, revision: int) -> str:
+    return f'W/"t{tournament_id}-{build_id}-{revision}"'
+
+
+def pair_vote_counts(pairs: Iterable[Any]) -> Dict[str, int]:
+    """Счётчики из строк пар (pair_id, participant1_id, votes_participant1, participant2_id, votes_participant2)"""
+    counts = {}
+    for pair in pairs:
+        counts[f"{pair.pair_id}:{pair.participant1_id}"] = pair.votes_participant1
+        if pair.participant2_id:
+            counts[f"{pair.pair_id}:{pair.participant2_id}"] = pair.votes_participant2
+    return counts
+
+
+def apply_vote_counts(document: str, counts: Dict[str, int]) -> str:
+    """Подставляет в пары документа счётчики голосов, если они больше собранных"""
+    if not counts:
+        return document
+    payload = json.loads(document)
+    for pair in payload.get("pairs", []):
+        pair_id = pair["pair_id"]
+        pair["votes_for_participant1"] = max(pair.get("votes_for_participant1") or 0, counts.get(f"{pair_id}:{pair['participant1_id']}", 0))
+        if pair.get("participant2_id"):
+            pair["votes_for_participant2"] = max(pair.get("votes_for_participant2") or 0, counts.get(f"{pair_id}:{pair['participant2_id']}", 0))
+    return json.dumps(payload, ensure_ascii=False)
+
+
+class MemorySnapshotStore:
+    """Снимки в памяти процесса (без REDIS_URL): голоса других процессов не видны до пересборки"""
+
+    def __init__(self):
+        self._snapshots: Dict[int, Dict[str, Any]] = {}
+        self._counts: Dict[int, Dict[str, Any]] = {}
+        self._builds: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, tournament_id: int) -> Optional[Dict[str, Any]]:
+        snapshot = self._snapshots.get(tournament_id)
+        if snapshot is not None and snapshot["expires_at"] < time.monotonic():
+            del self._snapshots[tournament_id]
+            return None
+        return snapshot
+
+    def _alive_counts(self, tournament_id: int) -> Dict[str, int]:
+        entry = self._counts.get(tournament_id)
+        if entry is None or entry["expires_at"] < time.monotonic():
+            self._counts.pop(tournament_id, None)
+            return {}
+        return entry["values"]
+
+    def get_etag(self, tournament_id: int) -> Optional[str]:
+        with self._lock:
+            snapshot = self._alive(tournament_id)
+            return make_etag(tournament_id, snapshot["build"], snapshot["rev"]) if snapshot else None
+
+    def get(self, tournament_id: int) -> Optional[Snapshot]:
+        with self._lock:
+            snapshot = self._alive(tournament_id)
+            if snapshot is None:
+                return None
+            etag = make_etag(tournament_id, snapshot["build"], snapshot["rev"])
+            return etag, apply_vote_counts(snapshot["doc"], self._alive_counts(tournament_id))
+
+    def begin_build(self, tournament_id: int, ttl: int) -> int:
+        with self._lock:
+            self._counts.pop(tournament_id, None)
+            build_seq = self._builds.get(tournament_id, 0) + 1
+            self._builds[tournament_id] = build_seq
+            return build_seq
+
+    def put(self, tournament_id: int, document: str, ttl: int, build_seq: Optional[int]) -> bool:
+        with self._lock:
+            if build_seq is None:
+                if self._alive(tournament_id) is not None:
+                    return False
+            elif self._builds.get(tournament_id) != build_seq:
+                return False
+            expires_at = time.monotonic() + ttl
+            self._snapshots[tournament_id] = {
+                "doc": document, "build": uuid.uuid4().hex[:12], "rev": 0, "expires_at": expires_at,
+            }
+            if tournament_id in self._counts:
+                self._counts[tournament_id]["expires_at"] = expires_at
+            return True
+
+    def set_vote_counts(self, tournament_id: int, counts: Dict[str, int], ttl: int) -> None:
+        with self._lock:
+            self._alive_counts(tournament_id)
+            entry = self._counts.setdefault(tournament_id, {"values": {}})
+            entry["expires_at"] = time.monotonic() + ttl
+            changed = False
+            for field, count in counts.items():
+                if count > entry["values"].get(field, 0):
+                    entry["values"][field] = count
+                    changed = True
+            snapshot = self._alive(tournament_id)
+            if changed and snapshot is not None:
+                snapshot["rev"] += 1
+
+    def delete(self, tournament_id: int) -> None:
+        with self._lock:
+            self._snapshots.pop(tournament_id, None)
+            self._counts.pop(tournament_id, None)
+            self._builds.pop(tournament_id, None)
+
+
+class RedisSnapshotStore:
+    """Снимки в Redis: хэш с документом, сборкой и ревизией, хэш счётчиков голосов и номер пересборки"""
+
+    KEY_PREFIX = "tournament-snapshot:"
+
+    # Счётчик пары только растёт: записывается, если он больше сохранённого.
+    # Счётчики пишутся и без снимка — их подхватит снимок, собираемый сейчас
+    SET_VOTE_COUNTS_SCRIPT = """
+    local changed = 0
+    for i = 2, #ARGV, 2 do
+        if tonumber(ARGV[i + 1]) > (tonumber(redis.call('HGET', KEYS[2], ARGV[i])) or 0) then
+            redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+            changed = 1
+        end
+    end
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+    if changed == 1 and redis.call('EXISTS', KEYS[1]) == 1 then
+        redis.call('HINCRBY', KEYS[1], 'rev', 1)
+    end
+    return changed
+    """
+
+    # Без номера пересборки снимок сохраняется, только если его нет; с номером —
+    # только если после этой пересборки не началась другая
+    PUT_SCRIPT = """
+    if ARGV[4] == '' then
+        if redis.call('EXISTS', KEYS[1]) == 1 then
+            return 0
+        end
+    elseif redis.call('GET', KEYS[3]) ~= ARGV[4] then
+        return 0
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call('HSET', KEYS[1], 'doc', ARGV[1], 'build', ARGV[2], 'rev', 0)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    return 1
+    """
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url)
+        self._set_vote_counts = self.client.register_script(self.SET_VOTE_COUNTS_SCRIPT)
+        self._put = self.client.register_script(self.PUT_SCRIPT)
+
+    def _keys(self, tournament_id: int) -> Tuple[str, str, str]:
+        key = f"{self.KEY_PREFIX}{tournament_id}"
+        return key, key + ":votes", key + ":build"
+
+    def get_etag(self, tournament_id: int) -> Optional[str]:
+        build_id, revision = self.client.hmget(self._keys(tournament_id)[0], "build", "rev")
+        if build_id is None:
+            return None
+        return make_etag(tournament_id, build_id.decode("utf-8"), int(revision))
+
+    def get(self, tournament_id: int) -> Optional[Snapshot]:
+        key, votes_key, _ = self._keys(tournament_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hgetall(key)
+        pipe.hgetall(votes_key)
+        snapshot, counts = pipe.execute()
+        if not snapshot:
+            return None
+        etag = make_etag(tournament_id, snapshot[b"build"].decode("utf-8"), int(snapshot[b"rev"]))
+        counts = {field.decode("utf-8"): int(value) for field, value in counts.items()}
+        return etag, apply_vote_counts(snapshot[b"doc"].decode("utf-8"), counts)
+
+    def begin_build(self, tournament_id: int, ttl: int) -> int:
+        _, votes_key, build_key = self._keys(tournament_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(votes_key)
+        pipe.incr(build_key)
+        pipe.expire(build_key, ttl)
+        _, build_seq, _ = pipe.execute()
+        return build_seq
+
+    def put(self, tournament_id: int, document: str, ttl: int, build_seq: Optional[int]) -> bool:
+        build_id = uuid.uuid4().hex[:12]
+        args = [document, build_id, ttl, "" if build_seq is None else build_seq]
+        return bool(self._put(keys=list(self._keys(tournament_id)), args=args))
+
+    def set_vote_counts(self, tournament_id: int, counts: Dict[str, int], ttl: int) -> None:
+        args = [ttl]
+        for field, count in counts.items():
+            args.extend([field, count])
+        self._set_vote_counts(keys=list(self._keys(tournament_id)[:2]), args=args)
+
+    def delete(self, tournament_id: int) -> None:
+        self.client.delete(*self._keys(tournament_id))
+
+
+class BracketSnapshots:
+    """Снимки сетки турниров; ошибки хранилища не ломают чтение и голосование"""
+
+    def __init__(self, store, ttl: int):
+        self.store = store
+        self.ttl = ttl
+
+    def get_etag(self, tournament_id: int) -> Optional[str]:
+        try:
+            return self.store.get_etag(tournament_id)
+        except redis.RedisError as exc:
+            app_logger.warning(f"Ошибка чтения ETag снимка турнира {tournament_id}: {exc}")
+            return None
+
+    def get_or_build(self, tournament_id: int, build: Callable[[], Optional[str]]) -> Optional[Snapshot]:
+        """Снимок турнира; при отсутствии собирается через build() (None — турнира нет)"""
+        try:
+            snapshot = self.store.get(tournament_id)
+        except redis.RedisError as exc:
+            app_logger.warning(f"Ошибка чтения снимка турнира {tournament_id}: {exc}")
+            snapshot = None
+        if snapshot is not None:
+            return snapshot
+        document = build()
+        if document is None:
+            return None
+        return self._put(tournament_id, document, None)
+
+    def refresh(self, tournament_id: int, build: Callable[[], Optional[str]]) -> None:
+        """Пересобирает снимок (после создания турнира и смены стадии)"""
+        try:
+            build_seq = self.store.begin_build(tournament_id, self.ttl)
+        except redis.RedisError as exc:
+            # Без номера пересборки снимок не сохранить, а старый устарел
+            app_logger.warning(f"Ошибка пересборки снимка турнира {tournament_id}: {exc}")
+            self.delete(tournament_id)
+            return
+        document = build()
+        if document is None:
+            self.delete(tournament_id)
+            return
+        self._put(tournament_id, document, build_seq)
+
+    def _put(self, tournament_id: int, document: str, build_seq: Optional[int]) -> Snapshot:
+        try:
+            # Снимок мог сохранить и параллельный сборщик: отдаём сохранённый
+            self.store.put(tournament_id, document, self.ttl, build_seq)
+            snapshot = self.store.get(tournament_id)
+            if snapshot is not None:
+                return snapshot
+        except redis.RedisError as exc:
+            app_logger.warning(f"Ошибка записи снимка турнира {tournament_id}: {exc}")
+        # Без сохранённого снимка ETag уникален, чтобы не получить ложный 304
+        return make_etag(tournament_id, uuid.uuid4().hex[:12], 0), document
+
+    def set_vote_counts(self, tournament_id: int, counts: Dict[str, int]) -> None:
+        """Записывает счётчики пар после принятых голосов ("pair_id:participant_id" -> голосов всего)"""
+        if not counts:
+            return
+        try:
+            self.store.set_vote_counts(tournament_id, counts, self.ttl)
+        except redis.RedisError as exc:
+            # Снимок разойдётся с базой до пересборки, удаляем его
+            app_logger.warning(f"Ошибка обновления снимка турнира {tournament_id}: {exc}")
+            self.delete(tournament_id)
+
+    def delete(self, tournament_id: int) -> None:
+        try:
+            self.store.delete(tournament_id)
+        except redis.RedisError as exc:
+            app_logger.error(f"Ошибка удаления снимка турнира {tournament_id}: {exc}")
+
+
+def _create_store():
+    if settings.REDIS_URL:
+        return RedisSnapshotStore(settings.REDIS_URL)
+    return MemorySnapshotStore()
+
+
+bracket_snapshots = BracketSnapshots(_create_store(), settings.TOURNAMENT_SNAPSHOT_TTL_SECONDS)
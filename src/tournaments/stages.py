@@ -0,0 +1,50 @@
+# src/tournaments/stages.py
+from typing import Optional
+
+# Стадия турнира хранится целым числом — количеством раундов до конца турнира:
+# 1 — финал, 2 — полуфинал, 3 — четвертьфинал, k >= 4 — 1/2^(k-1) финала
+# (4 — 1/8, 5 — 1/16, ..., 13 — 1/4096), 0 — турнир завершён.
+# Сетка на 2^k участников начинается со стадии k, каждая следующая стадия — k - 1,
+# поэтому размер сетки ограничен только размером выборки участников.
+# Названия стадий в API генерируются из номера (stage_label / parse_stage_label).
+
+COMPLETED_STAGE = 0
+FINAL_STAGE = 1
+
+NAMED_STAGES = {
+    COMPLETED_STAGE: "completed",
+    FINAL_STAGE: "final",
+    2: "semifinal",
+    3: "quarterfinal",
+}
+STAGES_BY_NAME = {label: stage for stage, label in NAMED_STAGES.items()}
+
+
+def first_stage_for(bracket_size: int) -> int:
+    """Первая стадия сетки на bracket_size участников (степень двойки, не меньше 2)"""
+    return max(FINAL_STAGE, bracket_size.bit_length() - 1)
+
+
+def next_stage(stage: int) -> Optional[int]:
+    """Следующая стадия; None для завершённого турнира"""
+    return stage - 1 if stage > COMPLETED_STAGE else None
+
+
+def stage_label(stage: int) -> str:
+    """Название стадии для API: "final", "quarterfinal", "1/8", "1/2048" ..."""
+    if stage in NAMED_STAGES:
+        return NAMED_STAGES[stage]
+    return f"1/{2 ** (stage - 1)}"
+
+
+def parse_stage_label(label: str) -> Optional[int]:
+    """Номер стадии по названию; None, если название не распознано"""
+    label = label.strip().lower()
+    if label in STAGES_BY_NAME:
+        return STAGES_BY_NAME[label]
+    if label.startswith("1/") and label[2:].isdigit():
+        denominator = int(label[2:])
+        # Знаменатель — степень двойки от 8 и выше
+        if denominator >= 8 and denominator & (denominator - 1) == 0:
+            return denominator.bit_length()
+    return None
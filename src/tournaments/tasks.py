@@ -1,37 +1,103 @@
 # src/tournaments/tasks.py
-from celery import Celery
+from celery import Celery, group
+from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Optional
 
 from src.database import get_db, SessionLocal
 from src.tournaments.models import Tournament
 from src.tournaments.services import advance_tournament_stage
+from src.tournaments.db import get_db_tournament, reconcile_db_pair_vote_counters
+from src.tournaments.scheduler import schedule_stage_deadline, SCHEDULE_HORIZON
+from src.tournaments.stages import COMPLETED_STAGE
 from src.logger import app_logger
 from src.celery_app import celery_app
 
+def advance_if_due(tournament_id: int, expected_stage: Optional[int] = None) -> bool:
+    """
+    Продвигает турнир в собственной сессии, если его стадия истекла и (при expected_stage)
+    не сменилась. Строку турнира забирает advance_tournament_stage через
+    FOR UPDATE SKIP LOCKED, поэтому параллельные и повторные вызовы безопасны.
+    """
+    db = SessionLocal()
+    try:
+        tournament = get_db_tournament(db, tournament_id)
+        if not tournament or tournament.current_stage == COMPLETED_STAGE:
+            return False
+        if expected_stage is not None and tournament.current_stage != expected_stage:
+            # Стадия уже закрыта: задача устарела
+            return False
+        if tournament.stage_deadline > datetime.now(timezone.utc):
+            # Задача пришла раньше дедлайна (дедлайн перенесён или eta сработал
+            # досрочно) — ставим её заново на актуальный дедлайн. Дальний дедлайн
+            # запланирует страховочный опрос
+            schedule_stage_deadline(tournament_id, tournament.current_stage, tournament.stage_deadline)
+            return False
+        try:
+            advance_tournament_stage(db, tournament_id)
+        except HTTPException as e:
+            if e.status_code == status.HTTP_409_CONFLICT:
+                app_logger.info(f"Турнир {tournament_id} уже продвигается другим воркером")
+                return False
+            raise
+        app_logger.info(f"Турнир {tournament_id} автоматически переведен на следующую стадию")
+        return True
+    finally:
+        db.close()
+
+@celery_app.task(name='src.tournaments.tasks.advance_tournament_at_deadline')
+def advance_tournament_at_deadline(tournament_id: int, stage: Optional[int] = None):
+    """
+    Задача закрытия стадии одного турнира: ставится с eta=stage_deadline
+    планировщиком или веером из страховочного опроса.
+    """
+    try:
+        advance_if_due(tournament_id, stage)
+    except Exception as e:
+        app_logger.error(f"Ошибка при продвижении турнира {tournament_id}: {str(e)}")
+
 @celery_app.task(name='src.tournaments.tasks.check_and_advance_tournaments')
 def check_and_advance_tournaments():
     """
-    Задача для проверки и автоматического продвижения турниров на следующую стадию,
-    если время текущей стадии истекло.
+    Страховочный опрос: раздаёт просроченные турниры отдельными подзадачами
+    (каждая в своей сессии, на любом свободном воркере) и планирует задачи
+    для дедлайнов ближайшего окна.
     """
     app_logger.info("Старт фоновой задачи: проверка и продвижение турниров")
     db = SessionLocal()
     try:
-        # Получаем все активные турниры, у которых истекло время стадии
-        tournaments = db.query(Tournament).filter(
-            Tournament.current_stage != "completed",
-            Tournament.stage_deadline < datetime.now(timezone.utc)
+        now = datetime.now(timezone.utc)
+        # Активные турниры с дедлайном в прошлом или в пределах горизонта планирования
+        tournaments = db.query(Tournament.tournament_id, Tournament.current_stage, Tournament.stage_deadline).filter(
+            Tournament.current_stage != COMPLETED_STAGE,
+            Tournament.stage_deadline < now + SCHEDULE_HORIZON
         ).all()
-        
-        for tournament in tournaments:
-            try:
-                advance_tournament_stage(db, tournament.tournament_id)
-                app_logger.info(f"Турнир {tournament.tournament_id} автоматически переведен на следующую стадию")
-            except Exception as e:
-                # Логируем ошибку и продолжаем с другими турнирами
-                app_logger.error(f"Ошибка при продвижении турнира {tournament.tournament_id}: {str(e)}")
     finally:
         db.close()
-        app_logger.info("Фоновая задача завершена: проверка и продвижение турниров") 
\ No newline at end of file
+
+    due = []
+    for tournament_id, stage, deadline in tournaments:
+        if deadline > now:
+            schedule_stage_deadline(tournament_id, stage, deadline)
+        else:
+            due.append(advance_tournament_at_deadline.s(tournament_id, stage))
+    if due:
+        group(due).apply_async()
+        app_logger.info(f"Отправлено на продвижение турниров: {len(due)}")
+    app_logger.info("Фоновая задача завершена: проверка и продвижение турниров")
+
+@celery_app.task(name='src.tournaments.tasks.reconcile_vote_counters')
+def reconcile_vote_counters():
+    """
+    Задача для сверки счётчиков голосов пар с таблицей tournament_votes.
+    """
+    app_logger.info("Старт фоновой задачи: сверка счётчиков голосов")
+    db = SessionLocal()
+    try:
+        fixed = reconcile_db_pair_vote_counters(db)
+        if fixed:
+            app_logger.warning(f"Исправлены счётчики голосов у {fixed} пар")
+    finally:
+        db.close()
+        app_logger.info("Фоновая задача завершена: сверка счётчиков голосов")
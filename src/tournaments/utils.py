@@ -7,49 +7,39 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 
 from src.tournaments.models import Tournament, TournamentParticipant, TournamentPair, TournamentVote
-from src.sets.db import get_db_sets
-from src.minifigures.db import get_db_minifigures
+from src.sets.db import get_db_random_set_ids
+from src.minifigures.db import get_db_random_minifigure_ids
 from src.tournaments.schemas import TournamentCreate
+from src.tournaments.db import create_db_stage_pairs
+from src.tournaments.stages import first_stage_for, next_stage, stage_label
 from src.logger import app_logger
 
 def get_tournament_participants(
     db: Session, 
     tournament_data: TournamentCreate
-) -> List[Any]:
+) -> list:
     """
-    Получение участников турнира в соответствии с фильтрами
+    Случайная выборка идентификаторов участников турнира (не больше max_participants)
+    в соответствии с фильтрами. Порядок выборки уже случайный.
     """
+    filters = {
+        "search": tournament_data.search,
+        "tag_names": tournament_data.tag_names,
+        "tag_logic": tournament_data.tag_logic,
+        "min_price": tournament_data.min_price,
+        "max_price": tournament_data.max_price,
+    }
     # Фильтры для наборов
     if tournament_data.type == "sets":
-        filters = {
-            "limit": 1000,  # Большой лимит для получения всех подходящих наборов
-            "search": tournament_data.search,
-            "tag_names": tournament_data.tag_names,
-            "tag_logic": tournament_data.tag_logic,
-            "min_price": tournament_data.min_price,
-            "max_price": tournament_data.max_price,
-            "min_piece_count": tournament_data.min_piece_count if hasattr(tournament_data, "min_piece_count") else None,
-            "max_piece_count": tournament_data.max_piece_count if hasattr(tournament_data, "max_piece_count") else None,
-        }
+        filters["min_piece_count"] = tournament_data.min_piece_count
+        filters["max_piece_count"] = tournament_data.max_piece_count
         # Удаляем None значения
         filters = {k: v for k, v in filters.items() if v is not None}
-        participants = list(get_db_sets(db, **filters))
+        return get_db_random_set_ids(db, tournament_data.max_participants, **filters)
     
     # Фильтры для минифигурок
-    else:
-        filters = {
-            "limit": 1000,
-            "search": tournament_data.search,
-            "tag_names": tournament_data.tag_names,
-            "tag_logic": tournament_data.tag_logic,
-            "min_price": tournament_data.min_price,
-            "max_price": tournament_data.max_price
-        }
-        # Удаляем None значения
-        filters = {k: v for k, v in filters.items() if v is not None}
-        participants = list(get_db_minifigures(db, **filters))
-    
-    return participants
+    filters = {k: v for k, v in filters.items() if v is not None}
+    return get_db_random_minifigure_ids(db, tournament_data.max_participants, **filters)
 
 def round_to_power_of_two(n: int) -> int:
     """
@@ -61,138 +51,78 @@ def round_to_power_of_two(n: int) -> int:
     
     return 2 ** math.ceil(math.log2(n))
 
-def determine_first_stage(num_participants: int) -> str:
+def determine_first_stage(num_participants: int) -> int:
     """
-    Определение начальной стадии турнира в зависимости от числа участников
+    Определение начальной стадии турнира по размеру сетки (степени двойки)
     """
-    if num_participants <= 2:
-        return "final"
-    elif num_participants <= 4:
-        return "semifinal"
-    elif num_participants <= 8:
-        return "quarterfinal"
-    elif num_participants <= 16:
-        return "1/8"
-    elif num_participants <= 32:
-        return "1/16"
-    elif num_participants <= 64:
-        return "1/32"
-    else:
-        return "1/64"
+    return first_stage_for(num_participants)
 
 def generate_tournament_pairs(
     db: Session,
     tournament: Tournament,
-    participants: List[TournamentParticipant],
-    first_stage: str,
+    participant_ids: List[int],
+    first_stage: int,
     target_num: int
-) -> List[TournamentPair]:
+) -> List[int]:
     """
-    Генерация пар для первой стадии турнира
+    Генерация пар для первой стадии турнира одним многострочным INSERT
     """
-    # Создаём список пар
-    pairs = []
     num_pairs = target_num // 2
-    participant_index = 0
-
-    # Шаг 1: Заполняем participant1 для каждой пары
-    for _ in range(num_pairs):
-        participant1_id = participants[participant_index].participant_id if participant_index < len(participants) else None
-        pairs.append(TournamentPair(
-            tournament_id=tournament.tournament_id,
-            stage=first_stage,
-            participant1_id=participant1_id
-        ))
-        participant_index += 1
 
-    # Шаг 2: Заполняем participant2 для каждой пары, если участники остались
-    for i, pair in enumerate(pairs):
-        if participant_index < len(participants):
-            pair.participant2_id = participants[participant_index].participant_id
-            participant_index += 1
+    # participant1 — первые num_pairs участников, participant2 — оставшиеся, если есть
+    participant_pairs = [
+        (participant_ids[i], participant_ids[num_pairs + i] if num_pairs + i < len(participant_ids) else None)
+        for i in range(min(num_pairs, len(participant_ids)))
+    ]
 
-    db.add_all(pairs)
-    db.flush()
-    app_logger.info(f"Сгенерировано {len(pairs)} пар для стадии {first_stage} турнира {tournament.tournament_id}")
-    return pairs
+    pair_ids = create_db_stage_pairs(db, tournament.tournament_id, first_stage, participant_pairs)
+    app_logger.info(f"Сгенерировано {len(pair_ids)} пар для стадии {stage_label(first_stage)} турнира {tournament.tournament_id}")
+    return pair_ids
 
-def get_next_stage(current_stage: str) -> Optional[str]:
+def get_next_stage(current_stage: int) -> Optional[int]:
     """
     Получение следующей стадии турнира
     """
-    stages = ["1/64", "1/32", "1/16", "1/8", "quarterfinal", "semifinal", "final", "completed"]
-    try:
-        current_index = stages.index(current_stage)
-        if current_index + 1 < len(stages):
-            return stages[current_index + 1]
-        return None
-    except ValueError:
-        return None
+    return next_stage(current_stage)
 
-def calculate_winners(db: Session, pairs: List[TournamentPair]) -> List[int]:
+def calculate_winners(results: list) -> List[Tuple[int, int]]:
     """
-    Подсчет голосов и определение победителей для каждой пары
+    Определение победителя каждой пары по итогам стадии (см. get_db_stage_results).
+    Возвращает (pair_id, winner_id) в порядке пар.
     """
     winners = []
     
-    for pair in pairs:
+    for result in results:
         # Если второго участника нет, первый автоматически побеждает
-        if not pair.participant2_id:
-            pair.winner_id = pair.participant1_id
-            winners.append(pair.participant1_id)
-            continue
-        
-        # Подсчет голосов
-        votes = db.query(
-            TournamentVote.voted_for,
-            func.count(TournamentVote.voted_for).label("vote_count")
-        ).filter(
-            TournamentVote.pair_id == pair.pair_id
-        ).group_by(TournamentVote.voted_for).all()
-        
-        votes_dict = {voted_for: count for voted_for, count in votes}
-        votes_p1 = votes_dict.get(pair.participant1_id, 0)
-        votes_p2 = votes_dict.get(pair.participant2_id, 0)
-        
-        # Определение победителя
-        if votes_p1 > votes_p2:
-            pair.winner_id = pair.participant1_id
-            winners.append(pair.participant1_id)
-        elif votes_p2 > votes_p1:
-            pair.winner_id = pair.participant2_id
-            winners.append(pair.participant2_id)
+        if not result.participant2_id:
+            winners.append((result.pair_id, result.participant1_id))
+        elif result.votes_participant1 > result.votes_participant2:
+            winners.append((result.pair_id, result.participant1_id))
+        elif result.votes_participant2 > result.votes_participant1:
+            winners.append((result.pair_id, result.participant2_id))
         else:
             # Если голоса равны, выбираем случайно
-            pair.winner_id = random.choice([pair.participant1_id, pair.participant2_id])
-            winners.append(pair.winner_id)
+            winners.append((result.pair_id, random.choice([result.participant1_id, result.participant2_id])))
     
-    app_logger.info(f"Победители определены для {len(pairs)} пар")
+    app_logger.info(f"Победители определены для {len(results)} пар")
     return winners
 
 def generate_next_stage_pairs(
     db: Session,
     tournament: Tournament,
     winner_ids: List[int]
-) -> List[TournamentPair]:
+) -> List[int]:
     """
-    Генерация пар для следующей стадии турнира
+    Генерация пар для следующей стадии турнира одним многострочным INSERT
     """
-    pairs = []
+    participant_pairs = []
     
     for i in range(0, len(winner_ids), 2):
         participant1_id = winner_ids[i]
         # Если число победителей нечетное, последняя пара будет иметь только одного участника
         participant2_id = winner_ids[i + 1] if i + 1 < len(winner_ids) else None
-        
-        pair = TournamentPair(
-            tournament_id=tournament.tournament_id,
-            stage=tournament.current_stage,
-            participant1_id=participant1_id,
-            participant2_id=participant2_id
-        )
-        pairs.append(pair)
+        participant_pairs.append((participant1_id, participant2_id))
     
-    db.add_all(pairs)
-    db.flush()
-    app_logger.info(f"Сгенерировано {len(pairs)} пар для стадии {tournament.current_stage} турнира {tournament.tournament_id}")
-    return pairs
+    pair_ids = create_db_stage_pairs(db, tournament.tournament_id, tournament.current_stage, participant_pairs)
+    app_logger.info(f"Сгенерировано {len(pair_ids)} пар для стадии {stage_label(tournament.current_stage)} турнира {tournament.tournament_id}")
+    return pair_ids
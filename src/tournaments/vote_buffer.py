@@ -0,0 +1,319 @@
+# src/tournaments/vote_buffer.py
+import asyncio
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+from sqlalchemy.orm import Session
+
+from src.config import settings
+from src.database import SessionLocal
+from src.logger import app_logger
+from src.tournaments.db import bulk_insert_db_tournament_votes
+from src.tournaments.snapshots import bracket_snapshots, pair_vote_counts
+from src.tournaments.events import tournament_events
+
+# Буфер голосов (write-behind) для пиков голосования.
+#
+# Принятый голос не пишется в базу сразу: он кладётся в буфер с ключом
+# (pair_id, user_id), поэтому повторный голос того же пользователя за ту же пару
+# отсекается ещё до базы. Фоновый flusher в процессе API раз в
+# VOTE_BUFFER_FLUSH_INTERVAL_MS (или при накоплении VOTE_BUFFER_MAX_BATCH голосов)
+# забирает буфер целиком и вставляет его одним запросом bulk_insert_db_tournament_votes.
+# Забранная пачка удаляется из Redis только после commit вставки; пачки, оставшиеся
+# от упавшего flusher, следующий сброс вставляет повторно (ON CONFLICT DO NOTHING
+# делает повтор безопасным).
+#
+# Буфер общий для всех воркеров API и Celery и потому живёт только в Redis: без
+# REDIS_URL он отключается и голоса пишутся в базу сразу. Ключи буфера без TTL, а
+# Redis работает с maxmemory-policy volatile-lru (вытесняются только ключи с TTL —
+# кэш, снимки, состояние токенов), поэтому принятые голоса не вытесняются.
+#
+# advance_tournament_stage закрывает приём голосов за стадию (close_stage), затем
+# вызывает flush: голоса, принятые до закрытия, попадают в итоги стадии, а голос,
+# пришедший позже, получает отказ, а не молча отбрасывается при вставке. Голос
+# кладётся в буфер вместе со стадией, которую видела проверка в базе, а маркер
+# закрытия хранит номер закрытой стадии и после продвижения не снимается: голос,
+# проверенный до продвижения и добавленный после, тоже получает отказ. flush
+# во всех процессах сериализуется блокировкой в Redis, поэтому сброс стадии
+# дожидается пачки, которую в этот момент вставляет flusher API.
+
+BufferedVote = Tuple[int, str, int]
+
+# Результат add: голос уже в буфере / приём голосов турнира закрыт
+DUPLICATE = 0
+STAGE_CLOSED = -1
+
+
+class StageClosedError(Exception):
+    """Стадия турнира закрывается, голос не принят"""
+
+
+class RedisVoteStore:
+    """Буфер в Redis: хэш "pair_id:user_id" -> voted_for"""
+
+    PENDING_KEY = "vote-buffer:pending"
+    FLUSHING_PREFIX = "vote-buffer:flushing:"
+    # Множество забранных, но ещё не вставленных пачек
+    FLUSHING_SET_KEY = "vote-buffer:flushing"
+    CLOSED_PREFIX = "vote-buffer:closed:"
+    FLUSH_LOCK_KEY = "vote-buffer:flush-lock"
+    # Маркер закрытия нужен, пока могут прийти голоса, проверенные до продвижения;
+    # блокировка сброса снимается сама, если процесс упал
+    CLOSED_TTL_SECONDS = 300
+    FLUSH_LOCK_TIMEOUT_SECONDS = 60
+
+    # Проверка закрытия стадии и добавление голоса одной атомарной операцией.
+    # Номера стадий убывают к финалу: маркер N закрывает стадии N и раньше
+    ADD_SCRIPT = """
+    local closed = tonumber(redis.call('GET', KEYS[2]))
+    if closed and tonumber(ARGV[3]) >= closed then
+        return -1
+    end
+    if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+        return 0
+    end
+    return redis.call('HLEN', KEYS[1])
+    """
+
+    # Переименование буфера в пачку атомарно: каждую пачку забирает ровно один
+    # flusher, а новые голоса тем временем копятся в новом хэше. Возвращает все
+    # невставленные пачки, включая оставшиеся от упавшего flusher
+    TAKE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        redis.call('RENAME', KEYS[1], KEYS[3])
+        redis.call('SADD', KEYS[2], KEYS[3])
+    end
+    return redis.call('SMEMBERS', KEYS[2])
+    """
+
+    # Маркер только сдвигается к более поздним стадиям
+    CLOSE_SCRIPT = """
+    local closed = tonumber(redis.call('GET', KEYS[1]))
+    if closed and closed <= tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    return 1
+    """
+
+    # Открывается только стадия, закрытая последней
+    REOPEN_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url)
+        self._add = self.client.register_script(self.ADD_SCRIPT)
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+        self._close = self.client.register_script(self.CLOSE_SCRIPT)
+        self._reopen = self.client.register_script(self.REOPEN_SCRIPT)
+
+    def add(self, tournament_id: int, stage: int, pair_id: int, user_id: str, voted_for: int) -> int:
+        """Добавляет голос; возвращает размер буфера, DUPLICATE или STAGE_CLOSED"""
+        return self._add(
+            keys=[self.PENDING_KEY, f"{self.CLOSED_PREFIX}{tournament_id}"],
+            args=[f"{pair_id}:{user_id}", voted_for, stage]
+        )
+
+    def close_stage(self, tournament_id: int, stage: int) -> bool:
+        return bool(self._close(keys=[f"{self.CLOSED_PREFIX}{tournament_id}"], args=[stage, self.CLOSED_TTL_SECONDS]))
+
+    def reopen_stage(self, tournament_id: int, stage: int) -> None:
+        self._reopen(keys=[f"{self.CLOSED_PREFIX}{tournament_id}"], args=[stage])
+
+    def flush_lock(self):
+        return self.client.lock(self.FLUSH_LOCK_KEY, timeout=self.FLUSH_LOCK_TIMEOUT_SECONDS)
+
+    def take(self) -> Tuple[List[str], List[BufferedVote]]:
+        """Забирает буфер; возвращает ключи пачек (для ack) и их голоса"""
+        # Имя пачки начинается со времени, чтобы старые пачки читались первыми
+        flushing_key = f"{self.FLUSHING_PREFIX}{time.time_ns():020d}-{uuid.uuid4().hex}"
+        keys = sorted(self._take(keys=[self.PENDING_KEY, self.FLUSHING_SET_KEY, flushing_key]))
+        if not keys:
+            return [], []
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        # Голос пользователя за пару мог остаться и в старой пачке, и в новой:
+        # учитывается принятый раньше
+        items = {}
+        for batch in pipe.execute():
+            for field, voted_for in batch.items():
+                items.setdefault(field, voted_for)
+        votes = []
+        for field, voted_for in items.items():
+            pair_id, user_id = field.decode("utf-8").split(":", 1)
+            votes.append((int(pair_id), user_id, int(voted_for)))
+        return [key.decode("utf-8") for key in keys], votes
+
+    def ack(self, keys: List[str]) -> None:
+        """Удаляет пачки, вставленные в базу"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(*keys)
+        pipe.srem(self.FLUSHING_SET_KEY, *keys)
+        pipe.execute()
+
+
+class VoteBuffer:
+    """Буфер голосов с периодическим пакетным сбросом в базу"""
+
+    def __init__(self, store: Optional[RedisVoteStore], enabled: bool, flush_interval_ms: int, max_batch: int):
+        self.store = store
+        self.enabled = enabled and store is not None
+        if enabled and store is None:
+            app_logger.warning("VOTE_BUFFER_ENABLED без REDIS_URL: буфер голосов отключён, голоса пишутся в базу сразу")
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self._stats = {"flushed": 0, "dropped": 0, "rejected_closed": 0}
+        self._stats_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _count(self, counter: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[counter] += value
+
+    def add(self, tournament_id: int, stage: int, pair_id: int, user_id: str, voted_for: int) -> bool:
+        """
+        Кладёт голос за пару стадии stage в буфер; False — пользователь уже голосовал
+        за эту пару. StageClosedError — стадия закрывается или уже закрыта
+        (advance_tournament_stage).
+        """
+        size = self.store.add(tournament_id, stage, pair_id, user_id, voted_for)
+        if size == STAGE_CLOSED:
+            self._count("rejected_closed")
+            raise StageClosedError()
+        if size == DUPLICATE:
+            return False
+        if size >= self.max_batch and self._loop is not None:
+            # Пачка набрана — будим flusher, не дожидаясь интервала
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    def close_stage(self, tournament_id: int, stage: int) -> bool:
+        """
+        Закрывает приём голосов за стадию stage (и более ранние) перед её продвижением.
+        После продвижения маркер остаётся; False — буфер отключён или стадия уже закрыта.
+        """
+        if not self.enabled:
+            return False
+        return self.store.close_stage(tournament_id, stage)
+
+    def reopen_stage(self, tournament_id: int, stage: int) -> None:
+        """Снова открывает приём за стадию, если продвинуть её не удалось"""
+        if not self.enabled:
+            return
+        try:
+            self.store.reopen_stage(tournament_id, stage)
+        except redis.RedisError as exc:
+            # Ключ закрытия с TTL, приём откроется сам
+            app_logger.error(f"Ошибка открытия приёма голосов турнира {tournament_id}: {exc}")
+
+    def flush(self, db: Session) -> int:
+        """Сбрасывает буфер в базу; возвращает число вставленных голосов"""
+        if not self.enabled:
+            return 0
+        with self.store.flush_lock():
+            keys, votes = self.store.take()
+            if not keys:
+                return 0
+            try:
+                counted_pairs = bulk_insert_db_tournament_votes(db, votes)
+            except Exception:
+                db.rollback()
+                # Пачки остаются в Redis и уйдут со следующим сбросом
+                raise
+            try:
+                self.store.ack(keys)
+            except redis.RedisError as exc:
+                # Следующий сброс вставит пачки повторно, конфликт их отбросит
+                app_logger.error(f"Ошибка удаления вставленных пачек буфера голосов: {exc}")
+        inserted = sum(row.votes1 + row.votes2 for row in counted_pairs)
+        # Счётчики пар для снимков сетки и дельты для живых обновлений, по турнирам
+        pairs_by_tournament: Dict[int, list] = {}
+        for row in counted_pairs:
+            pairs_by_tournament.setdefault(row.tournament_id, []).append(row)
+        for tournament_id, rows in pairs_by_tournament.items():
+            deltas = {}
+            for row in rows:
+                if row.votes1:
+                    deltas[f"{row.pair_id}:{row.participant1_id}"] = row.votes1
+                if row.votes2:
+                    deltas[f"{row.pair_id}:{row.participant2_id}"] = row.votes2
+            bracket_snapshots.set_vote_counts(tournament_id, pair_vote_counts(rows))
+            tournament_events.publish_votes(tournament_id, deltas)
+        dropped = len(votes) - inserted
+        self._count("flushed", inserted)
+        if dropped:
+            # Закрытие стадии (close_stage) не даёт сюда попасть голосам за закрытую
+            # стадию; ненулевое значение означает дубли с базой (в том числе повторную
+            # вставку пачки после сбоя) или сбой этой защиты
+            self._count("dropped", dropped)
+            app_logger.warning(f"Буфер голосов: отброшено {dropped} голосов (дубли или закрытая стадия)")
+        return inserted
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики буфера по текущему процессу"""
+        with self._stats_lock:
+            return {"enabled": self.enabled, **self._stats}
+
+    def _flush_with_session(self) -> int:
+        db = SessionLocal()
+        try:
+            return self.flush(db)
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self._flush_with_session)
+            except Exception as exc:
+                app_logger.error(f"Ошибка сброса буфера голосов: {exc}")
+
+    def start(self) -> None:
+        """Запускает фоновый flusher в текущем event loop (при старте приложения)"""
+        if not self.enabled or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает flusher и сбрасывает остаток буфера"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._loop = None
+        await asyncio.to_thread(self._flush_with_session)
+
+
+def _create_store() -> Optional[RedisVoteStore]:
+    if settings.REDIS_URL:
+        return RedisVoteStore(settings.REDIS_URL)
+    return None
+
+
+vote_buffer = VoteBuffer(
+    _create_store(),
+    settings.VOTE_BUFFER_ENABLED,
+    settings.VOTE_BUFFER_FLUSH_INTERVAL_MS,
+    settings.VOTE_BUFFER_MAX_BATCH
+)
@@ -0,0 +1,74 @@
+# src/users/cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.config import settings
+from src.users.models import User
+
+# Кэш пользователей (principal) для get_current_user: ограниченный LRU с TTL
+# в памяти процесса, ключ — user_id.
+#
+# Хранятся значения колонок (без хеша пароля), на каждый запрос из них строится
+# новый объект User вне сессии, поэтому запросы не делят изменяемое состояние.
+# Функции записи в users/db.py вызывают invalidate(user_id) после commit.
+# Другие процессы узнают об изменении не позже PRINCIPAL_CACHE_TTL_SECONDS, а отзыв
+# токенов и блокировка проверяются по общему token_states, поэтому запись с
+# устаревшими token_version/is_active перечитывается из базы сразу.
+
+CACHED_COLUMNS = (
+    "user_id", "username", "email", "is_active", "role",
+    "created_at", "last_login_at", "login_attempts", "token_version",
+)
+
+
+class PrincipalCache:
+    """LRU пользователей с TTL и счётчиками попаданий"""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, user_id: str) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[user_id]
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self._stats["hits"] += 1
+            values = entry[1]
+        return User(**values)
+
+    def set(self, user: User) -> None:
+        values = {column: getattr(user, column) for column in CACHED_COLUMNS}
+        with self._lock:
+            self._entries[user.user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user.user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, user_id: str) -> None:
+        """Удаляет пользователя из кэша (вызывать после commit)"""
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_MAX_ENTRIES, settings.PRINCIPAL_CACHE_TTL_SECONDS)
@@ -5,11 +5,14 @@ from sqlalchemy.exc import IntegrityError
 from psycopg2.errors import UniqueViolation
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional
-from sqlalchemy import update
+import uuid
+from sqlalchemy import update, insert, delete, select, literal, false, or_, func
 
 from src.users.models import User, RefreshToken, EmailVerification
 from src.users.schemas import UserCreate, UserUpdate
-from src.users.utils import get_password_hash, verify_password, generate_verification_code
+from src.users.utils import get_password_hash, verify_password, generate_verification_code, hash_refresh_token
+from src.users.token_state import token_states
+from src.users.cache import principal_cache
 from src.logger import app_logger, log_db_operation
 from src.config import settings
 
@@ -93,7 +96,11 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
             # Можно добавить блокировку пользователя после определенного числа попыток
             if user.login_attempts >= 5:
                 user.is_active = False
+                # Выданные access токены перестают действовать
+                user.token_version = User.token_version + 1
                 db.commit()
+                token_states.invalidate(user.user_id)
+                principal_cache.invalidate(user.user_id)
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="Учетная запись заблокирована из-за превышения количества попыток входа"
@@ -104,6 +111,7 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     user.login_attempts = 0
     user.last_login_at = datetime.now(timezone.utc)
     db.commit()
+    principal_cache.invalidate(user.user_id)
     return user
 
 @log_db_operation
@@ -134,14 +142,19 @@ def update_user(db: Session, user_id: str, user_update: UserUpdate) -> User:
                 detail="Пользователь с таким именем уже существует"
             )
     
-    # Если обновляется пароль, хешируем его
-    if 'password' in update_data:
+    # Если обновляется пароль, хешируем его и отзываем выданные access токены
+    password_changed = 'password' in update_data
+    if password_changed:
         update_data['hashed_password'] = get_password_hash(update_data.pop('password'))
+        update_data['token_version'] = User.token_version + 1
     try:
         # Обновляем все поля
         for key, value in update_data.items():
             setattr(db_user, key, value)
         db.commit()
+        if password_changed:
+            token_states.invalidate(user_id)
+        principal_cache.invalidate(user_id)
         db.refresh(db_user)
         return db_user
     except IntegrityError as e:
@@ -156,7 +169,7 @@ def update_user(db: Session, user_id: str, user_update: UserUpdate) -> User:
 @log_db_operation
 def revoke_refresh_token(db: Session, token: str) -> bool:
     """Аннулировать refresh токен"""
-    db_token = db.query(RefreshToken).filter(RefreshToken.token == token).first()
+    db_token = db.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(token)).first()
     if not db_token:
         return False
     db_token.revoked = True
@@ -165,12 +178,73 @@ def revoke_refresh_token(db: Session, token: str) -> bool:
 
 @log_db_operation
 def revoke_all_user_refresh_tokens(db: Session, user_id: str) -> None:
-    """Аннулировать все refresh токены пользователя"""
+    """Аннулировать все refresh токены пользователя и выданные access токены"""
     result = db.query(RefreshToken).filter(
         RefreshToken.user_id == user_id,
         RefreshToken.revoked == False
     ).update({"revoked": True})
+    db.query(User).filter(User.user_id == user_id).update(
+        {"token_version": User.token_version + 1}, synchronize_session=False
+    )
     db.commit()
+    token_states.invalidate(user_id)
+    principal_cache.invalidate(user_id)
+
+@log_db_operation
+def rotate_refresh_token(db: Session, token: str, new_token: str, new_expires_at: datetime) -> Optional[str]:
+    """
+    Ротация refresh токена одним запросом: действующий старый токен аннулируется,
+    новый вставляется для того же пользователя. Возвращает user_id или None, если
+    старый токен не найден, отозван или истёк (в том числе уже ротирован
+    параллельным запросом). Commit делает вызывающая сторона.
+    """
+    revoked = (
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == hash_refresh_token(token),
+            RefreshToken.revoked == False,
+            RefreshToken.expires_at > func.now()
+        )
+        .values(revoked=True)
+        .returning(RefreshToken.user_id)
+        .cte("revoked")
+    )
+    inserted = (
+        insert(RefreshToken)
+        .from_select(
+            ["id", "token_hash", "user_id", "expires_at", "revoked"],
+            select(
+                literal(str(uuid.uuid4())),
+                literal(hash_refresh_token(new_token)),
+                revoked.c.user_id,
+                literal(new_expires_at, RefreshToken.expires_at.type),
+                false()
+            )
+        )
+        .returning(RefreshToken.user_id)
+    )
+    return db.execute(inserted).scalar()
+
+@log_db_operation
+def delete_stale_refresh_tokens(db: Session, batch_size: int) -> int:
+    """
+    Удаляет истёкшие и аннулированные refresh токены пачками по batch_size строк,
+    с commit после каждой пачки, чтобы не держать долгих блокировок.
+    Возвращает количество удалённых строк.
+    """
+    stale_ids = (
+        select(RefreshToken.id)
+        .where(or_(RefreshToken.revoked == True, RefreshToken.expires_at < func.now()))
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    deleted = 0
+    while True:
+        result = db.execute(delete(RefreshToken).where(RefreshToken.id.in_(stale_ids)))
+        db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
 
 # Email Verification functions
 
@@ -327,6 +401,7 @@ def complete_registration_from_verification(db: Session, email: str) -> User:
         
         db.commit()
         db.refresh(new_user)
+        principal_cache.invalidate(new_user.user_id)
         return new_user
         
     except IntegrityError as e:
@@ -0,0 +1,46 @@
+# src/users/hashing.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from fastapi import HTTPException, status
+
+from src.config import settings
+from src.logger import app_logger
+
+# Отдельный пул потоков для bcrypt (хеширование и проверка паролей).
+#
+# bcrypt занимает процессор на сотни миллисекунд и отпускает GIL, поэтому потоков
+# достаточно, процессы не нужны. Пул держит PASSWORD_HASH_WORKERS потоков, а
+# операций в работе и в очереди — не больше PASSWORD_HASH_MAX_PENDING; сверх
+# этого запрос сразу получает 503 с Retry-After, а не копит очередь. Лимит
+# должен быть заметно меньше пула потоков FastAPI (40), иначе вызывающие потоки,
+# ждущие bcrypt, займут его целиком и остановят остальные синхронные обработчики.
+
+T = TypeVar("T")
+
+
+class PasswordHashPool:
+    """Ограниченный пул для операций bcrypt с отказом при перегрузке"""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def run(self, func: Callable[..., T], *args) -> T:
+        """Выполняет func в пуле и ждёт результат; 503, если очередь заполнена"""
+        if not self._slots.acquire(blocking=False):
+            app_logger.warning(f"Пул хеширования паролей перегружен ({self.max_pending} операций в очереди)")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Сервер перегружен, повторите попытку позже",
+                headers={"Retry-After": "1"}
+            )
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+
+password_hash_pool = PasswordHashPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
@@ -22,6 +22,8 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), default=func.now())
     last_login_at = Column(DateTime(timezone=True), nullable=True)
     login_attempts = Column(Integer, default=0)
+    # Версия выданных access токенов: увеличивается, когда они должны перестать действовать
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Связь с голосами в турнирах
     tournament_votes = relationship("TournamentVote", back_populates="user")
@@ -32,7 +34,8 @@ class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()), index=True)
-    token = Column(String, nullable=False, unique=True, index=True)
+    # SHA-256 (hex) токена: сам refresh токен в базе не хранится
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
     user_id = Column(String(36), ForeignKey("users.user_id"), nullable=False)
     expires_at = Column(DateTime(timezone=True), nullable=False)
     created_at = Column(DateTime(timezone=True), default=func.now())
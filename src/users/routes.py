@@ -8,10 +8,10 @@ from typing import List
 from src.users.schemas import UserCreate, UserResponse, UserUpdate, Token, EmailVerificationRequest, ResendVerificationCodeRequest
 from src.users.db import (
     create_user, authenticate_user, update_user, get_user_by_id, get_users, 
-    revoke_refresh_token, revoke_all_user_refresh_tokens,
+    revoke_refresh_token, revoke_all_user_refresh_tokens, rotate_refresh_token,
     create_email_verification, verify_email_code, complete_registration_from_verification, resend_verification_code
 )
-from src.users.utils import create_access_token, create_refresh_token, verify_refresh_token, get_current_active_user, get_admin_user
+from src.users.utils import access_token_claims, create_access_token, create_refresh_token, generate_refresh_token, verify_refresh_token, get_current_active_user, get_admin_user
 from src.users.models import User
 from src.database import get_db
 from src.config import settings
@@ -30,7 +30,7 @@ router = APIRouter(
     summary="Завершить регистрацию после подтверждения email",
     description="Создание учетной записи пользователя после подтверждения email"
 )
-async def register(email_data: EmailVerificationRequest, db: Session = Depends(get_db)):
+def register(email_data: EmailVerificationRequest, db: Session = Depends(get_db)):
     """Завершение регистрации после подтверждения email"""
     
     try:
@@ -58,7 +58,7 @@ async def register(email_data: EmailVerificationRequest, db: Session = Depends(g
     summary="Вход в систему",
     description="Получение токена доступа и refresh токена для аутентифицированного пользователя"
 )
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Аутентификация пользователя и получение токенов"""
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
@@ -73,7 +73,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     app_logger.info(f"User logged in: {user.username}")
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.user_id, "username": user.username, "role": user.role},
+        data=access_token_claims(user),
         expires_delta=access_token_expires
     )
     
@@ -93,31 +93,39 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     summary="Обновление access токена",
     description="Получение нового access токена с использованием refresh токена"
 )
-async def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
+def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
     """Обновление access токена с помощью refresh токена"""
-    db_token = verify_refresh_token(db, refresh_token)
+    # Ротация: старый токен аннулируется и новый создаётся одним запросом, в одной транзакции
+    new_refresh_token, new_refresh_expires_at = generate_refresh_token()
+    user_id = rotate_refresh_token(db, refresh_token, new_refresh_token, new_refresh_expires_at)
+    if user_id is None:
+        db.rollback()
+        # Токен не подошёл: verify_refresh_token объясняет причину
+        verify_refresh_token(db, refresh_token)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Недействительный refresh токен",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
-    user = get_user_by_id(db, user_id=db_token.user_id)
+    user = get_user_by_id(db, user_id=user_id)
     if not user or not user.is_active:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Недействительный пользователь",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    db.commit()
+    
     # Создание нового access токена
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.user_id, "username": user.username, "role": user.role},
+        data=access_token_claims(user),
         expires_delta=access_token_expires
     )
     
-    # Создание нового refresh токена (ротация)
-    new_refresh_token, new_refresh_expires_at = create_refresh_token(db, user.user_id)
-    
-    # Аннулируем старый refresh токен
-    revoke_refresh_token(db, refresh_token)
-    
     return {
         "access_token": access_token,
         "refresh_token": new_refresh_token,
@@ -131,7 +139,7 @@ async def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
     summary="Выход из системы",
     description="Аннулирование refresh токена пользователя"
 )
-async def logout(
+def logout(
     refresh_token: str,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -151,7 +159,7 @@ async def logout(
     summary="Выход из системы на всех устройствах",
     description="Аннулирование всех refresh токенов пользователя"
 )
-async def logout_all(
+def logout_all(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -166,7 +174,7 @@ async def logout_all(
     summary="Получить информацию о текущем пользователе",
     description="Возвращает информацию о текущем аутентифицированном пользователе"
 )
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
+def read_users_me(current_user: User = Depends(get_current_active_user)):
     """Получить информацию о текущем пользователе"""
     return current_user
 
@@ -176,7 +184,7 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
     summary="Обновить информацию о текущем пользователе",
     description="Обновление информации об аутентифицированном пользователе"
 )
-async def update_user_me(
+def update_user_me(
     user_update: UserUpdate, 
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -197,7 +205,7 @@ async def update_user_me(
     summary="Получить список всех пользователей",
     description="Возвращает список всех пользователей (только для администраторов)"
 )
-async def read_users(
+def read_users(
     skip: int = 0, 
     limit: int = 100, 
     current_user: User = Depends(get_admin_user),
@@ -213,7 +221,7 @@ async def read_users(
     summary="Получить информацию о пользователе по ID",
     description="Возвращает информацию о пользователе по ID (только для администраторов)"
 )
-async def read_user(
+def read_user(
     user_id: str, 
     current_user: User = Depends(get_admin_user),
     db: Session = Depends(get_db)
@@ -234,7 +242,7 @@ async def read_user(
     summary="Запросить код подтверждения email для регистрации",
     description="Сохраняет данные пользователя и отправляет код подтверждения на email"
 )
-async def request_email_verification(user_data: UserCreate, db: Session = Depends(get_db)):
+def request_email_verification(user_data: UserCreate, db: Session = Depends(get_db)):
     """Запрос кода подтверждения email с сохранением данных пользователя"""
     
     try:
@@ -262,7 +270,7 @@ async def request_email_verification(user_data: UserCreate, db: Session = Depend
     summary="Подтвердить код верификации email",
     description="Проверяет код подтверждения и помечает email как верифицированный"
 )
-async def verify_email_code_endpoint(data: EmailVerificationRequest, db: Session = Depends(get_db)):
+def verify_email_code_endpoint(data: EmailVerificationRequest, db: Session = Depends(get_db)):
     """Проверка кода подтверждения email"""
     
     try:
@@ -282,7 +290,7 @@ async def verify_email_code_endpoint(data: EmailVerificationRequest, db: Session
     summary="Повторная отправка кода подтверждения email",
     description="Отправляет новый код подтверждения на email (требует только email)"
 )
-async def resend_verification_code_endpoint(data: ResendVerificationCodeRequest, db: Session = Depends(get_db)):
+def resend_verification_code_endpoint(data: ResendVerificationCodeRequest, db: Session = Depends(get_db)):
     """Повторная отправка кода подтверждения email"""
     
     try:
@@ -37,6 +37,8 @@ class TokenData(BaseModel):
     user_id: str
     username: Optional[str] = None
     role: Optional[str] = None
+    token_version: int = 0
+    is_active: bool = True
     exp: Optional[datetime] = None
 
 class UserUpdate(BaseModel):
@@ -0,0 +1,21 @@
+# src/users/tasks.py
+from src.database import SessionLocal
+from src.users.db import delete_stale_refresh_tokens
+from src.config import settings
+from src.logger import app_logger
+from src.celery_app import celery_app
+
+@celery_app.task(name='src.users.tasks.prune_refresh_tokens')
+def prune_refresh_tokens():
+    """
+    Задача для удаления истёкших и аннулированных refresh токенов,
+    чтобы таблица refresh_tokens не росла дальше числа активных сессий.
+    """
+    app_logger.info("Старт фоновой задачи: очистка refresh токенов")
+    db = SessionLocal()
+    try:
+        deleted = delete_stale_refresh_tokens(db, settings.REFRESH_TOKEN_PRUNE_BATCH_SIZE)
+        app_logger.info(f"Удалено refresh токенов: {deleted}")
+    finally:
+        db.close()
+        app_logger.info("Фоновая задача завершена: очистка refresh токенов")
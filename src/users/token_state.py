@@ -0,0 +1,117 @@
+# src/users/token_state.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import redis
+
+from src.config import settings
+from src.logger import app_logger
+
+# Состояние пользователей для проверки access токенов без запроса к базе.
+#
+# Access токен несёт claims sub, role и ver — users.token_version на момент выдачи.
+# Токен действителен, пока пользователь активен и его token_version равен ver.
+# Всё, после чего выданные токены должны перестать действовать (блокировка,
+# смена пароля, выход на всех устройствах), увеличивает token_version в базе и
+# вызывает token_states.invalidate(user_id).
+#
+# Здесь кэшируется пара (token_version, is_active) по user_id: в Redis (общий для
+# всех процессов, инвалидация видна сразу) или в LRU памяти процесса, где чужая
+# инвалидация становится видна не позже AUTH_STATE_TTL_SECONDS. База читается
+# только при промахе.
+
+TokenState = Tuple[int, bool]
+
+
+class MemoryTokenStateStore:
+    """LRU с TTL в памяти процесса"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, TokenState]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[TokenState]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, state = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return state
+
+    def set(self, user_id: str, state: TokenState, ttl: int) -> None:
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + ttl, state)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+class RedisTokenStateStore:
+    """Состояние в Redis: строка "token_version:is_active" по user_id"""
+
+    KEY_PREFIX = "user-token-state:"
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, user_id: str) -> Optional[TokenState]:
+        value = self.client.get(self.KEY_PREFIX + user_id)
+        if value is None:
+            return None
+        version, active = value.decode("utf-8").split(":")
+        return int(version), active == "1"
+
+    def set(self, user_id: str, state: TokenState, ttl: int) -> None:
+        version, active = state
+        self.client.set(self.KEY_PREFIX + user_id, f"{version}:{int(active)}", ex=ttl)
+
+    def delete(self, user_id: str) -> None:
+        self.client.delete(self.KEY_PREFIX + user_id)
+
+
+class TokenStates:
+    """Кэш состояния токенов; при ошибках Redis проверка идёт через базу"""
+
+    def __init__(self, store, ttl: int):
+        self.store = store
+        self.ttl = ttl
+
+    def get(self, user_id: str) -> Optional[TokenState]:
+        try:
+            return self.store.get(user_id)
+        except redis.RedisError as exc:
+            app_logger.warning(f"Ошибка чтения состояния токенов пользователя {user_id}: {exc}")
+            return None
+
+    def set(self, user_id: str, state: TokenState) -> None:
+        try:
+            self.store.set(user_id, state, self.ttl)
+        except redis.RedisError as exc:
+            app_logger.warning(f"Ошибка записи состояния токенов пользователя {user_id}: {exc}")
+
+    def invalidate(self, user_id: str) -> None:
+        """Сбрасывает состояние пользователя (вызывать после commit)"""
+        try:
+            self.store.delete(user_id)
+        except redis.RedisError as exc:
+            app_logger.error(f"Ошибка инвалидации состояния токенов пользователя {user_id}: {exc}")
+
+
+def _create_store():
+    if settings.REDIS_URL:
+        return RedisTokenStateStore(settings.REDIS_URL)
+    return MemoryTokenStateStore(settings.AUTH_STATE_MAX_ENTRIES)
+
+
+token_states = TokenStates(_create_store(), settings.AUTH_STATE_TTL_SECONDS)
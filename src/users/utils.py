@@ -3,6 +3,7 @@ from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any
 from jose import JWTError, jwt
 import uuid
+import hashlib
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
@@ -13,6 +14,10 @@ import string
 from src.config import settings
 from src.database import get_db
 from src.users.models import User, RefreshToken
+from src.users.schemas import TokenData
+from src.users.token_state import TokenState, token_states
+from src.users.cache import principal_cache
+from src.users.hashing import password_hash_pool
 from src.logger import app_logger
 
 # Настройка для хеширования паролей
@@ -22,12 +27,16 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверка пароля"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Проверка пароля (в пуле bcrypt)"""
+    return password_hash_pool.run(pwd_context.verify, plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    """Хеширование пароля"""
-    return pwd_context.hash(password)
+    """Хеширование пароля (в пуле bcrypt)"""
+    return password_hash_pool.run(pwd_context.hash, password)
+
+def access_token_claims(user: User) -> Dict[str, Any]:
+    """Claims access токена: ver — версия токенов пользователя на момент выдачи"""
+    return {"sub": user.user_id, "username": user.username, "role": user.role, "ver": user.token_version}
 
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     """Создание access токена"""
@@ -47,13 +56,22 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
         app_logger.error(f"Ошибка при создании access токена: {e}")
         raise
 
-def create_refresh_token(db: Session, user_id: str) -> tuple[str, datetime]:
-    """Создание refresh токена и сохранение его в базе данных"""
+def hash_refresh_token(token: str) -> str:
+    """SHA-256 refresh токена (в базе хранится только он)"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def generate_refresh_token() -> tuple[str, datetime]:
+    """Новый refresh токен и срок его действия (без сохранения)"""
     token = str(uuid.uuid4())
     expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    return token, expires_at
+
+def create_refresh_token(db: Session, user_id: str) -> tuple[str, datetime]:
+    """Создание refresh токена и сохранение его хеша в базе данных"""
+    token, expires_at = generate_refresh_token()
     
     db_token = RefreshToken(
-        token=token,
+        token_hash=hash_refresh_token(token),
         user_id=user_id,
         expires_at=expires_at
     )
@@ -65,9 +83,10 @@ def create_refresh_token(db: Session, user_id: str) -> tuple[str, datetime]:
 
 def verify_refresh_token(db: Session, token: str) -> RefreshToken:
     """Проверка refresh токена"""
-    db_token = db.query(RefreshToken).filter(RefreshToken.token == token).first()
+    token_hash = hash_refresh_token(token)
+    db_token = db.query(RefreshToken).filter(RefreshToken.token_hash == token_hash).first()
     if not db_token:
-        app_logger.warning(f"Попытка использовать несуществующий refresh токен: {token}")
+        app_logger.warning(f"Попытка использовать несуществующий refresh токен: {token_hash[:12]}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Недействительный refresh токен",
@@ -75,7 +94,7 @@ def verify_refresh_token(db: Session, token: str) -> RefreshToken:
         )
     
     if db_token.revoked:
-        app_logger.warning(f"Попытка использовать отозванный refresh токен: {token}")
+        app_logger.warning(f"Попытка использовать отозванный refresh токен: {token_hash[:12]}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Refresh токен был аннулирован",
@@ -83,7 +102,7 @@ def verify_refresh_token(db: Session, token: str) -> RefreshToken:
         )
     
     if db_token.expires_at < datetime.now(timezone.utc):
-        app_logger.info(f"Попытка использовать истекший refresh токен: {token}")
+        app_logger.info(f"Попытка использовать истекший refresh токен: {token_hash[:12]}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Срок действия refresh токена истёк",
@@ -92,33 +111,116 @@ def verify_refresh_token(db: Session, token: str) -> RefreshToken:
     
     return db_token
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    """Получение текущего пользователя по access токену"""
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Не удалось проверить учетные данные",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def decode_access_token(token: str) -> TokenData:
+    """Декодирование access токена в claims"""
     try:
-        # Декодирование токена
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        
-        if user_id is None:
-            app_logger.warning("Access токен не содержит user_id (sub)")
-            raise credentials_exception
     except JWTError as e:
         app_logger.warning(f"Ошибка декодирования access токена: {e}")
-        raise credentials_exception
+        raise _credentials_exception()
+    
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        app_logger.warning("Access токен не содержит user_id (sub)")
+        raise _credentials_exception()
+    # Токены, выданные до появления ver, соответствуют начальной версии 0
+    return TokenData(
+        user_id=user_id,
+        username=payload.get("username"),
+        role=payload.get("role"),
+        token_version=payload.get("ver", 0)
+    )
+
+def get_user_token_state(db: Session, user_id: str) -> Optional[TokenState]:
+    """(token_version, is_active) пользователя: из кэша, при промахе — из базы"""
+    state = token_states.get(user_id)
+    if state is not None:
+        return state
+    row = db.query(User.token_version, User.is_active).filter(User.user_id == user_id).first()
+    if row is None:
+        return None
+    state = (row.token_version, bool(row.is_active))
+    token_states.set(user_id, state)
+    return state
+
+def _load_current_user(db: Session, token_data: TokenData) -> User:
+    """Пользователь из кэша principal_cache; база — при промахе или устаревшей записи"""
+    if not settings.AUTH_TRUST_TOKEN_CLAIMS:
+        return db.query(User).filter(User.user_id == token_data.user_id).first()
     
-    user = db.query(User).filter(User.user_id == user_id).first()
+    state = get_user_token_state(db, token_data.user_id)
+    if state is None:
+        return None
+    user = principal_cache.get(token_data.user_id)
+    if user is not None and (user.token_version, bool(user.is_active)) == state:
+        return user
+    user = db.query(User).filter(User.user_id == token_data.user_id).first()
+    if user is not None:
+        principal_cache.set(user)
+    return user
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    """
+    Получение текущего пользователя по access токену.
+    Пользователь берётся из кэша процесса; для изменения его нужно перечитать через db.py.
+    """
+    token_data = decode_access_token(token)
+    
+    user = _load_current_user(db, token_data)
     if user is None:
-        app_logger.warning(f"Пользователь с id {user_id} не найден по access токену")
-        raise credentials_exception
+        app_logger.warning(f"Пользователь с id {token_data.user_id} не найден по access токену")
+        raise _credentials_exception()
+    if user.token_version != token_data.token_version:
+        app_logger.warning(f"Access токен пользователя {user.user_id} отозван (версия {token_data.token_version})")
+        raise _credentials_exception()
     
     return user
 
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> TokenData:
+    """
+    Текущий пользователь по claims access токена, без чтения строки пользователя.
+    Отзыв проверяется по кэшу состояния токенов, база читается только при промахе.
+    С AUTH_TRUST_TOKEN_CLAIMS=False пользователь читается из базы на каждый запрос.
+    """
+    if not settings.AUTH_TRUST_TOKEN_CLAIMS:
+        user = get_current_user(token, db)
+        return TokenData(
+            user_id=user.user_id,
+            username=user.username,
+            role=user.role,
+            token_version=user.token_version,
+            is_active=bool(user.is_active)
+        )
+    
+    token_data = decode_access_token(token)
+    state = get_user_token_state(db, token_data.user_id)
+    if state is None:
+        app_logger.warning(f"Пользователь с id {token_data.user_id} не найден по access токену")
+        raise _credentials_exception()
+    
+    token_version, is_active = state
+    if token_version != token_data.token_version:
+        app_logger.warning(f"Access токен пользователя {token_data.user_id} отозван (версия {token_data.token_version})")
+        raise _credentials_exception()
+    token_data.is_active = is_active
+    return token_data
+
+def get_current_active_principal(principal: TokenData = Depends(get_current_principal)) -> TokenData:
+    """Проверка, что пользователь из claims токена активен"""
+    if not principal.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Неактивный пользователь"
+        )
+    return principal
+
 def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """Проверка, что текущий пользователь активен"""
     if not current_user.is_active:
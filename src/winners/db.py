@@ -1,12 +1,13 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, case
 from datetime import datetime
 from typing import List, Optional, Tuple
 
 from src.winners.models import TournamentWinner
-from src.tournaments.models import Tournament, TournamentParticipant, TournamentVote
+from src.tournaments.models import Tournament, TournamentParticipant, TournamentPair, TournamentVote
 from src.tournaments.db import get_db_tournament
 from src.logger import log_db_operation
+from src.cache import response_cache
 
 @log_db_operation
 def get_db_tournament_winner(db: Session, tournament_id: int) -> Optional[TournamentWinner]:
@@ -77,6 +78,7 @@ def create_db_tournament_winner(
     db.add(winner)
     db.commit()
     db.refresh(winner)
+    response_cache.invalidate("winners")
     return winner
 
 @log_db_operation
@@ -106,6 +108,7 @@ def update_db_tournament_winner(
     
     db.commit()
     db.refresh(winner)
+    response_cache.invalidate("winners")
     return winner
 
 @log_db_operation
@@ -117,6 +120,7 @@ def delete_db_tournament_winner(db: Session, winner_id: int) -> bool:
     
     db.delete(winner)
     db.commit()
+    response_cache.invalidate("winners")
     return True
 
 @log_db_operation
@@ -135,10 +139,16 @@ def get_participant_details(db: Session, participant_id: int) -> Tuple[Optional[
 
 @log_db_operation
 def count_participant_votes(db: Session, participant_id: int) -> int:
-    """Подсчитывает общее количество голосов за участника"""
-    return db.query(TournamentVote).filter(
-        TournamentVote.voted_for == participant_id
-    ).count()
+    """Подсчитывает общее количество голосов за участника по счётчикам пар всех стадий"""
+    total = db.query(
+        func.sum(
+            case((TournamentPair.participant1_id == participant_id, TournamentPair.votes_participant1), else_=0)
+            + case((TournamentPair.participant2_id == participant_id, TournamentPair.votes_participant2), else_=0)
+        )
+    ).filter(
+        or_(TournamentPair.participant1_id == participant_id, TournamentPair.participant2_id == participant_id)
+    ).scalar()
+    return total or 0
 
 @log_db_operation
 def check_tournament_type(db: Session, tournament_id: int, expected_type: str) -> bool:
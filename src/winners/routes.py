@@ -23,6 +23,7 @@ from src.winners.services import (
 from src.users.utils import get_current_user, get_admin_user
 from src.users.models import User
 from src.logger import app_logger
+from src.cache import response_cache
 
 router = APIRouter(
     prefix="/tournament-winners",
@@ -44,9 +45,17 @@ def list_tournament_winners(
     - **limit**: Максимальное количество записей (для пагинации)
     - **type**: Фильтр по типу турнира ('sets' или 'minifigures')
     """
+    cache_key = response_cache.make_key("winners:list", {"skip": skip, "limit": limit, "type": type})
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        app_logger.info(f"Получено {len(cached['winners'])} победителей турниров из кэша (skip={skip}, limit={limit}, type={type})")
+        return cached
+
     result = get_tournament_winners(db, skip, limit, type)
+    payload = TournamentWinnerListResponse.model_validate(result, from_attributes=True).model_dump(mode="json")
+    response_cache.set(cache_key, payload, tags=["winners"])
     app_logger.info(f"Получено {len(result['winners'])} победителей турниров (skip={skip}, limit={limit}, type={type})")
-    return result
+    return payload
 
 @router.get("/tournament/{tournament_id}", response_model=TournamentWinnerResponse)
 def get_winner_of_tournament(
@@ -58,9 +67,17 @@ def get_winner_of_tournament(
     
     - **tournament_id**: ID турнира
     """
+    cache_key = response_cache.make_key("winners:one", {"tournament_id": tournament_id})
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        app_logger.info(f"Получен победитель турнира ID: {tournament_id} из кэша")
+        return cached
+
     winner = get_tournament_winner(db, tournament_id)
+    payload = TournamentWinnerResponse.model_validate(winner, from_attributes=True).model_dump(mode="json")
+    response_cache.set(cache_key, payload, tags=["winners"])
     app_logger.info(f"Получен победитель турнира ID: {tournament_id}")
-    return winner
+    return payload
 
 @router.post("/tournament/{tournament_id}", response_model=TournamentWinnerResponse, status_code=status.HTTP_201_CREATED)
 def add_tournament_winner(
@@ -18,6 +18,7 @@ from src.winners.db import (
     check_tournament_type
 )
 from src.tournaments.db import get_db_tournament
+from src.tournaments.stages import COMPLETED_STAGE
 
 def get_tournament_winners(
     db: Session, 
@@ -63,7 +64,7 @@ def create_tournament_winner_from_participant(
         )
     
     # Проверяем, что турнир завершен
-    if tournament.current_stage != "completed":
+    if tournament.current_stage != COMPLETED_STAGE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нельзя назначить победителя для незавершенного турнира"
@@ -115,7 +116,7 @@ def create_tournament_winner(
         )
     
     # Проверяем, что турнир завершен
-    if tournament.current_stage != "completed":
+    if tournament.current_stage != COMPLETED_STAGE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нельзя назначить победителя для незавершенного турнира"